@@ -0,0 +1,62 @@
+import sys
+import os
+import time
+
+# Add the root directory to Python path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(current_dir)
+sys.path.append(root_dir)
+
+from benchmarks.mock_tuya_server import start_mock_server, unlimited_rate_limiter
+from tuya.tuya_client import TuyaClient
+from utils.store_device_data import get_current_status, get_current_statuses
+
+FLEET_SIZES = [10, 50, 100, 200, 500]
+LATENCY = 0.02  # Simulated server latency per request (seconds)
+
+
+def sweep_per_device(client, device_ids):
+    for device_id in device_ids:
+        get_current_status(client, device_id)
+
+
+def sweep_batched(client, device_ids):
+    get_current_statuses(client, device_ids)
+
+
+def measure(state, client, sweep, device_ids):
+    state.reset_counters()
+    start = time.perf_counter()
+    sweep(client, device_ids)
+    return state.request_count, time.perf_counter() - start
+
+
+def run_benchmark(fleet_sizes=FLEET_SIZES, latency=LATENCY):
+    server, state = start_mock_server(num_devices=max(fleet_sizes), latency=latency)
+    try:
+        client = TuyaClient(
+            endpoint=f"http://127.0.0.1:{server.server_port}",
+            access_id='mock-access-id',
+            access_secret='mock-access-secret',
+            rate_limiter=unlimited_rate_limiter(),
+        )
+        client.initialize_token()
+
+        print(f"Simulated API latency: {latency * 1000:.0f} ms/request")
+        print("-" * 80)
+        print(f"{'Devices':<10} {'Per-device reqs':<17} {'Per-device sweep':<18} "
+              f"{'Batched reqs':<14} {'Batched sweep':<14}")
+        print("-" * 80)
+
+        for size in fleet_sizes:
+            device_ids = state.device_ids[:size]
+            single_reqs, single_time = measure(state, client, sweep_per_device, device_ids)
+            batch_reqs, batch_time = measure(state, client, sweep_batched, device_ids)
+            print(f"{size:<10} {single_reqs:<17} {single_time:<18.3f} "
+                  f"{batch_reqs:<14} {batch_time:<14.3f}")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,94 @@
+import sys
+import os
+import time
+import logging
+
+# Add the root directory to Python path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(current_dir)
+sys.path.append(root_dir)
+
+from benchmarks.mock_tuya_server import start_mock_server, unlimited_rate_limiter
+from tuya.tuya_client import TuyaClient
+from tuya.rate_limit import RateLimiter
+
+DEVICES = 200  # A floor of plugs switched off at night
+LATENCY = 0.1
+ERROR_RATE = 0.05  # Commands answered with a transient 503
+TURN_OFF = [{'code': 'switch_1', 'value': False}]
+
+
+def make_client(endpoint, limiter):
+    client = TuyaClient(endpoint=endpoint, access_id='mock-access-id',
+                        access_secret='mock-access-secret', pool_size=20, rate_limiter=limiter)
+    client.retry_backoff = 0.05
+    client.initialize_token()
+    return client
+
+
+def count_off(state):
+    return sum(
+        1 for device in state.devices.values()
+        if not next(item['value'] for item in device['status'] if item['code'] == 'switch_1')
+    )
+
+
+def reset_devices(state):
+    with state.lock:
+        for device in state.devices.values():
+            for item in device['status']:
+                if item['code'] == 'switch_1':
+                    item['value'] = True
+    state.reset_counters()
+
+
+def run_sequential(endpoint, state):
+    """The previous approach: one blocking control_device call per device, no retries"""
+    client = make_client(endpoint, unlimited_rate_limiter())
+    reset_devices(state)
+    start = time.perf_counter()
+    failed = 0
+    for device_id in state.device_ids:
+        try:
+            failed += not client.control_device(device_id, TURN_OFF).get('success')
+        except Exception:
+            failed += 1
+    elapsed = time.perf_counter() - start
+    client.close()
+    report('Sequential', elapsed, len(state.devices) - failed, failed, state)
+
+
+def run_bulk(endpoint, state, label, limiter, max_concurrency):
+    client = make_client(endpoint, limiter)
+    reset_devices(state)
+    result = client.control_devices({device_id: TURN_OFF for device_id in state.device_ids},
+                                    max_concurrency=max_concurrency)
+    client.close()
+    report(label, result['elapsed'], result['succeeded'], result['failed'], state)
+
+
+def report(label, elapsed, succeeded, failed, state):
+    print(f"{label:<30} {elapsed:<10.2f} {succeeded:<6} {failed:<8} {state.command_errors:<12} "
+          f"{state.request_count:<10} {count_off(state):<6}")
+
+
+def run_benchmark(devices=DEVICES, latency=LATENCY, error_rate=ERROR_RATE):
+    logging.getLogger('tuya.rate_limit').setLevel(logging.ERROR)
+    server, state = start_mock_server(num_devices=devices, latency=latency, error_rate=error_rate)
+    endpoint = f"http://127.0.0.1:{server.server_port}"
+    try:
+        print(f"Turning off {devices} plugs, {latency * 1000:.0f} ms API latency, "
+              f"{error_rate:.0%} of commands fail transiently")
+        print("-" * 88)
+        print(f"{'Mode':<30} {'Time (s)':<10} {'OK':<6} {'Failed':<8} {'503 errors':<12} "
+              f"{'API calls':<10} {'Off':<6}")
+        print("-" * 88)
+        run_sequential(endpoint, state)
+        run_bulk(endpoint, state, 'Bulk, 20 concurrent', unlimited_rate_limiter(), 20)
+        run_bulk(endpoint, state, 'Bulk, default limit (5/s)', RateLimiter(limits={'commands': 5, 'token': 1}), 20)
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    run_benchmark()
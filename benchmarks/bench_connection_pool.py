@@ -0,0 +1,82 @@
+import sys
+import os
+import time
+import tempfile
+import statistics
+
+# Add the root directory to Python path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(current_dir)
+sys.path.append(root_dir)
+
+from benchmarks.mock_tuya_server import start_mock_server, generate_self_signed_cert, unlimited_rate_limiter
+from tuya.tuya_client import TuyaClient
+
+REQUESTS = 200
+LATENCY = 0.0  # Leave server latency out so the handshake cost is visible
+
+
+def new_session(client):
+    client.session.close()
+    client.session = client._create_session()
+    client.session.verify = client.certfile
+    # REQUESTS_CA_BUNDLE would otherwise take precedence over session.verify
+    client.session.trust_env = False
+
+
+def time_requests(client, device_id, count, fresh_connection):
+    latencies = []
+    for _ in range(count):
+        if fresh_connection:
+            # What the client did before pooling: a new TCP+TLS connection per call
+            new_session(client)
+        start = time.perf_counter()
+        client.get_device_info(device_id, use_cache=False)  # Measure HTTP, not the response cache
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def report(label, latencies):
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{label:<22} {statistics.mean(latencies) * 1000:<12.2f} "
+          f"{statistics.median(latencies) * 1000:<12.2f} {p95 * 1000:<12.2f}")
+
+
+def run_benchmark(count=REQUESTS, latency=LATENCY):
+    with tempfile.TemporaryDirectory() as tmp:
+        certfile, keyfile = generate_self_signed_cert(tmp)
+        server, state = start_mock_server(num_devices=1, latency=latency, tls=(certfile, keyfile))
+        try:
+            endpoint = f"https://127.0.0.1:{server.server_port}"
+            device_id = state.device_ids[0]
+
+            client = TuyaClient(
+                endpoint=endpoint,
+                access_id='mock-access-id',
+                access_secret='mock-access-secret',
+                rate_limiter=unlimited_rate_limiter(),
+            )
+            client.certfile = certfile
+            new_session(client)
+            client.initialize_token()
+
+            print(f"{count} signed GET /v1.0/devices/{{id}} requests over TLS")
+            print("-" * 60)
+            print(f"{'Mode':<22} {'Mean (ms)':<12} {'Median (ms)':<12} {'p95 (ms)':<12}")
+            print("-" * 60)
+            report('New connection', time_requests(client, device_id, count, True))
+
+            new_session(client)
+            report('Pooled keep-alive', time_requests(client, device_id, count, False))
+
+            stats = client.connection_stats()
+            print("-" * 60)
+            print(f"Pooled session: {stats['requests']} requests over "
+                  f"{stats['connections']} connection(s), {stats['reused']} reused")
+        finally:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,224 @@
+import sys
+import io
+import os
+import json
+import time
+import bisect
+import argparse
+import platform
+import tempfile
+import contextlib
+import multiprocessing
+
+# Add the root directory to Python path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(current_dir)
+sys.path.append(root_dir)
+
+from benchmarks.mock_tuya_server import start_mock_server, unlimited_rate_limiter
+from benchmarks.bench_pipeline import InMemoryCodes
+from benchmarks.local_db import make_writer
+from tuya.tuya_client import TuyaClient
+from tuya.rate_limit import RateLimiter
+from database.last_state import LastStateIndex
+from database.datapoints import DatapointTracker
+from utils.store_device_data import get_current_statuses, record_changes, extract_status
+from utils.pipeline import PollingPipeline
+
+FLEET_SIZES = (100, 1000, 10000)
+ACCESS_ID = 'mock-access-id'
+ACCESS_SECRET = 'mock-access-secret'
+
+
+def serve_mock(options, conn):
+    """Run the mock in its own process and answer 'counters', 'reset' and 'flips' over conn"""
+    server, state = start_mock_server(**options)
+    conn.send(server.server_port)
+    while True:
+        command = conn.recv()
+        if command == 'counters':
+            conn.send(state.counters())
+        elif command == 'reset':
+            state.reset_counters()
+            conn.send(True)
+        elif command == 'flips':
+            with state.lock:
+                conn.send({device_id: list(times) for device_id, times in state.flips.items()})
+
+
+def ask(conn, command):
+    conn.send(command)
+    return conn.recv()
+
+
+def rss_mb():
+    """Resident memory of this process in MB"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError):
+        import resource  # Peak, not current, where /proc is not available
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def commit_latencies(commits, flips):
+    """Seconds from each switch flip in the mock to the commit of the row that recorded it"""
+    latencies = []
+    for device_id, committed_at in commits:
+        times = flips.get(device_id, ())
+        index = bisect.bisect_right(times, committed_at) - 1
+        if index >= 0:
+            latencies.append(committed_at - times[index])
+    return latencies
+
+
+def sweep_loop(client, device_ids, sweeps, writer, last_states, datapoints):
+    """The monitor's own loop: fetch every batch, then diff every device"""
+    for _ in range(sweeps):
+        statuses = get_current_statuses(client, device_ids)
+        for device_id in device_ids:
+            device_data, _ = statuses[device_id]
+            if device_data is not None:
+                record_changes(writer, last_states, datapoints, device_id, device_data,
+                               extract_status(device_data), int(time.time()))
+
+
+def sweep_pipeline(pipeline, device_ids, sweeps):
+    for _ in range(sweeps):
+        pipeline.submit(device_ids)
+        finished = 0
+        while finished < len(device_ids):
+            finished += len(pipeline.completed(timeout=60))
+
+
+def run_fleet(size, args, sqlite_path):
+    options = dict(num_devices=size, latency=args.latency, access_secret=ACCESS_SECRET,
+                   unauthorized_rate=args.unauthorized_rate, flip_rate=args.flip_rate,
+                   rate_limit=args.rate_limit)
+    conn, child_conn = multiprocessing.Pipe()
+    # In its own process, so the mock's CPU and memory aren't counted against the monitor
+    mock = multiprocessing.Process(target=serve_mock, args=(options, child_conn), daemon=True)
+    mock.start()
+    endpoint = f"http://127.0.0.1:{conn.recv()}"
+    limiter = unlimited_rate_limiter() if args.rate_limit is None else RateLimiter(
+        limits={name: args.rate_limit for name in ('default', 'devices', 'commands', 'token')})
+    client = TuyaClient(endpoint=endpoint, access_id=ACCESS_ID, access_secret=ACCESS_SECRET,
+                        rate_limiter=limiter)
+    writer = make_writer(args.db, sqlite_path=sqlite_path)
+    last_states = LastStateIndex()
+    datapoints = DatapointTracker(codes=InMemoryCodes(), tracked_codes=(), deadbands={})
+    device_ids = [f'mockdev{i:08d}' for i in range(size)]
+    pipeline = None
+    if args.mode == 'pipeline':
+        pipeline = PollingPipeline(client, lambda device_id, device_data: record_changes(
+            writer, last_states, datapoints, device_id, device_data,
+            extract_status(device_data), int(time.time())
+        ), mode='thread', fetch_workers=args.fetch_workers)
+    rss_before = rss_mb()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):  # The monitor prints every change
+            client.initialize_token()
+            # Warm-up: the first sweep stores every device's initial state
+            sweep_loop(client, device_ids, 1, writer, last_states, datapoints)
+            writer.flush()
+            writer.commits.clear()
+            ask(conn, 'reset')
+
+            start = time.perf_counter()
+            if pipeline is not None:
+                sweep_pipeline(pipeline, device_ids, args.sweeps)
+            else:
+                sweep_loop(client, device_ids, args.sweeps, writer, last_states, datapoints)
+            elapsed = time.perf_counter() - start
+            writer.flush()
+        counters = ask(conn, 'counters')
+        latencies = commit_latencies(writer.commits, ask(conn, 'flips'))
+        return {
+            'fleet': size,
+            'mode': args.mode,
+            'db': args.db,
+            'sweeps': args.sweeps,
+            'latency': args.latency,
+            'elapsed_seconds': round(elapsed, 3),
+            'devices_per_second': round(size * args.sweeps / elapsed, 1),
+            'changes_committed': len(writer.commits),
+            'commit_latency_seconds': {
+                name: None if value is None else round(value, 3)
+                for name, value in (('p50', percentile(latencies, 0.5)), ('p95', percentile(latencies, 0.95)),
+                                    ('p99', percentile(latencies, 0.99)),
+                                    ('max', max(latencies) if latencies else None))
+            },
+            'rss_mb': round(rss_mb(), 1),
+            'rss_growth_mb': round(rss_mb() - rss_before, 1),
+            'api': counters,
+            'write_behind': writer.stats(),
+        }
+    finally:
+        if pipeline is not None:
+            pipeline.close()
+        writer.close()
+        client.close()
+        mock.terminate()
+
+
+def run_benchmark(args):
+    print(f"{args.sweeps} sweeps per fleet, {args.latency * 1000:.0f} ms API latency, "
+          f"{args.flip_rate:g} flips/s, {args.unauthorized_rate:.2%} 401s, {args.mode} mode, {args.db} database")
+    print("-" * 86)
+    print(f"{'Fleet':<8} {'Time (s)':<10} {'Devices/s':<11} {'Changes':<9} "
+          f"{'p50 (s)':<9} {'p95 (s)':<9} {'p99 (s)':<9} {'RSS (MB)':<9} {'401s':<6}")
+    print("-" * 86)
+    run = {
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': [],
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            sqlite_path = args.sqlite_path or os.path.join(directory, f'bench_{size}.db')
+            result = run_fleet(size, args, sqlite_path)
+            run['results'].append(result)
+            latency = result['commit_latency_seconds']
+            print(f"{size:<8} {result['elapsed_seconds']:<10.2f} {result['devices_per_second']:<11.0f} "
+                  f"{result['changes_committed']:<9} {latency['p50'] if latency['p50'] is not None else '-':<9} "
+                  f"{latency['p95'] if latency['p95'] is not None else '-':<9} "
+                  f"{latency['p99'] if latency['p99'] is not None else '-':<9} "
+                  f"{result['rss_mb']:<9.1f} {result['api']['unauthorized']:<6}")
+    print("-" * 86)
+    if args.output:
+        # One JSON document per line, so runs can be appended and compared over time
+        with open(args.output, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(run) + '\n')
+        print(f"Results appended to {args.output}")
+    return run
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end monitor benchmark against the mock Tuya API")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(FLEET_SIZES))
+    parser.add_argument('--sweeps', type=int, default=3)
+    parser.add_argument('--latency', type=float, default=0.05, help="API latency in seconds")
+    parser.add_argument('--flip-rate', type=float, default=20, help="switch flips per second across the fleet")
+    parser.add_argument('--unauthorized-rate', type=float, default=0.001,
+                        help="fraction of requests whose token is revoked with a 401")
+    parser.add_argument('--rate-limit', type=float, default=None,
+                        help="mock requests per second; the client is limited to the same rate")
+    parser.add_argument('--mode', choices=('loop', 'pipeline'), default='loop')
+    parser.add_argument('--fetch-workers', type=int, default=4)
+    parser.add_argument('--db', choices=('memory', 'sqlite', 'sqlserver'), default='sqlite',
+                        help="where changes are written; sqlserver uses the database in .env")
+    parser.add_argument('--sqlite-path', default=None, help="SQLite file (default: a temporary file)")
+    parser.add_argument('--output', default=None, help="append results as a JSON line to this file")
+    run_benchmark(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+import sys
+import io
+import os
+import time
+import argparse
+import contextlib
+import multiprocessing
+
+# Add the root directory to Python path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(current_dir)
+sys.path.append(root_dir)
+
+from benchmarks.mock_tuya_server import start_mock_server, unlimited_rate_limiter
+from tuya.tuya_client import TuyaClient
+from database.last_state import LastStateIndex
+from database.datapoints import DatapointTracker, DatapointCodes
+from utils.store_device_data import get_current_statuses, record_changes, extract_status
+from utils.pipeline import PollingPipeline
+
+FLEET_SIZES = (100, 1000, 10000)
+LATENCY = 0.05
+SWEEPS = 3
+
+
+class CountingWriter:
+    """Persist stage stand-in: counts what the monitor would write, without a database"""
+
+    def __init__(self):
+        self.rows = 0
+
+    def enqueue(self, device_data, device_id, timestamp, switch_1, datapoints=()):
+        self.rows += 1
+
+
+class InMemoryCodes(DatapointCodes):
+    """Interns datapoint codes without the datapoint_codes table"""
+
+    def code_id(self, code):
+        with self._lock:
+            return self._ids.setdefault(code, len(self._ids) + 1)
+
+
+def serve_mock(num_devices, latency, ports):
+    # In its own process, so the mock's CPU use doesn't slow the monitor down
+    server, _ = start_mock_server(num_devices=num_devices, latency=latency)
+    ports.put(server.server_port)
+    while True:
+        time.sleep(60)
+
+
+def make_monitor():
+    """Writer, last_states and datapoints for one run, all in memory"""
+    return CountingWriter(), LastStateIndex(), DatapointTracker(codes=InMemoryCodes(), tracked_codes=(),
+                                                                deadbands={})
+
+
+def run_single_thread(client, device_ids, sweeps):
+    """The monitor's own loop: fetch every batch, then diff every device, on one thread"""
+    writer, last_states, datapoints = make_monitor()
+    start = time.perf_counter()
+    for _ in range(sweeps):
+        statuses = get_current_statuses(client, device_ids)
+        for device_id in device_ids:
+            device_data, _ = statuses[device_id]
+            if device_data is not None:
+                record_changes(writer, last_states, datapoints, device_id, device_data,
+                               extract_status(device_data), int(time.time()))
+    return time.perf_counter() - start
+
+
+def run_pipeline(client, device_ids, sweeps, mode, fetch_workers):
+    writer, last_states, datapoints = make_monitor()
+    pipeline = PollingPipeline(client, lambda device_id, device_data: record_changes(
+        writer, last_states, datapoints, device_id, device_data,
+        extract_status(device_data), int(time.time())
+    ), mode=mode, fetch_workers=fetch_workers, diff_workers=2)
+    pipeline.submit(device_ids[:1])  # Start the workers (and their tokens) before timing
+    pipeline.completed(timeout=30)
+
+    start = time.perf_counter()
+    for _ in range(sweeps):
+        pipeline.submit(device_ids)
+        finished = 0
+        while finished < len(device_ids):
+            finished += len(pipeline.completed(timeout=30))
+    elapsed = time.perf_counter() - start
+    pipeline.close()
+    return elapsed
+
+
+def run_benchmark(fleet_sizes=FLEET_SIZES, latency=LATENCY, sweeps=SWEEPS, fetch_workers=4):
+    # Worker processes build their own clients; keep them free of the client-side quota too
+    os.environ['TUYA_RATE_LIMITS'] = 'default=1e9,devices=1e9,commands=1e9,token=1e9'
+    print(f"{sweeps} sweeps per fleet, {latency * 1000:.0f} ms API latency, "
+          f"{fetch_workers} fetch workers, 2 diff threads (writes are counted, not stored)")
+    print("-" * 78)
+    print(f"{'Fleet':<8} {'Mode':<24} {'Time (s)':<10} {'Devices/s':<12} {'Speedup':<8}")
+    print("-" * 78)
+    for size in fleet_sizes:
+        ports = multiprocessing.Queue()
+        mock = multiprocessing.Process(target=serve_mock, args=(size, latency, ports), daemon=True)
+        mock.start()
+        endpoint = f"http://127.0.0.1:{ports.get(timeout=30)}"
+        device_ids = [f'mockdev{i:08d}' for i in range(size)]
+        client = TuyaClient(endpoint=endpoint, access_id='mock-access-id', access_secret='mock-access-secret',
+                            rate_limiter=unlimited_rate_limiter())
+        client.initialize_token()
+        try:
+            baseline = None
+            for label, run in (
+                ('Single thread', lambda: run_single_thread(client, device_ids, sweeps)),
+                ('Pipeline, threads', lambda: run_pipeline(client, device_ids, sweeps, 'thread', fetch_workers)),
+                ('Pipeline, processes', lambda: run_pipeline(client, device_ids, sweeps, 'process', fetch_workers)),
+            ):
+                with contextlib.redirect_stdout(io.StringIO()):  # The monitor prints every first-seen state
+                    elapsed = run()
+                baseline = baseline or elapsed
+                print(f"{size:<8} {label:<24} {elapsed:<10.2f} {size * sweeps / elapsed:<12.0f} "
+                      f"{baseline / elapsed:.1f}x")
+        finally:
+            client.close()
+            mock.terminate()
+        print("-" * 78)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Monitor throughput: single thread vs pipeline")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(FLEET_SIZES))
+    parser.add_argument('--latency', type=float, default=LATENCY)
+    parser.add_argument('--sweeps', type=int, default=SWEEPS)
+    parser.add_argument('--fetch-workers', type=int, default=4)
+    args = parser.parse_args()
+    run_benchmark(args.sizes, args.latency, args.sweeps, args.fetch_workers)
+
+
+if __name__ == "__main__":
+    main()
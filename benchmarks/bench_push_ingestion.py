@@ -0,0 +1,93 @@
+import sys
+import os
+import time
+import random
+import threading
+import statistics
+
+# Add the root directory to Python path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(current_dir)
+sys.path.append(root_dir)
+
+from benchmarks.mock_tuya_mq import start_mock_mq
+from tuya.tuya_mq import TuyaMessageQueue
+
+DEVICES = 500
+EVENTS = 2000
+POLL_INTERVAL = 5  # The polling monitor's interval, for comparison
+BATCH_SIZE = 20
+
+
+def run_benchmark(devices=DEVICES, events=EVENTS, rate=500):
+    """Publish status changes at `rate` per second and time their delivery.
+
+    Halfway through, the broker drops the connection to check that the
+    consumer reconnects and that unacknowledged messages are redelivered.
+    """
+    server, broker = start_mock_mq()
+    port = server.socket.getsockname()[1]
+
+    published_at = {}
+    latencies = []
+    seen = set()
+    duplicates = 0
+    lock = threading.Lock()
+    done = threading.Event()
+
+    def handler(event):
+        nonlocal duplicates
+        received = time.perf_counter()
+        key = (event.device_id, event.status['seq'])
+        with lock:
+            if key in seen:
+                duplicates += 1
+                return
+            seen.add(key)
+            latencies.append(received - published_at[key])
+            if len(seen) == events:
+                done.set()
+
+    mq = TuyaMessageQueue(
+        access_id=broker.access_id,
+        access_secret=broker.access_secret,
+        url=f"ws://127.0.0.1:{port}/",
+        handler=handler,
+    )
+    mq.start()
+    try:
+        device_ids = [f'mockdev{i:08d}' for i in range(devices)]
+        start = time.perf_counter()
+        for seq in range(events):
+            device_id = random.choice(device_ids)
+            with lock:
+                published_at[(device_id, seq)] = time.perf_counter()
+            broker.publish_status(device_id, {'switch_1': bool(seq % 2), 'seq': seq})
+            if seq == events // 2:
+                broker.drop_connection()
+            time.sleep(max(0, start + (seq + 1) / rate - time.perf_counter()))
+
+        delivered = done.wait(30)
+        elapsed = time.perf_counter() - start
+    finally:
+        mq.stop()
+        server.shutdown()
+
+    print(f"Published {events} status changes for {devices} devices in {elapsed:.1f} s "
+          f"(connection dropped once)")
+    print("-" * 80)
+    print(f"Delivered:         {len(seen)} / {events}{'' if delivered else ' (timed out)'}")
+    print(f"Duplicates:        {duplicates} (redelivered: {broker.redelivered})")
+    print(f"Consumer connects: {mq.stats()['connects']}")
+    if latencies:
+        latencies.sort()
+        print(f"Push latency:      median {statistics.median(latencies) * 1000:.1f} ms, "
+              f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f} ms")
+    # Polling detects a change after half an interval on average, and pays for every device every interval
+    print(f"Polling latency:   mean {POLL_INTERVAL / 2 * 1000:.0f} ms at "
+          f"{-(-devices // BATCH_SIZE) * 3600 // POLL_INTERVAL} API calls/hour "
+          f"(every {POLL_INTERVAL} s, {BATCH_SIZE} devices per call)")
+
+
+if __name__ == "__main__":
+    run_benchmark()
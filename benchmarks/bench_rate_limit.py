@@ -0,0 +1,82 @@
+import sys
+import os
+import time
+import logging
+import threading
+
+# Add the root directory to Python path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(current_dir)
+sys.path.append(root_dir)
+
+from benchmarks.mock_tuya_server import start_mock_server
+from tuya.tuya_client import TuyaClient
+from tuya.rate_limit import RateLimiter
+
+SERVER_LIMIT = 20  # Requests per second the mock API accepts
+REQUESTS = 300
+THREADS = 8
+
+
+def run_mode(endpoint, state, label, limiter, requests_total, threads):
+    client = TuyaClient(endpoint=endpoint, access_id='mock-access-id',
+                        access_secret='mock-access-secret', rate_limiter=limiter)
+    client.initialize_token()
+    time.sleep(1)  # Let the mock's quota refill after the token request
+    state.reset_counters()
+
+    remaining = [requests_total]
+    succeeded = [0]
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                if remaining[0] == 0:
+                    return
+                remaining[0] -= 1
+            try:
+                ok = client.get_device_info(state.device_ids[0], use_cache=False).get('success')
+            except Exception:
+                ok = False
+            with lock:
+                succeeded[0] += bool(ok)
+
+    start = time.perf_counter()
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+    client.close()
+
+    stats = limiter.stats()['devices']
+    print(f"{label:<28} {succeeded[0]:<6} {requests_total - succeeded[0]:<8} {state.request_count:<10} "
+          f"{state.rate_limited:<14} {stats['queued']:<8} {elapsed:<8.1f}")
+
+
+def run_benchmark(server_limit=SERVER_LIMIT, requests_total=REQUESTS, threads=THREADS):
+    logging.getLogger('tuya.rate_limit').setLevel(logging.ERROR)
+    server, state = start_mock_server(num_devices=1, latency=0.005, rate_limit=server_limit)
+    endpoint = f"http://127.0.0.1:{server.server_port}"
+    try:
+        print(f"Mock API quota {server_limit} req/s; {requests_total} requests from {threads} threads")
+        print("-" * 86)
+        print(f"{'Client limiter':<28} {'OK':<6} {'Failed':<8} {'API calls':<10} "
+              f"{'Rate limited':<14} {'Queued':<8} {'Time (s)':<8}")
+        print("-" * 86)
+        # No client limit and no retries: what the monitor did before
+        run_mode(endpoint, state, 'None', RateLimiter(
+            limits={'devices': 1e9, 'default': 1e9, 'token': 1e9}, max_retries=0, base_backoff=1e-6),
+            requests_total, threads)
+        run_mode(endpoint, state, f'Matched ({server_limit}/s)', RateLimiter(
+            limits={'devices': server_limit * 0.9, 'token': 1}), requests_total, threads)
+        run_mode(endpoint, state, f'Adaptive ({server_limit * 2}/s)', RateLimiter(
+            limits={'devices': server_limit * 2, 'token': 1}), requests_total, threads)
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    run_benchmark()
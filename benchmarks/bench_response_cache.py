@@ -0,0 +1,84 @@
+import sys
+import os
+import time
+import logging
+import threading
+
+# Add the root directory to Python path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(current_dir)
+sys.path.append(root_dir)
+
+from benchmarks.mock_tuya_server import start_mock_server, unlimited_rate_limiter
+from tuya.tuya_client import TuyaClient
+from tuya.response_cache import ResponseCache
+
+DEVICES = 10
+READERS = 16  # e.g. dashboards and scripts reading the same devices
+READS_PER_READER = 100
+LATENCY = 0.02
+
+
+def make_client(endpoint, ttls):
+    client = TuyaClient(endpoint=endpoint, access_id='mock-access-id',
+                        access_secret='mock-access-secret', rate_limiter=unlimited_rate_limiter(),
+                        response_cache=ResponseCache(ttls=ttls))
+    client.initialize_token()
+    return client
+
+
+def run_mode(endpoint, state, label, ttls, use_cache, reads):
+    client = make_client(endpoint, ttls)
+    device_ids = state.device_ids
+    state.reset_counters()
+
+    def reader(offset):
+        for i in range(reads):
+            client.get_device_info(device_ids[(offset + i) % len(device_ids)], use_cache=use_cache)
+
+    start = time.perf_counter()
+    readers = [threading.Thread(target=reader, args=(i,)) for i in range(READERS)]
+    for r in readers:
+        r.start()
+    for r in readers:
+        r.join()
+    elapsed = time.perf_counter() - start
+    stats = client.response_cache.stats()
+    client.close()
+    print(f"{label:<26} {READERS * reads:<8} {state.request_count:<10} {stats['coalesced']:<10} "
+          f"{stats['hits']:<8} {elapsed:<8.2f}")
+
+
+def check_invalidation(endpoint, state):
+    client = make_client(endpoint, {'device_info': 60})
+    device_id = state.device_ids[0]
+    before = client.get_device_info(device_id)['result']['status'][0]['value']
+    client.control_device(device_id, [{'code': 'switch_1', 'value': not before}])
+    after = client.get_device_info(device_id)['result']['status'][0]['value']
+    client.close()
+    print(f"control_device invalidation: switch_1 {before} -> {after} "
+          f"({'fresh' if after != before else 'STALE'})")
+
+
+def run_benchmark(reads=READS_PER_READER):
+    logging.getLogger('urllib3.connectionpool').setLevel(logging.ERROR)  # More readers than pooled connections
+    server, state = start_mock_server(num_devices=DEVICES, latency=LATENCY)
+    endpoint = f"http://127.0.0.1:{server.server_port}"
+    try:
+        print(f"{READERS} readers x {reads} get_device_info calls over {DEVICES} devices, "
+              f"{LATENCY * 1000:.0f} ms API latency")
+        print("-" * 76)
+        print(f"{'Mode':<26} {'Reads':<8} {'API calls':<10} {'Coalesced':<10} {'Hits':<8} {'Time (s)':<8}")
+        print("-" * 76)
+        run_mode(endpoint, state, 'No cache', {}, False, reads)
+        run_mode(endpoint, state, 'Coalescing only (TTL 0)', {'device_info': 0}, True, reads)
+        run_mode(endpoint, state, 'TTL 1 s', {'device_info': 1}, True, reads)
+        run_mode(endpoint, state, 'TTL 60 s', {'device_info': 60}, True, reads)
+        print("-" * 76)
+        check_invalidation(endpoint, state)
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    run_benchmark()
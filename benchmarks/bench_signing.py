@@ -0,0 +1,148 @@
+import sys
+import os
+import time
+import hmac
+import string
+import random
+import asyncio
+import hashlib
+import argparse
+
+# Add the root directory to Python path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(current_dir)
+sys.path.append(root_dir)
+
+from benchmarks.mock_tuya_server import start_mock_server, unlimited_rate_limiter
+from tuya.tuya_client import TuyaClient
+from tuya.async_tuya_client import AsyncTuyaClient, aiohttp
+
+ACCESS_ID = 'mock-access-id'
+ACCESS_SECRET = 'mock-access-secret'
+FLEET = 10000
+SIGNATURES = 200000
+
+
+class LegacySigning:
+    """The previous behaviour: random.choices nonce, hash the body and re-key the HMAC per request"""
+
+    def get_headers(self, method, url, body='', append_headers=None):
+        if append_headers is None:
+            append_headers = {}
+        access_token = '' if url.startswith('/v1.0/token') else self.tokens.get()
+        nonce = ''.join(random.choices(string.ascii_letters + string.digits, k=8))
+        timestamp = int(time.time() * 1000)
+        headers = {'client_id': self.access_id, 'sign_method': 'HMAC-SHA256', 't': str(timestamp), 'nonce': nonce}
+        headers_str = '\n'.join(f"{k}:{v}" for k, v in sorted(append_headers.items()))
+        string_to_sign = f"{method}\n{hashlib.sha256(body.encode()).hexdigest()}\n{headers_str}\n{url}"
+        sign_str = f"{self.access_id}{access_token}{timestamp}{nonce}{string_to_sign}"
+        headers['sign'] = hmac.new(self.access_secret.encode(), sign_str.encode(), hashlib.sha256).hexdigest().upper()
+        headers.update(append_headers)
+        if access_token:
+            headers['access_token'] = access_token
+        return headers
+
+
+class LegacyTuyaClient(LegacySigning, TuyaClient):
+    pass
+
+
+class LegacyAsyncTuyaClient(LegacySigning, AsyncTuyaClient):
+    pass
+
+
+def batch_urls(client, device_ids):
+    """The URLs of one batched sweep, as TuyaClient.get_devices_info builds them"""
+    return [client._append_query_to_url('/v1.0/devices', {'device_ids': ','.join(chunk)})
+            for chunk in client._chunk_device_ids(device_ids)]
+
+
+def sign_batched(client, urls, count):
+    """Headers signed per second for the batched sweep's URLs, on one thread"""
+    start = time.perf_counter()
+    for i in range(count):
+        client.get_headers('GET', urls[i % len(urls)])
+    return count / (time.perf_counter() - start)
+
+
+def sign_async(client, device_ids, count):
+    """Headers signed per second by concurrent coroutines, as the async client signs on its event loop"""
+    async def worker(offset, n):
+        for i in range(n):
+            client.get_headers('GET', f'/v1.0/devices/{device_ids[(offset + i) % len(device_ids)]}')
+            if i % 100 == 0:
+                await asyncio.sleep(0)
+
+    async def run():
+        workers = 20
+        await asyncio.gather(*(worker(w * count // workers, count // workers) for w in range(workers)))
+
+    start = time.perf_counter()
+    asyncio.run(run())
+    return count / (time.perf_counter() - start)
+
+
+def verify(client, async_client, device_ids):
+    """One batched sweep per path against the mock, which checks every signature"""
+    async def run():
+        devices = await async_client.get_devices_info(device_ids)
+        await async_client.close()
+        return devices
+
+    found = len(client.get_devices_info(device_ids))
+    if async_client is not None:
+        found += len(asyncio.run(run()))
+    return found
+
+
+def run_benchmark(args):
+    server, state = start_mock_server(num_devices=args.fleet, latency=0, access_secret=ACCESS_SECRET)
+    endpoint = f"http://127.0.0.1:{server.server_port}"
+    device_ids = state.device_ids
+
+    def client(cls):
+        instance = cls(endpoint=endpoint, access_id=ACCESS_ID, access_secret=ACCESS_SECRET,
+                       rate_limiter=unlimited_rate_limiter())
+        instance.tokens.get()
+        return instance
+
+    try:
+        print(f"{args.signatures} signatures per path, {args.fleet} devices")
+        print("-" * 72)
+        print(f"{'Path':<34} {'Previous (/s)':<16} {'Signer (/s)':<14} {'Speedup':<8}")
+        print("-" * 72)
+        rows = []
+        legacy, current = client(LegacyTuyaClient), client(TuyaClient)
+        urls = batch_urls(current, device_ids)
+        rows.append(('Sign batched requests', sign_batched(legacy, urls, args.signatures),
+                     sign_batched(current, urls, args.signatures)))
+        legacy.close()
+        async_client = None
+        if aiohttp is None:
+            print("aiohttp is not installed; skipping the async path")
+        else:
+            legacy, async_client = client(LegacyAsyncTuyaClient), client(AsyncTuyaClient)
+            rows.append(('Sign on the event loop', sign_async(legacy, device_ids, args.signatures),
+                         sign_async(async_client, device_ids, args.signatures)))
+            asyncio.run(legacy.close())
+        for label, before, after in rows:
+            print(f"{label:<34} {before:<16,.0f} {after:<14,.0f} {after / before:<8.2f}")
+        print("-" * 72)
+        state.reset_counters()
+        found = verify(current, async_client, device_ids)
+        current.close()
+        print(f"Verification sweeps: {found} devices returned, "
+              f"{state.bad_signatures} signatures rejected by the mock")
+    finally:
+        server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Signed requests per second, before and after the signer")
+    parser.add_argument('--fleet', type=int, default=FLEET)
+    parser.add_argument('--signatures', type=int, default=SIGNATURES)
+    run_benchmark(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
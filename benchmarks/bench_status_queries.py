@@ -0,0 +1,98 @@
+import sys
+import os
+import time
+import argparse
+import statistics
+
+# Add the root directory to Python path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(current_dir)
+sys.path.append(root_dir)
+
+from database.db_utils import db_connection
+from database.storage import LATEST_STATES_SQL
+from database.migrate_device_status import STATUS_INDEX_NAME, create_status_index
+from benchmarks.generate_status_data import DEVICE_PREFIX
+from utils.get_switch_status import LAST_N_FOR_DEVICE_SQL, LAST_N_ALL_DEVICES_SQL
+
+LAST_STORED_SQL = '''
+SELECT TOP 1 switch_1, timestamp
+FROM device_status
+WHERE device_id = ?
+ORDER BY timestamp DESC
+'''
+
+RANGE_FOR_DEVICE_SQL = '''
+SELECT timestamp, switch_1
+FROM device_status
+WHERE device_id = ? AND timestamp >= ?
+ORDER BY timestamp
+'''
+
+def time_query(cursor, sql, params, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        cursor.execute(sql, params)
+        cursor.fetchall()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+def run_queries(cursor, device_id, repeat):
+    week_ago = int(time.time()) - 7 * 86400
+    return [
+        ('Last stored status (1 device)', time_query(cursor, LAST_STORED_SQL, (device_id,), repeat)),
+        ('Last 2 records (1 device)', time_query(cursor, LAST_N_FOR_DEVICE_SQL, (2, device_id), repeat)),
+        ('Last 7 days (1 device)', time_query(cursor, RANGE_FOR_DEVICE_SQL, (device_id, week_ago), repeat)),
+        ('Latest state (all devices)', time_query(cursor, LATEST_STATES_SQL, (), max(1, repeat // 5))),
+        ('Last 2 records (all devices)', time_query(cursor, LAST_N_ALL_DEVICES_SQL, (2,), max(1, repeat // 5))),
+    ]
+
+def index_exists(cursor):
+    cursor.execute("SELECT COUNT(*) FROM sys.indexes WHERE name = ? AND object_id = OBJECT_ID('device_status')",
+                   (STATUS_INDEX_NAME,))
+    return cursor.fetchone()[0] > 0
+
+def run_benchmark(repeat=10, compare=False):
+    """Time the monitor's and reports' status queries.
+
+    With compare=True the status index is dropped, the queries are timed,
+    then the index is recreated and the queries are timed again.
+    """
+    try:
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT COUNT_BIG(*) FROM device_status")
+            total_rows = cursor.fetchone()[0]
+            device_id = f"{DEVICE_PREFIX}00000001"
+            print(f"device_status rows: {total_rows:,}; sample device: {device_id}")
+
+            results = {}
+            if compare:
+                cursor.execute(f"DROP INDEX IF EXISTS {STATUS_INDEX_NAME} ON device_status")
+                conn.commit()
+                results['No index'] = run_queries(cursor, device_id, repeat)
+                print("Creating index...")
+                create_status_index(cursor)
+                conn.commit()
+            label = 'Index' if index_exists(cursor) else 'No index'
+            results[label] = run_queries(cursor, device_id, repeat)
+            cursor.close()
+
+        labels = list(results)
+        print("-" * 80)
+        print(f"{'Query':<34}" + ''.join(f"{label + ' (ms)':<20}" for label in labels))
+        print("-" * 80)
+        for i, (name, _) in enumerate(results[labels[0]]):
+            print(f"{name:<34}" + ''.join(f"{results[label][i][1] * 1000:<20.1f}" for label in labels))
+
+    except Exception as e:
+        print(f"Error: {e}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark device_status queries")
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--compare', action='store_true',
+                        help="time without the status index, then create it and time again")
+    args = parser.parse_args()
+    run_benchmark(args.repeat, args.compare)
@@ -0,0 +1,94 @@
+import sys
+import os
+import time
+import random
+import argparse
+import tempfile
+
+# Add the root directory to Python path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(current_dir)
+sys.path.append(root_dir)
+
+from database.storage import SQLiteStorage, SqlServerStorage
+
+DEVICES = 10000
+ROWS = 1000000
+BATCH_SIZE = 500  # The write-behind queue's default WRITE_BEHIND_BATCH_SIZE
+
+
+def device_rows(num_devices):
+    return [(f'benchdev{i:08d}', f'Bench device {i}', 'cz', True, 0, 0, 0, '127.0.0.1', 'bench', '+00:00')
+            for i in range(num_devices)]
+
+
+def ingest(storage, device_ids, rows, batch_size, guarded):
+    """Append rows status changes in write-behind sized batches; returns rows per second.
+
+    A batch changes each device at most once, so with fewer devices than
+    batch_size the batches are capped at the number of devices.
+    """
+    states = dict.fromkeys(device_ids, False)
+    timestamp = int(time.time()) - rows
+    batch_size = min(batch_size, len(device_ids))
+    start = time.perf_counter()
+    for offset in range(0, rows, batch_size):
+        batch = []
+        for device_id in random.sample(device_ids, min(batch_size, rows - offset)):
+            states[device_id] = not states[device_id]
+            timestamp += 1
+            batch.append((device_id, timestamp, states[device_id]))
+        storage.write_batch([], batch, [], guarded=guarded)
+    return rows / (time.perf_counter() - start)
+
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return time.perf_counter() - start, result
+
+
+def run_benchmark(storage, num_devices, rows, batch_size):
+    devices = device_rows(num_devices)
+    device_ids = [row[0] for row in devices]
+    storage.upsert_devices(devices)
+
+    print(f"{rows} status rows for {num_devices} devices in batches of {batch_size}")
+    print("-" * 60)
+    print(f"{'Operation':<36} {'Result':<24}")
+    print("-" * 60)
+    print(f"{'Ingest':<36} {ingest(storage, device_ids, rows // 2, batch_size, False):,.0f} rows/s")
+    print(f"{'Ingest, guarded':<36} {ingest(storage, device_ids, rows // 2, batch_size, True):,.0f} rows/s")
+    seconds, states = timed(storage.last_states)
+    print(f"{'Last state of every device':<36} {seconds * 1000:,.1f} ms ({len(states)} devices)")
+    end = int(time.time()) + 1
+    seconds, count = timed(lambda: sum(len(batch) for batch in storage.history(0, end)))
+    print(f"{'Full history scan':<36} {count / seconds:,.0f} rows/s")
+    seconds, count = timed(lambda: sum(len(batch) for batch in storage.history(0, end, device_ids[:1])))
+    print(f"{'One device history':<36} {seconds * 1000:,.1f} ms ({count} rows)")
+    print("-" * 60)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Status ingest and query throughput of a storage backend")
+    parser.add_argument('--backend', choices=('sqlite', 'sqlserver'), default='sqlite',
+                        help="sqlserver writes benchmark devices and rows to the database in .env")
+    parser.add_argument('--sqlite-path', default=None, help="SQLite file (default: a temporary file)")
+    parser.add_argument('--devices', type=int, default=DEVICES)
+    parser.add_argument('--rows', type=int, default=ROWS)
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        if args.backend == 'sqlite':
+            storage = SQLiteStorage(args.sqlite_path or os.path.join(directory, 'bench_storage.db'))
+        else:
+            storage = SqlServerStorage()
+        try:
+            run_benchmark(storage, args.devices, args.rows, args.batch_size)
+        finally:
+            storage.close()
+
+
+if __name__ == "__main__":
+    main()
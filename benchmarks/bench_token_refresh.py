@@ -0,0 +1,86 @@
+import sys
+import os
+import time
+import threading
+
+# Add the root directory to Python path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(current_dir)
+sys.path.append(root_dir)
+
+from benchmarks.mock_tuya_server import start_mock_server, unlimited_rate_limiter
+from tuya.tuya_client import TuyaClient
+from tuya.token_manager import TokenManager
+
+TOKEN_TTL = 2  # Seconds; short so a few seconds cover many expiries
+DURATION = 10
+THREADS = 8
+
+
+class ReactiveTokenManager(TokenManager):
+    """The previous behaviour: keep the token until the API rejects it"""
+
+    def get(self):
+        token = self._token
+        return self._refresh(None)['access_token'] if token is None else token['access_token']
+
+    def current(self):
+        return self.get()
+
+
+def hammer(client, device_id, deadline, counts, lock):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        ok = client.get_device_info(device_id, use_cache=False).get('success')
+        elapsed = time.perf_counter() - start
+        with lock:
+            counts['requests'] += 1
+            counts['failed'] += not ok
+            counts['slowest'] = max(counts['slowest'], elapsed)
+
+
+def run_mode(endpoint, state, label, tokens_factory, duration, threads):
+    client = TuyaClient(endpoint=endpoint, access_id='mock-access-id',
+                        access_secret='mock-access-secret', rate_limiter=unlimited_rate_limiter())
+    client.tokens = tokens_factory(client)
+    client.initialize_token()
+    state.reset_counters()
+
+    counts = {'requests': 0, 'failed': 0, 'slowest': 0.0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+    workers = [
+        threading.Thread(target=hammer, args=(client, state.device_ids[0], deadline, counts, lock))
+        for _ in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    client.close()
+
+    print(f"{label:<22} {counts['requests']:<10} {state.rejected_tokens:<18} "
+          f"{state.token_requests:<16} {counts['failed']:<8} {counts['slowest'] * 1000:<10.1f}")
+
+
+def run_benchmark(duration=DURATION, threads=THREADS, token_ttl=TOKEN_TTL):
+    server, state = start_mock_server(num_devices=1, latency=0.005, token_ttl=token_ttl)
+    endpoint = f"http://127.0.0.1:{server.server_port}"
+    try:
+        print(f"Token lifetime {token_ttl} s, {threads} threads for {duration} s")
+        print("-" * 86)
+        print(f"{'Mode':<22} {'Requests':<10} {'Rejected (1010)':<18} {'Token requests':<16} "
+              f"{'Failed':<8} {'Slowest (ms)':<10}")
+        print("-" * 86)
+        run_mode(endpoint, state, 'Refresh on rejection',
+                 lambda c: ReactiveTokenManager(c._request_token, background=False),
+                 duration, threads)
+        run_mode(endpoint, state, 'Proactive refresh',
+                 lambda c: TokenManager(c._request_token, refresh_margin=token_ttl / 4),
+                 duration, threads)
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    run_benchmark()
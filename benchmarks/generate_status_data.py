@@ -0,0 +1,94 @@
+import sys
+import os
+import time
+import argparse
+
+# Add the root directory to Python path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(current_dir)
+sys.path.append(root_dir)
+
+from database.db_utils import db_connection
+
+DEVICE_PREFIX = 'benchdev'
+CHUNK_ROWS = 1_000_000  # Rows generated per transaction
+
+# Numbers 0..@rows-1 from a cross join of system views; enough for 10M+ rows per chunk
+NUMBERS_CTE = '''
+WITH numbers AS (
+    SELECT TOP (?) ROW_NUMBER() OVER (ORDER BY (SELECT NULL)) - 1 AS i
+    FROM sys.all_columns a CROSS JOIN sys.all_columns b CROSS JOIN sys.all_columns c
+)
+'''
+
+def device_id_sql(expression):
+    return f"'{DEVICE_PREFIX}' + RIGHT('00000000' + CAST({expression} AS VARCHAR(8)), 8)"
+
+def generate_devices(cursor, devices):
+    cursor.execute(NUMBERS_CTE + f'''
+    INSERT INTO devices (device_id, name, category, online, ip, model, time_zone)
+    SELECT {device_id_sql('i')}, 'Bench plug ' + CAST(i AS VARCHAR(8)), 'cz', 1, '127.0.0.1', 'BENCH', '+00:00'
+    FROM numbers
+    WHERE NOT EXISTS (SELECT 1 FROM devices d WHERE d.device_id = {device_id_sql('i')})
+    ''', (devices,))
+
+def generate_status_rows(cursor, first_row, rows, devices, start_ts, step):
+    """Insert rows [first_row, first_row + rows) of the synthetic history.
+
+    Row r belongs to device r % devices and is that device's (r // devices)-th
+    toggle, step seconds after the previous one, with devices staggered
+    within each step.
+    """
+    cursor.execute(NUMBERS_CTE + f'''
+    INSERT INTO device_status WITH (TABLOCK) (device_id, timestamp, switch_1)
+    SELECT
+        {device_id_sql('(? + i) % ?')},
+        ? + ((? + i) / ?) * ? + ((? + i) % ?) % ?,
+        ((? + i) / ?) % 2
+    FROM numbers
+    ''', (rows,
+          first_row, devices,
+          start_ts, first_row, devices, step, first_row, devices, step,
+          first_row, devices))
+
+def generate(rows=10_000_000, devices=1000, step=300, truncate=False):
+    """Fill device_status with `rows` synthetic toggles spread over `devices` devices"""
+    try:
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            start = time.perf_counter()
+
+            if truncate:
+                print("Removing previous benchmark rows...")
+                cursor.execute(f"DELETE FROM device_status WHERE device_id LIKE '{DEVICE_PREFIX}%'")
+                conn.commit()
+
+            generate_devices(cursor, devices)
+            conn.commit()
+
+            # History ends now and goes back far enough to fit every row
+            start_ts = int(time.time()) - (rows // devices + 1) * step
+            for first_row in range(0, rows, CHUNK_ROWS):
+                chunk = min(CHUNK_ROWS, rows - first_row)
+                generate_status_rows(cursor, first_row, chunk, devices, start_ts, step)
+                conn.commit()
+                print(f"  {first_row + chunk:,} / {rows:,} rows "
+                      f"({time.perf_counter() - start:.0f} s)")
+
+            cursor.execute("UPDATE STATISTICS device_status")
+            conn.commit()
+            cursor.close()
+            print(f"Generated {rows:,} rows for {devices:,} devices "
+                  f"in {time.perf_counter() - start:.0f} seconds")
+
+    except Exception as e:
+        print(f"Error: {e}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic device_status history")
+    parser.add_argument('--rows', type=int, default=10_000_000)
+    parser.add_argument('--devices', type=int, default=1000)
+    parser.add_argument('--step', type=int, default=300, help="seconds between toggles of one device")
+    parser.add_argument('--truncate', action='store_true', help="delete earlier benchmark rows first")
+    args = parser.parse_args()
+    generate(args.rows, args.devices, args.step, args.truncate)
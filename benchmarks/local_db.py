@@ -0,0 +1,75 @@
+import time
+
+from database.write_behind import WriteBehindQueue
+from database.storage import StatusStorage, SQLiteStorage, SqlServerStorage
+
+
+class MemoryStorage(StatusStorage):
+    """Counts what would be written, to measure the monitor without a database"""
+
+    def __init__(self):
+        self.statuses = 0
+        self.datapoints = 0
+        self.codes = {}
+
+    def write_batch(self, devices, statuses, datapoints, guarded=False, rollups=False):
+        self.statuses += len(statuses)
+        self.datapoints += len(datapoints)
+
+    # Nothing is kept, so reads find an empty database
+
+    def device_rows(self):
+        return []
+
+    def last_states(self):
+        return {}
+
+    def history(self, start, end, device_ids=None, batch_size=5000):
+        return iter(())
+
+    def datapoint_codes(self):
+        return dict(self.codes)
+
+    def register_code(self, code):
+        return self.codes.setdefault(code, len(self.codes) + 1)
+
+    def latest_datapoints(self):
+        return []
+
+
+class TimedWriteBehind(WriteBehindQueue):
+    """WriteBehindQueue that records when each status row was committed.
+
+    commits holds (device_id, time.time()) per committed status row, for
+    change-to-commit latency. The storage is closed with the queue.
+    """
+
+    def __init__(self, **kwargs):
+        self.commits = []
+        super().__init__(**kwargs)
+
+    def _write_batch(self, items):
+        super()._write_batch(items)
+        committed_at = time.time()
+        self.commits.extend((status[0], committed_at) for _, status, _ in items if status is not None)
+
+    def close(self, timeout=30):
+        super().close(timeout)
+        self.storage.close()
+
+
+def make_storage(backend, sqlite_path=None):
+    """Storage for a benchmark: 'memory', 'sqlite' or 'sqlserver' (the database in .env)"""
+    if backend == 'memory':
+        return MemoryStorage()
+    if backend == 'sqlite':
+        return SQLiteStorage(sqlite_path)
+    if backend == 'sqlserver':
+        return SqlServerStorage()
+    raise ValueError(f"Unknown database backend: {backend}")
+
+
+def make_writer(backend, sqlite_path=None, **kwargs):
+    """Timed write-behind queue over make_storage(backend); rollups only run on SQL Server"""
+    return TimedWriteBehind(storage=make_storage(backend, sqlite_path),
+                            rollups=backend == 'sqlserver', **kwargs)
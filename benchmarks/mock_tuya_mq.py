@@ -0,0 +1,155 @@
+import json
+import time
+import queue
+import base64
+import hashlib
+import threading
+from collections import OrderedDict
+
+from websockets.http11 import Response
+from websockets.datastructures import Headers
+from websockets.sync.server import serve
+from Crypto.Cipher import AES
+from Crypto.Util.Padding import pad
+
+
+def encrypt_data(data, access_secret):
+    """Inverse of tuya.tuya_mq.decrypt_data"""
+    cipher = AES.new(access_secret[8:24].encode(), AES.MODE_ECB)
+    return base64.b64encode(cipher.encrypt(pad(json.dumps(data).encode(), AES.block_size))).decode()
+
+
+class MockTuyaMQ:
+    """Local stand-in for the Tuya Pulsar websocket consumer.
+
+    Accepts one consumer at a time at the real topic path, checks the
+    username/password headers and delivers published messages encrypted the
+    way Tuya does. Messages stay unacknowledged until the consumer acks them
+    and are redelivered when it reconnects, like a persistent subscription.
+    """
+
+    def __init__(self, access_id, access_secret):
+        self.access_id = access_id
+        self.access_secret = access_secret
+        self.lock = threading.Lock()
+        self.outbox = queue.Queue()
+        self.unacked = OrderedDict()  # message_id -> frame
+        self.published = 0
+        self.acked = 0
+        self.redelivered = 0
+        self.connections = 0
+        self._next_id = 0
+        self._connection = None
+
+    @property
+    def path(self):
+        return (f"/ws/v2/consumer/persistent/{self.access_id}/out/event/"
+                f"{self.access_id}-sub")
+
+    def password(self):
+        secret_md5 = hashlib.md5(self.access_secret.encode()).hexdigest()
+        return hashlib.md5(f"{self.access_id}{secret_md5}".encode()).hexdigest()[8:24]
+
+    def publish_status(self, device_id, status, t=None):
+        """Publish a protocol 4 status report of {code: value} for a device"""
+        t = t or int(time.time() * 1000)
+        return self._publish(4, t, {
+            'dataId': f'data-{self._next_id}',
+            'devId': device_id,
+            'productKey': 'mockproduct',
+            'status': [{'code': code, 'value': value, 't': t} for code, value in status.items()],
+        })
+
+    def publish_biz_event(self, device_id, biz_code, t=None):
+        """Publish a protocol 20 device event such as 'online' or 'offline'"""
+        t = t or int(time.time() * 1000)
+        return self._publish(20, t, {'bizCode': biz_code, 'devId': device_id, 'bizData': {}, 'ts': t})
+
+    def drop_connection(self):
+        """Close the consumer's connection, as a broker restart would"""
+        connection = self._connection
+        if connection is not None:
+            # close() waits for the closing handshake; don't block the publisher on it
+            threading.Thread(target=connection.close, daemon=True).start()
+
+    def _publish(self, protocol, t, data):
+        payload = {'protocol': protocol, 'pv': '2.0', 'sign': '', 't': t,
+                   'data': encrypt_data(data, self.access_secret)}
+        with self.lock:
+            self._next_id += 1
+            message_id = f'mock:{self._next_id}'
+            self.published += 1
+        frame = json.dumps({
+            'messageId': message_id,
+            'payload': base64.b64encode(json.dumps(payload).encode()).decode(),
+            'publishTime': t,
+        })
+        self.outbox.put((message_id, frame))
+        return message_id
+
+    def process_request(self, connection, request):
+        authorized = (request.headers.get('username') == self.access_id
+                      and request.headers.get('password') == self.password())
+        if request.path.split('?')[0] != self.path:
+            return Response(404, 'Not Found', Headers(), b'unknown topic\n')
+        if not authorized:
+            return Response(401, 'Unauthorized', Headers(), b'bad credentials\n')
+        return None
+
+    def handle(self, connection):
+        with self.lock:
+            self.connections += 1
+            self._connection = connection
+            redeliveries = list(self.unacked.values())
+            self.redelivered += len(redeliveries)
+        threading.Thread(target=self._read_acks, args=(connection,), daemon=True).start()
+
+        try:
+            for frame in redeliveries:
+                connection.send(frame)
+            while True:
+                try:
+                    message_id, frame = self.outbox.get(timeout=0.1)
+                except queue.Empty:
+                    if connection.state.name == 'CLOSED':
+                        return
+                    continue
+                with self.lock:
+                    self.unacked[message_id] = frame
+                connection.send(frame)
+        except Exception:
+            pass  # Connection closed; unacked frames are redelivered on reconnect
+
+    def _read_acks(self, connection):
+        try:
+            for raw in connection:
+                message_id = json.loads(raw).get('messageId')
+                with self.lock:
+                    if self.unacked.pop(message_id, None) is not None:
+                        self.acked += 1
+        except Exception:
+            pass
+
+
+def start_mock_mq(access_id='mock-access-id', access_secret='mock-access-secret-0123456789',
+                  host='127.0.0.1', port=0):
+    """Start the stand-in broker in a background thread.
+
+    Returns (server, broker); the consumer URL is ws://host:server.socket.getsockname()[1]/
+    """
+    broker = MockTuyaMQ(access_id, access_secret)
+    server = serve(broker.handle, host, port, process_request=broker.process_request)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, broker
+
+
+if __name__ == "__main__":
+    server, broker = start_mock_mq(port=8285)
+    print(f"Mock Tuya message queue at ws://127.0.0.1:8285{broker.path}")
+    print(f"access_id={broker.access_id} access_secret={broker.access_secret}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,348 @@
+import os
+import ssl
+import hmac
+import json
+import hashlib
+import subprocess
+import threading
+import time
+import random
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+
+def make_device(device_id, switch_on=False):
+    """Build a device info payload shaped like /v1.0/devices/{device_id}"""
+    now = int(time.time())
+    return {
+        'id': device_id,
+        'name': f'Mock plug {device_id[-6:]}',
+        'category': 'cz',
+        'online': True,
+        'active_time': now - 86400,
+        'create_time': now - 86400,
+        'update_time': now,
+        'ip': '127.0.0.1',
+        'model': 'MOCK-PLUG',
+        'time_zone': '+00:00',
+        'status': [
+            {'code': 'switch_1', 'value': switch_on},
+            {'code': 'countdown_1', 'value': 0},
+        ],
+    }
+
+
+class MockTuyaState:
+    """Shared state of the mock Tuya cloud: devices and request counters"""
+
+    def __init__(self, num_devices=0, latency=0.02, token_ttl=7200, rate_limit=None, error_rate=0.0,
+                 access_secret=None, unauthorized_rate=0.0, flip_rate=0.0):
+        self.latency = latency
+        self.error_rate = error_rate  # Fraction of device commands answered with a 503
+        self.access_secret = access_secret  # Signatures are checked against it, if set
+        self.unauthorized_rate = unauthorized_rate  # Fraction of requests answered with a 401
+        self.flip_rate = flip_rate  # switch_1 flips per second across the fleet
+        self.token_ttl = token_ttl
+        self.rate_limit = rate_limit  # Requests per second before code 1110, None for no limit
+        self._allowance = rate_limit or 0
+        self._allowance_at = time.monotonic()
+        self.rate_limited = 0
+        self.lock = threading.Lock()
+        self.devices = {}
+        self.tokens = {}  # access_token -> expiry (time.time())
+        self.request_count = 0
+        self.token_requests = 0
+        self.rejected_tokens = 0
+        self.command_errors = 0
+        self.bad_signatures = 0
+        self.unauthorized = 0
+        self.flips = {}  # device_id -> times its switch_1 flipped
+        for i in range(num_devices):
+            device_id = f'mockdev{i:08d}'
+            self.devices[device_id] = make_device(device_id)
+
+    @property
+    def device_ids(self):
+        return list(self.devices)
+
+    def count_request(self):
+        with self.lock:
+            self.request_count += 1
+
+    def reset_counters(self):
+        with self.lock:
+            self.request_count = 0
+            self.token_requests = 0
+            self.rejected_tokens = 0
+            self.rate_limited = 0
+            self.command_errors = 0
+            self.bad_signatures = 0
+            self.unauthorized = 0
+
+    def counters(self):
+        with self.lock:
+            return {
+                'requests': self.request_count, 'token_requests': self.token_requests,
+                'rejected_tokens': self.rejected_tokens, 'rate_limited': self.rate_limited,
+                'command_errors': self.command_errors, 'bad_signatures': self.bad_signatures,
+                'unauthorized': self.unauthorized, 'flips': sum(len(times) for times in self.flips.values()),
+            }
+
+    def within_rate_limit(self):
+        if not self.rate_limit:
+            return True
+        with self.lock:
+            now = time.monotonic()
+            self._allowance = min(self.rate_limit,
+                                  self._allowance + (now - self._allowance_at) * self.rate_limit)
+            self._allowance_at = now
+            if self._allowance < 1:
+                self.rate_limited += 1
+                return False
+            self._allowance -= 1
+            return True
+
+    def command_fails(self):
+        if not self.error_rate or random.random() >= self.error_rate:
+            return False
+        with self.lock:
+            self.command_errors += 1
+        return True
+
+    def signature_valid(self, method, path, body, headers):
+        """Check the sign header the way Tuya does; always True without access_secret"""
+        if self.access_secret is None:
+            return True
+        access_token = '' if path.startswith('/v1.0/token') else headers.get('access_token', '')
+        string_to_sign = f"{method}\n{hashlib.sha256(body).hexdigest()}\n\n{path}"
+        message = (f"{headers.get('client_id', '')}{access_token}{headers.get('t', '')}"
+                   f"{headers.get('nonce', '')}{string_to_sign}")
+        expected = hmac.new(self.access_secret.encode(), message.encode(), hashlib.sha256).hexdigest().upper()
+        if hmac.compare_digest(expected, headers.get('sign', '')):
+            return True
+        with self.lock:
+            self.bad_signatures += 1
+        return False
+
+    def revoke_at_random(self, access_token):
+        """Revoke the token of unauthorized_rate of requests, which then get a 401"""
+        if not self.unauthorized_rate or random.random() >= self.unauthorized_rate:
+            return False
+        with self.lock:
+            self.tokens.pop(access_token, None)
+            self.unauthorized += 1
+        return True
+
+    def flip(self, device_id):
+        with self.lock:
+            for item in self.devices[device_id]['status']:
+                if item['code'] == 'switch_1':
+                    item['value'] = not item['value']
+            self.flips.setdefault(device_id, []).append(time.time())
+
+    def run_flips(self, stop, tick=0.05):
+        """Flip random devices at flip_rate per second until stop is set"""
+        device_ids = self.device_ids
+        owed = 0.0
+        while device_ids and not stop.wait(tick):
+            owed += self.flip_rate * tick
+            while owed >= 1:
+                self.flip(random.choice(device_ids))
+                owed -= 1
+
+    def issue_token(self):
+        with self.lock:
+            self.token_requests += 1
+            access_token = f'mock-access-token-{self.token_requests}-{time.time():.6f}'
+            self.tokens[access_token] = time.time() + self.token_ttl
+        return access_token
+
+    def token_valid(self, access_token):
+        with self.lock:
+            valid = self.tokens.get(access_token, 0) > time.time()
+            if not valid:
+                self.rejected_tokens += 1
+        return valid
+
+
+class MockTuyaHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True  # Headers and body are written separately
+    state = None  # Set by start_mock_server
+
+    def log_message(self, format, *args):
+        pass  # Keep benchmark output clean
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _ok(self, result):
+        self._send_json({'success': True, 't': int(time.time() * 1000), 'result': result})
+
+    def _fail(self, code, msg, status=200):
+        self._send_json({'success': False, 'code': code, 'msg': msg, 't': int(time.time() * 1000)}, status)
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _begin(self):
+        self.state.count_request()
+        if self.state.latency:
+            time.sleep(self.state.latency)
+        parts = urlsplit(self.path)
+        return [p for p in parts.path.split('/') if p], parse_qs(parts.query)
+
+    def _signed(self, body=b''):
+        if not self.state.signature_valid(self.command, self.path, body, self.headers):
+            self._fail(1004, 'sign invalid')
+            return False
+        return True
+
+    def _authorized(self, body=b''):
+        if not self._signed(body):
+            return False
+        if self.state.revoke_at_random(self.headers.get('access_token')):
+            self._fail(1010, 'token invalid', status=401)
+            return False
+        # Like Tuya, an expired or unknown token and an exceeded quota are HTTP 200 with an error code
+        if not self.state.token_valid(self.headers.get('access_token')):
+            self._fail(1010, 'token invalid')
+            return False
+        if not self.state.within_rate_limit():
+            self._fail(1110, 'request frequency over limit')
+            return False
+        return True
+
+    def do_GET(self):
+        path, query = self._begin()
+
+        if path[:2] == ['v1.0', 'token']:
+            if not self._signed():
+                return
+            return self._ok({
+                'access_token': self.state.issue_token(),
+                'refresh_token': 'mock-refresh-token',
+                'expire_time': self.state.token_ttl,
+                'uid': 'mock-uid',
+            })
+
+        if not self._authorized():
+            return
+
+        if path == ['v1.0', 'devices']:
+            requested = query.get('device_ids', [''])[0].split(',')
+            devices = [self.state.devices[d] for d in requested if d in self.state.devices]
+            return self._ok({'devices': devices, 'total': len(devices), 'has_more': False})
+
+        if len(path) >= 3 and path[:2] == ['v1.0', 'devices']:
+            device = self.state.devices.get(path[2])
+            if device is None:
+                return self._fail(2001, 'device not found')
+            if len(path) == 3:
+                return self._ok(device)
+            if path[3:] == ['status']:
+                return self._ok(device['status'])
+
+        self._fail(1108, 'uri path invalid', status=404)
+
+    def do_POST(self):
+        path, _ = self._begin()
+        raw_body = self._read_body()  # Consume it even when failing, or it corrupts the next keep-alive request
+        if not self._authorized(raw_body):
+            return
+        body = json.loads(raw_body) if raw_body else {}
+
+        if len(path) == 4 and path[:2] == ['v1.0', 'devices'] and path[3] == 'commands':
+            device = self.state.devices.get(path[2])
+            if device is None:
+                return self._fail(2001, 'device not found')
+            if self.state.command_fails():
+                return self._fail(500, 'system error, please contact the admin', status=503)
+            commands = {c.get('code'): c.get('value') for c in body.get('commands', [])}
+            with self.state.lock:
+                for item in device['status']:
+                    if item['code'] in commands:
+                        item['value'] = commands[item['code']]
+            return self._ok(True)
+
+        self._fail(1108, 'uri path invalid', status=404)
+
+
+class _MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stopped = threading.Event()  # Stops the switch flipper
+
+    def shutdown(self):
+        self.stopped.set()
+        super().shutdown()
+
+
+def unlimited_rate_limiter():
+    """A RateLimiter that never waits, for benchmarks that measure the transport"""
+    from tuya.rate_limit import RateLimiter
+    return RateLimiter(limits={'default': 1e9, 'devices': 1e9, 'commands': 1e9, 'token': 1e9})
+
+
+def generate_self_signed_cert(directory):
+    """Create a throwaway certificate for 127.0.0.1 with the openssl CLI.
+
+    Returns (certfile, keyfile).
+    """
+    certfile = os.path.join(directory, 'mock_tuya_cert.pem')
+    keyfile = os.path.join(directory, 'mock_tuya_key.pem')
+    subprocess.run([
+        'openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes',
+        '-keyout', keyfile, '-out', certfile, '-days', '1',
+        '-subj', '/CN=localhost',
+        '-addext', 'subjectAltName=IP:127.0.0.1,DNS:localhost',
+    ], check=True, capture_output=True)
+    return certfile, keyfile
+
+
+def start_mock_server(num_devices=0, latency=0.02, host='127.0.0.1', port=0, tls=None, token_ttl=7200,
+                      rate_limit=None, error_rate=0.0, access_secret=None, unauthorized_rate=0.0,
+                      flip_rate=0.0):
+    """Start the mock Tuya API in a background thread.
+
+    Pass tls=(certfile, keyfile) to serve HTTPS instead of HTTP. Access tokens
+    expire after token_ttl seconds; rate_limit caps requests per second and
+    error_rate is the fraction of device commands that fail with a 503.
+    With access_secret set, requests with a wrong signature get code 1004.
+    unauthorized_rate is the fraction of requests whose token is revoked and
+    answered with a 401, and flip_rate flips that many random switches per
+    second (recorded in state.flips).
+    Returns (server, state); the endpoint is f"{scheme}://{host}:{server.server_port}".
+    Call server.shutdown() when done.
+    """
+    state = MockTuyaState(num_devices, latency, token_ttl, rate_limit, error_rate,
+                          access_secret, unauthorized_rate, flip_rate)
+    handler = type('BoundMockTuyaHandler', (MockTuyaHandler,), {'state': state})
+    server = _MockServer((host, port), handler)
+    if tls:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(*tls)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    if flip_rate:
+        threading.Thread(target=state.run_flips, args=(server.stopped,), daemon=True).start()
+    return server, state
+
+
+if __name__ == "__main__":
+    server, state = start_mock_server(num_devices=10, port=8765)
+    print(f"Mock Tuya API running on http://127.0.0.1:{server.server_port}")
+    print("Device IDs:", state.device_ids)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,135 @@
+import sys
+import os
+import math
+import random
+import bisect
+import argparse
+import statistics
+
+# Add the root directory to Python path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(current_dir)
+sys.path.append(root_dir)
+
+from utils.scheduler import AdaptivePollScheduler
+
+# (share of fleet, mean seconds between bursts of activity); None means offline
+DEVICE_PROFILES = {
+    'busy': (0.10, 300),
+    'normal': (0.30, 1800),
+    'stable': (0.50, 6 * 3600),
+    'offline': (0.10, None),
+}
+BURST_CHANGES = (1, 4)  # Changes per burst, e.g. a plug toggled a few times in a row
+BURST_GAP = 20  # Mean seconds between changes within a burst
+BATCH_SIZE = 20
+
+def generate_fleet(devices, duration, seed):
+    """Return {device_id: (profile, sorted change times)}.
+
+    Bursts arrive as a Poisson process per device; each burst is a few
+    changes close together, which is what adaptive polling relies on.
+    """
+    rng = random.Random(seed)
+    fleet = {}
+    names = list(DEVICE_PROFILES)
+    weights = [DEVICE_PROFILES[name][0] for name in names]
+    for i in range(devices):
+        profile = rng.choices(names, weights)[0]
+        mean_gap = DEVICE_PROFILES[profile][1]
+        changes = []
+        if mean_gap:
+            t = rng.expovariate(1 / mean_gap)
+            while t < duration:
+                for _ in range(rng.randint(*BURST_CHANGES)):
+                    if t < duration:
+                        changes.append(t)
+                    t += rng.expovariate(1 / BURST_GAP)
+                t += rng.expovariate(1 / mean_gap)
+        fleet[f'simdev{i:06d}'] = (profile, changes)
+    return fleet
+
+def simulate(fleet, duration, **scheduler_options):
+    """Run the scheduler against the fleet in simulated time.
+
+    Returns (api_calls, detection latencies, changes missed because the
+    device changed more than once between two polls).
+    """
+    scheduler = AdaptivePollScheduler(list(fleet), batch_size=BATCH_SIZE, now=0.0, **scheduler_options)
+    last_poll = {device_id: 0.0 for device_id in fleet}
+    calls = 0
+    latencies = []
+    missed = 0
+
+    now = 0.0
+    while True:
+        now = scheduler.next_due_time(now)
+        if now is None or now >= duration:
+            break
+        due_ids = scheduler.due(now)
+        calls += math.ceil(len(due_ids) / BATCH_SIZE)
+
+        for device_id in due_ids:
+            profile, changes = fleet[device_id]
+            if profile == 'offline':
+                scheduler.record(device_id, changed=False, ok=False, now=now)
+                continue
+            # Changes since the previous poll; the first one waited longest
+            first = bisect.bisect_right(changes, last_poll[device_id])
+            last = bisect.bisect_right(changes, now)
+            if last > first:
+                latencies.append(now - changes[first])
+                missed += last - first - 1
+            last_poll[device_id] = now
+            scheduler.record(device_id, changed=last > first, now=now)
+
+    return calls, latencies, missed
+
+def summarize(label, calls, latencies, missed):
+    mean = statistics.mean(latencies) if latencies else 0.0
+    p95 = sorted(latencies)[int(len(latencies) * 0.95)] if latencies else 0.0
+    print(f"{label:<32} {calls:<10} {mean:<12.1f} {p95:<12.1f} {missed:<8}")
+    return mean, p95
+
+def compare(calls, fixed_calls):
+    """'24% fewer' or '5% more' calls than fixed_calls"""
+    change = 100 * (calls / fixed_calls - 1) if fixed_calls else 0.0
+    return f"{abs(change):.0f}% {'fewer' if change < 0 else 'more'}"
+
+def simulate_fixed(fleet, duration, interval):
+    return simulate(fleet, duration, min_interval=interval, max_interval=interval,
+                    backoff=1.0, offline_interval=interval, batch_window=0)
+
+def run_simulation(devices=1000, hours=24, seed=1, min_interval=5):
+    duration = hours * 3600
+    fleet = generate_fleet(devices, duration, seed)
+    counts = {name: sum(1 for p, _ in fleet.values() if p == name) for name in DEVICE_PROFILES}
+    print(f"{devices} devices over {hours} h simulated: {counts}")
+    print("-" * 80)
+    print(f"{'Policy':<32} {'API calls':<10} {'Mean lat (s)':<12} {'p95 lat (s)':<12} {'Missed':<8}")
+    print("-" * 80)
+
+    for interval in (min_interval, 15, 30, 60):
+        summarize(f"Fixed {interval} s", *simulate_fixed(fleet, duration, interval))
+
+    print("-" * 80)
+    for max_interval in (30, 60, 120, 300):
+        calls, latencies, missed = simulate(
+            fleet, duration, min_interval=min_interval, max_interval=max_interval,
+            backoff=1.5, offline_interval=300, batch_window=min_interval
+        )
+        mean, p95 = summarize(f"Adaptive {min_interval}-{max_interval} s", calls, latencies, missed)
+        # A fixed interval I detects changes after about I/2 on average
+        fixed_interval = max(round(2 * mean), min_interval)
+        fixed_calls, fixed_latencies, fixed_missed = simulate_fixed(fleet, duration, fixed_interval)
+        _, fixed_p95 = summarize(f"  vs fixed {fixed_interval} s", fixed_calls, fixed_latencies, fixed_missed)
+        print(f"  Adaptive: {compare(calls, fixed_calls)} calls, p95 {p95:.1f} s vs {fixed_p95:.1f} s, "
+              f"{missed} vs {fixed_missed} missed")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate fixed vs adaptive polling")
+    parser.add_argument('--devices', type=int, default=1000)
+    parser.add_argument('--hours', type=float, default=24)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    run_simulation(args.devices, args.hours, args.seed)
@@ -0,0 +1,173 @@
+import sys
+import os
+import time
+import queue
+import argparse
+import multiprocessing
+
+# Add the root directory to Python path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(current_dir)
+sys.path.append(root_dir)
+
+from utils.sharding import ShardCoordinator, rendezvous_owner
+
+REPORT_INTERVAL = 0.1
+
+
+class SharedLeases:
+    """WorkerLeases stand-in backed by a dict shared between local processes (--no-db)"""
+
+    def __init__(self, table, lock, worker_id, lease_ttl):
+        self.table = table
+        self.lock = lock
+        self.worker_id = worker_id
+        self.lease_ttl = lease_ttl
+
+    def heartbeat(self):
+        with self.lock:
+            now = time.time()
+            self.table[self.worker_id] = now
+            return [worker_id for worker_id, at in self.table.items() if at > now - self.lease_ttl]
+
+    def leave(self):
+        with self.lock:
+            self.table.pop(self.worker_id, None)
+
+
+def run_worker(worker_id, device_ids, reports, lease_ttl, table=None, lock=None):
+    """One monitor worker: follow the coordinator and report what it owns"""
+    leases = SharedLeases(table, lock, worker_id, lease_ttl) if table is not None else None
+    coordinator = ShardCoordinator(device_ids, worker_id=worker_id, lease_ttl=lease_ttl,
+                                   heartbeat_interval=lease_ttl / 3, leases=leases)
+    coordinator.start()
+    try:
+        while True:
+            coordinator.changes()
+            reports.put((worker_id, frozenset(coordinator.owned())))
+            time.sleep(REPORT_INTERVAL)
+    finally:
+        coordinator.stop()
+
+
+class Pool:
+    def __init__(self, device_ids, lease_ttl, use_db):
+        self.device_ids = device_ids
+        self.lease_ttl = lease_ttl
+        self.reports = multiprocessing.Queue()
+        self.processes = {}
+        self.owned = {}  # worker_id -> devices it reported last
+        self.max_overlap = 0
+        self.shared = None
+        if not use_db:
+            manager = multiprocessing.Manager()
+            self.shared = (manager.dict(), manager.Lock())
+        self._next_id = 0
+
+    def start_worker(self):
+        worker_id = f'worker-{self._next_id}'
+        self._next_id += 1
+        args = (worker_id, self.device_ids, self.reports, self.lease_ttl) + (self.shared or ())
+        process = multiprocessing.Process(target=run_worker, args=args, daemon=True)
+        process.start()
+        self.processes[worker_id] = process
+        return worker_id
+
+    def kill_worker(self, worker_id):
+        # SIGKILL: no chance to leave the pool, like a crashed host
+        self.processes.pop(worker_id).kill()
+        self.owned.pop(worker_id, None)
+
+    def stop(self):
+        for process in self.processes.values():
+            process.terminate()
+
+    def wait_balanced(self, timeout):
+        """Wait until each live worker owns exactly its share; returns seconds taken or None"""
+        expected = {worker_id: set() for worker_id in self.processes}
+        for device_id in self.device_ids:
+            expected[rendezvous_owner(device_id, self.processes)].add(device_id)
+        start = time.perf_counter()
+        while time.perf_counter() - start < timeout:
+            try:
+                worker_id, owned = self.reports.get(timeout=REPORT_INTERVAL)
+            except queue.Empty:
+                continue
+            if worker_id not in self.processes:
+                continue  # Late report from a killed worker
+            self.owned[worker_id] = owned
+            self.max_overlap = max(self.max_overlap, self.overlap())
+            if all(self.owned.get(worker_id) == owned for worker_id, owned in expected.items()):
+                return time.perf_counter() - start
+        return None
+
+    def overlap(self):
+        """Devices currently owned by more than one live worker"""
+        counts = {}
+        for owned in self.owned.values():
+            for device_id in owned:
+                counts[device_id] = counts.get(device_id, 0) + 1
+        return sum(1 for count in counts.values() if count > 1)
+
+    def snapshot(self):
+        return {worker_id: set(owned) for worker_id, owned in self.owned.items()}
+
+
+def moved(before, after, ignore=()):
+    """Devices whose owner changed between two snapshots, except those of `ignore` workers"""
+    owner_before = {d: w for w, owned in before.items() for d in owned}
+    owner_after = {d: w for w, owned in after.items() for d in owned}
+    return sum(1 for d, w in owner_before.items()
+               if w not in ignore and owner_after.get(d) != w)
+
+
+def run_simulation(workers=4, devices=1000, lease_ttl=3.0, use_db=True):
+    device_ids = [f'device{i:06d}' for i in range(devices)]
+    pool = Pool(device_ids, lease_ttl, use_db)
+    timeout = lease_ttl * 5
+    print(f"{workers} workers, {devices} devices, lease TTL {lease_ttl:g} s "
+          f"({'monitor_workers table' if use_db else 'shared in-memory leases'})")
+    print("-" * 72)
+    try:
+        for _ in range(workers):
+            pool.start_worker()
+        elapsed = pool.wait_balanced(timeout)
+        print(f"Initial assignment:   {elapsed:.2f} s" if elapsed is not None else "Initial assignment timed out")
+        shares = sorted(len(owned) for owned in pool.owned.values())
+        print(f"Devices per worker:   {shares} (ideal {devices / workers:.0f})")
+
+        before = pool.snapshot()
+        victim = next(iter(pool.processes))
+        pool.kill_worker(victim)
+        pool.max_overlap = 0
+        elapsed = pool.wait_balanced(timeout)
+        after = pool.snapshot()
+        print(f"Worker killed:        {len(before[victim])} orphaned devices taken over in "
+              + (f"{elapsed:.2f} s" if elapsed is not None else "(timed out)")
+              + f", {moved(before, after, ignore=(victim,))} other devices moved")
+
+        before = after
+        pool.max_overlap = 0
+        joined = pool.start_worker()
+        elapsed = pool.wait_balanced(timeout)
+        after = pool.snapshot()
+        print(f"Worker joined:        {len(after.get(joined, ()))} devices moved to it in "
+              + (f"{elapsed:.2f} s" if elapsed is not None else "(timed out)")
+              + f", {moved(before, after) - len(after.get(joined, ()))} moved elsewhere, "
+              f"at most {pool.max_overlap} owned twice during the handoff")
+    finally:
+        pool.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run sharded monitor workers as local processes")
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--devices', type=int, default=1000)
+    parser.add_argument('--lease-ttl', type=float, default=3.0)
+    parser.add_argument('--no-db', action='store_true', help="Share leases in memory instead of the database")
+    args = parser.parse_args()
+    run_simulation(args.workers, args.devices, args.lease_ttl, use_db=not args.no_db)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+import os
+import json
+import threading
+
+from database.storage import get_storage
+
+# Interned datapoint codes ('switch_1', 'cur_power', ...) and one narrow row per
+# changed value. Exactly one value_* column is set, chosen by the value's type.
+CREATE_DATAPOINT_TABLES_SQL = '''
+IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = 'datapoint_codes')
+BEGIN
+    CREATE TABLE datapoint_codes (
+        code_id SMALLINT IDENTITY(1,1) PRIMARY KEY,
+        code VARCHAR(64) NOT NULL UNIQUE
+    )
+END
+
+IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = 'device_datapoints')
+BEGIN
+    CREATE TABLE device_datapoints (
+        id BIGINT IDENTITY(1,1) PRIMARY KEY,
+        device_id VARCHAR(255) NOT NULL,
+        code_id SMALLINT NOT NULL,
+        timestamp BIGINT NOT NULL,
+        value_bool BIT NULL,
+        value_int BIGINT NULL,
+        value_float FLOAT NULL,
+        value_text NVARCHAR(MAX) NULL,
+        CONSTRAINT FK_device_datapoints_devices FOREIGN KEY (device_id)
+            REFERENCES devices(device_id),
+        CONSTRAINT FK_device_datapoints_codes FOREIGN KEY (code_id)
+            REFERENCES datapoint_codes(code_id)
+    )
+    CREATE NONCLUSTERED INDEX IX_device_datapoints_device_code_time
+    ON device_datapoints (device_id, code_id, timestamp DESC, id DESC)
+    INCLUDE (value_bool, value_int, value_float, value_text)
+END
+
+-- Tables created with NVARCHAR(255): list and dict values are JSON and can be longer
+IF EXISTS (SELECT * FROM sys.columns WHERE object_id = OBJECT_ID('device_datapoints')
+           AND name = 'value_text' AND max_length <> -1)
+BEGIN
+    DROP INDEX IX_device_datapoints_device_code_time ON device_datapoints
+    ALTER TABLE device_datapoints ALTER COLUMN value_text NVARCHAR(MAX) NULL
+    CREATE NONCLUSTERED INDEX IX_device_datapoints_device_code_time
+    ON device_datapoints (device_id, code_id, timestamp DESC, id DESC)
+    INCLUDE (value_bool, value_int, value_float, value_text)
+END
+'''
+
+def normalize_value(value):
+    """Scalars are kept as is; lists and dicts become the JSON text they are stored as"""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return json.dumps(value, separators=(',', ':'), sort_keys=True)
+
+def typed_value(value):
+    """Split a datapoint value into (value_bool, value_int, value_float, value_text)"""
+    value = normalize_value(value)
+    if isinstance(value, bool):
+        return (value, None, None, None)
+    if isinstance(value, int):
+        return (None, value, None, None)
+    if isinstance(value, float):
+        return (None, None, value, None)
+    return (None, None, None, value)
+
+def stored_value(value_bool, value_int, value_float, value_text):
+    """Inverse of typed_value for a row read back from device_datapoints"""
+    if value_bool is not None:
+        return bool(value_bool)
+    if value_int is not None:
+        return value_int
+    if value_float is not None:
+        return value_float
+    return value_text
+
+def parse_deadbands(spec):
+    """Parse 'cur_power=5,cur_voltage=2' into {'cur_power': 5.0, 'cur_voltage': 2.0}"""
+    deadbands = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        code, _, amount = item.partition('=')
+        deadbands[code.strip()] = float(amount)
+    return deadbands
+
+class DatapointCodes:
+    """Interning dictionary of datapoint codes to their SMALLINT ids"""
+
+    def __init__(self, storage=None):
+        self.storage = storage  # StatusStorage; the configured backend by default
+        self._ids = {}
+        self._lock = threading.Lock()
+
+    def load(self):
+        ids = (self.storage or get_storage()).datapoint_codes()
+        with self._lock:
+            self._ids.update(ids)
+        return len(ids)
+
+    def by_id(self):
+        """{code_id: code} of every known code"""
+        with self._lock:
+            return {code_id: code for code, code_id in self._ids.items()}
+
+    def code_id(self, code):
+        """Return the id of code, registering it on first use"""
+        with self._lock:
+            code_id = self._ids.get(code)
+        if code_id is not None:
+            return code_id
+
+        code_id = (self.storage or get_storage()).register_code(code)
+        with self._lock:
+            self._ids[code] = code_id
+        return code_id
+
+class DatapointTracker:
+    """Per-datapoint change detection for every status code a device reports.
+
+    Only datapoints whose value changed produce a row, so tracking more codes
+    adds rows in proportion to how often those values change, not to how
+    often devices are polled. Numeric codes with a deadband (DATAPOINT_DEADBANDS,
+    e.g. 'cur_power=5') only count as changed when they move by at least that
+    much. DATAPOINT_CODES restricts tracking to a comma-separated allowlist.
+    """
+
+    def __init__(self, codes=None, tracked_codes=None, deadbands=None, storage=None):
+        self.storage = storage  # StatusStorage; the configured backend by default
+        self.codes = codes or DatapointCodes(storage)
+        if tracked_codes is None:
+            tracked_codes = [c.strip() for c in os.getenv('DATAPOINT_CODES', '').split(',') if c.strip()]
+        self.tracked_codes = set(tracked_codes) or None  # None tracks every code
+        if deadbands is None:
+            deadbands = parse_deadbands(os.getenv('DATAPOINT_DEADBANDS', ''))
+        self.deadbands = deadbands
+        self._latest = {}  # (device_id, code) -> last stored value
+        self._lock = threading.Lock()
+
+    def load(self, pending=()):
+        """Load interned codes and the latest value of every datapoint.
+
+        pending are datapoint rows (see rows()) that are not stored yet, e.g.
+        from a spool; they override the stored values.
+        """
+        self.codes.load()
+        rows = (self.storage or get_storage()).latest_datapoints()
+        with self._lock:
+            self._latest = {(row[1], row[0]): stored_value(*row[2:]) for row in rows}
+        self.seed(pending)
+        return len(rows)
+
+    def seed(self, pending):
+        """Apply datapoint rows that are not stored yet, in order, without reading them
+        from the database"""
+        codes = self.codes.by_id()  # Spools written before rows carried codes hold ids
+        with self._lock:
+            for device_id, code, _, *value in pending:
+                code = codes.get(code) if isinstance(code, int) else code
+                if code is not None:
+                    self._latest[(device_id, code)] = stored_value(*value)
+
+    def diff(self, device_id, status):
+        """Return [(code, value)] for datapoints in status that changed.
+
+        Call record() once the changes are queued for writing; until then
+        they count as changed again.
+        """
+        changes = []
+        with self._lock:
+            for code, value in status.items():
+                if self.tracked_codes is not None and code not in self.tracked_codes:
+                    continue
+                value = normalize_value(value)
+                key = (device_id, code)
+                if key in self._latest and not self._changed(code, self._latest[key], value):
+                    continue
+                changes.append((code, value))
+        return changes
+
+    def record(self, device_id, changes):
+        """Remember diff() output as the latest stored values"""
+        with self._lock:
+            for code, value in changes:
+                self._latest[(device_id, code)] = value
+
+    def rows(self, device_id, timestamp, changes):
+        """Turn diff() output into (device_id, code, timestamp, value_bool, value_int,
+        value_float, value_text) rows for WriteBehindQueue.enqueue.
+
+        Rows carry the code itself; the writer turns it into a code_id when it
+        flushes, so queueing a change never needs the database.
+        """
+        return [(device_id, code, timestamp, *typed_value(value)) for code, value in changes]
+
+    def _changed(self, code, previous, value):
+        deadband = self.deadbands.get(code)
+        if (deadband and isinstance(previous, (int, float)) and isinstance(value, (int, float))
+                and not isinstance(value, bool)):
+            return abs(value - previous) >= deadband
+        return previous != value
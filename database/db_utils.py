@@ -1,22 +1,29 @@
 from dotenv import load_dotenv
+from contextlib import contextmanager
+from collections import deque
 import os
+import time
+import threading
+import logging
 import pyodbc
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+def get_connection_string():
+    """Build the ODBC connection string from environment variables"""
+    return (
+        f'DRIVER={os.getenv("DB_DRIVER")};'
+        f'SERVER={os.getenv("DB_SERVER")};'
+        f'DATABASE={os.getenv("DB_NAME")};'
+        f'Trusted_Connection={os.getenv("DB_TRUSTED_CONNECTION")};'
+    )
+
 def get_db_connection():
-    """Create and return a database connection using environment variables"""
+    """Create and return a new (unpooled) database connection using environment variables"""
     try:
-        connection_string = (
-            f'DRIVER={os.getenv("DB_DRIVER")};'
-            f'SERVER={os.getenv("DB_SERVER")};'
-            f'DATABASE={os.getenv("DB_NAME")};'
-            f'Trusted_Connection={os.getenv("DB_TRUSTED_CONNECTION")};'
-        )
-        print(f"Attempting to connect with: {connection_string}")  # Debug connection string
-        
-        conn = pyodbc.connect(connection_string)
-        return conn
+        return pyodbc.connect(get_connection_string())
     except pyodbc.Error as e:
         print(f"Error connecting to database: {e}")
         # List available drivers
@@ -25,11 +32,189 @@ def get_db_connection():
             print(f"  - {driver}")
         raise
 
+class ConnectionPool:
+    """Thread-safe pool of database connections.
+
+    Connections are created on demand up to max_size and handed out most
+    recently used first. A connection that has been idle longer than
+    health_check_interval is checked with SELECT 1 before it is reused, and
+    idle connections above min_size are closed after idle_timeout seconds.
+    """
+
+    def __init__(self, connect=get_db_connection, min_size=1, max_size=5,
+                 idle_timeout=300, health_check_interval=30, acquire_timeout=30):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Pool sizes must satisfy 0 <= min_size <= max_size and max_size >= 1")
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.acquire_timeout = acquire_timeout
+
+        self._idle = deque()  # (connection, last_used) pairs, most recent on the right
+        self._size = 0  # Connections currently open, idle or borrowed
+        self._closed = False
+        self._cond = threading.Condition()
+        self._stats = {'created': 0, 'reused': 0, 'discarded': 0, 'evicted': 0, 'waits': 0}
+
+    def acquire(self, timeout=None):
+        """Borrow a connection, waiting up to timeout seconds if the pool is exhausted"""
+        timeout = self.acquire_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+
+        while True:
+            with self._cond:
+                if self._closed:
+                    raise RuntimeError("Connection pool is closed")
+                self._evict_idle()
+
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                elif self._size < self.max_size:
+                    conn, last_used = None, None
+                    self._size += 1
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError(f"No database connection available within {timeout} seconds")
+                    self._stats['waits'] += 1
+                    self._cond.wait(remaining)
+                    continue
+
+            # Connect and health-check outside the lock so other borrowers are not blocked
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    self._forget()
+                    raise
+                self._count('created')
+                return conn
+
+            if time.monotonic() - last_used < self.health_check_interval or self._is_healthy(conn):
+                self._count('reused')
+                return conn
+            self._discard(conn)
+
+    def release(self, conn, discard=False):
+        """Return a borrowed connection; uncommitted work is rolled back"""
+        if not discard:
+            try:
+                conn.rollback()
+            except pyodbc.Error:
+                discard = True
+
+        if discard or self._closed:
+            self._discard(conn)
+            return
+
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._evict_idle()
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """Borrow a connection for the duration of a with block.
+
+        Callers commit explicitly, as with a plain connection. If the block
+        raises, the transaction is rolled back, and a connection broken by a
+        database error is discarded instead of returned to the pool.
+        """
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        except pyodbc.Error:
+            self.release(conn, discard=not self._is_healthy(conn))
+            raise
+        except BaseException:
+            self.release(conn)
+            raise
+        else:
+            self.release(conn)
+
+    def stats(self):
+        """Return pool counters: open/idle connections and lifetime totals"""
+        with self._cond:
+            return dict(self._stats, size=self._size, idle=len(self._idle))
+
+    def close(self):
+        """Close idle connections; borrowed ones are closed when released"""
+        with self._cond:
+            self._closed = True
+            idle = [conn for conn, _ in self._idle]
+            self._idle.clear()
+            self._cond.notify_all()
+        for conn in idle:
+            self._discard(conn)
+
+    def _evict_idle(self):
+        # Caller holds self._cond. The oldest idle connections sit on the left.
+        now = time.monotonic()
+        while self._idle and self._size > self.min_size and now - self._idle[0][1] > self.idle_timeout:
+            conn, _ = self._idle.popleft()
+            self._size -= 1
+            self._stats['evicted'] += 1
+            self._close_quietly(conn)
+
+    def _is_healthy(self, conn):
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            cursor.close()
+            return True
+        except pyodbc.Error:
+            return False
+
+    def _count(self, name):
+        with self._cond:
+            self._stats[name] += 1
+
+    def _discard(self, conn):
+        self._close_quietly(conn)
+        self._count('discarded')
+        self._forget()
+
+    def _forget(self):
+        # Give up a slot, waking one borrower waiting for capacity
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def _close_quietly(self, conn):
+        try:
+            conn.close()
+        except pyodbc.Error as e:
+            logger.debug(f"Error closing pooled connection: {e}")
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Return the process-wide connection pool, configured from environment variables"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    min_size=int(os.getenv('DB_POOL_MIN_SIZE', '1')),
+                    max_size=int(os.getenv('DB_POOL_MAX_SIZE', '5')),
+                    idle_timeout=float(os.getenv('DB_POOL_IDLE_TIMEOUT', '300')),
+                    health_check_interval=float(os.getenv('DB_POOL_HEALTH_CHECK_INTERVAL', '30')),
+                    acquire_timeout=float(os.getenv('DB_POOL_ACQUIRE_TIMEOUT', '30'))
+                )
+    return _pool
+
+def db_connection(timeout=None):
+    """Borrow a pooled connection: `with db_connection() as conn: ...`"""
+    return get_pool().connection(timeout)
+
 if __name__ == "__main__":
     # Test the connection
     try:
-        conn = get_db_connection()
-        print("Successfully connected to database!")
-        conn.close()
+        with db_connection() as conn:
+            print("Successfully connected to database!")
     except Exception as e:
-        print(f"Connection test failed: {e}")
\ No newline at end of file
+        print(f"Connection test failed: {e}")
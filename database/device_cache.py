@@ -0,0 +1,57 @@
+import hashlib
+import threading
+
+from database.storage import get_storage
+
+def fingerprint(row):
+    """Hash a devices row so values from the API and from the database compare equal"""
+    device_id, name, category, online, *rest = row
+    normalized = (device_id, name, category, None if online is None else bool(online), *rest)
+    return hashlib.blake2b(repr(normalized).encode(), digest_size=16).digest()
+
+class DeviceMetadataCache:
+    """In-process fingerprints of the rows in the devices table.
+
+    needs_upsert() tells the writer whether a device payload would change the
+    stored row. The MERGE only runs when it would, which it rarely does, since
+    name, category, model, ip and time_zone almost never change.
+    """
+
+    def __init__(self, storage=None):
+        self.storage = storage  # StatusStorage; the configured backend by default
+        self._fingerprints = {}
+        self._lock = threading.Lock()
+        self.hits = 0  # Upserts skipped because the row was unchanged
+        self.misses = 0  # Upserts needed: new device or changed metadata
+
+    def load(self):
+        """Fingerprint every row currently in the devices table"""
+        rows = (self.storage or get_storage()).device_rows()
+        with self._lock:
+            self._fingerprints = {row[0]: fingerprint(tuple(row)) for row in rows}
+        return len(rows)
+
+    def needs_upsert(self, row):
+        """Return True if row differs from what is stored, and remember it as stored"""
+        new_fingerprint = fingerprint(row)
+        with self._lock:
+            if self._fingerprints.get(row[0]) == new_fingerprint:
+                self.hits += 1
+                return False
+            self._fingerprints[row[0]] = new_fingerprint
+            self.misses += 1
+            return True
+
+    def __contains__(self, device_id):
+        """True if the device has a row in the devices table"""
+        with self._lock:
+            return device_id in self._fingerprints
+
+    def forget(self, device_id):
+        """Drop a device so its next payload is upserted unconditionally"""
+        with self._lock:
+            self._fingerprints.pop(device_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {'devices': len(self._fingerprints), 'hits': self.hits, 'misses': self.misses}
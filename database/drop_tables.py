@@ -1,31 +1,48 @@
-from database.db_utils import get_db_connection
+from database.db_utils import db_connection
 
 def drop_tables():
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        with db_connection() as conn:
+            cursor = conn.cursor()
 
-        # Drop device_status first due to foreign key constraint
-        cursor.execute('''
-        IF OBJECT_ID('device_status', 'U') IS NOT NULL
-            DROP TABLE device_status;
-        ''')
+            # Drop tables referencing devices first due to foreign key constraints
+            cursor.execute('''
+            IF OBJECT_ID('device_datapoints', 'U') IS NOT NULL
+                DROP TABLE device_datapoints;
+            IF OBJECT_ID('datapoint_codes', 'U') IS NOT NULL
+                DROP TABLE datapoint_codes;
+            ''')
 
-        # Then drop devices table
-        cursor.execute('''
-        IF OBJECT_ID('devices', 'U') IS NOT NULL
-            DROP TABLE devices;
-        ''')
+            cursor.execute('''
+            IF OBJECT_ID('device_status', 'U') IS NOT NULL
+                DROP TABLE device_status;
+            ''')
 
-        conn.commit()
-        print("Tables dropped successfully!")
+            cursor.execute('''
+            IF OBJECT_ID('monitor_workers', 'U') IS NOT NULL
+                DROP TABLE monitor_workers;
+            IF OBJECT_ID('device_status_hourly', 'U') IS NOT NULL
+                DROP TABLE device_status_hourly;
+            IF OBJECT_ID('device_status_daily', 'U') IS NOT NULL
+                DROP TABLE device_status_daily;
+            IF OBJECT_ID('device_rollup_cursor', 'U') IS NOT NULL
+                DROP TABLE device_rollup_cursor;
+            IF OBJECT_ID('device_status_archive', 'U') IS NOT NULL
+                DROP TABLE device_status_archive;
+            ''')
+
+            # Then drop devices table
+            cursor.execute('''
+            IF OBJECT_ID('devices', 'U') IS NOT NULL
+                DROP TABLE devices;
+            ''')
+
+            conn.commit()
+            cursor.close()
+            print("Tables dropped successfully!")
 
     except Exception as e:
         print(f"Error: {e}")
-    finally:
-        if 'conn' in locals():
-            cursor.close()
-            conn.close()
 
 if __name__ == "__main__":
-    drop_tables() 
\ No newline at end of file
+    drop_tables() 
@@ -0,0 +1,54 @@
+import threading
+
+from database.storage import get_storage
+
+class LastStateIndex:
+    """Authoritative in-memory copy of the latest stored switch_1 per device.
+
+    It is loaded with one set-based query at startup and updated by the
+    monitor for every row it writes, so detecting a change needs no reads
+    from device_status.
+    """
+
+    def __init__(self, storage=None):
+        self.storage = storage  # StatusStorage; the configured backend by default
+        self._states = {}  # device_id -> (switch_1, timestamp)
+        self._lock = threading.Lock()
+
+    def load(self, pending=()):
+        """Load the latest row of every device; returns the number of devices found.
+
+        pending are status rows (device_id, timestamp, switch_1) that are not
+        stored yet, e.g. from a spool; they override older stored rows.
+        """
+        states = (self.storage or get_storage()).last_states()
+        with self._lock:
+            self._states = states
+        self.seed(pending)
+        return len(self)
+
+    def seed(self, pending):
+        """Apply status rows that are not stored yet, without reading the database.
+
+        Used on its own when the database is unreachable at startup; rows
+        older than what is already known are ignored.
+        """
+        with self._lock:
+            for device_id, timestamp, switch_1 in pending:
+                known = self._states.get(device_id)
+                if known is None or timestamp >= known[1]:
+                    self._states[device_id] = (switch_1, timestamp)
+
+    def get(self, device_id):
+        """Return the last stored switch_1 for device_id, or None if it has no rows"""
+        with self._lock:
+            state = self._states.get(device_id)
+        return state[0] if state else None
+
+    def update(self, device_id, switch_1, timestamp):
+        with self._lock:
+            self._states[device_id] = (switch_1, timestamp)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._states)
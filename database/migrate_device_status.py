@@ -0,0 +1,154 @@
+import argparse
+import time
+from datetime import datetime, timezone
+
+from database.db_utils import db_connection
+
+STATUS_INDEX_NAME = 'IX_device_status_device_time'
+PARTITION_FUNCTION = 'PF_device_status_month'
+PARTITION_SCHEME = 'PS_device_status_month'
+COLUMNSTORE_INDEX_NAME = 'NCCI_device_status_history'
+
+def create_status_index(cursor):
+    """Covering index for "latest rows of a device" lookups.
+
+    Serves the ROW_NUMBER() queries in utils/get_switch_status and
+    LastStateIndex.load without sorting.
+    """
+    cursor.execute(f'''
+    IF NOT EXISTS (SELECT * FROM sys.indexes
+                   WHERE name = '{STATUS_INDEX_NAME}' AND object_id = OBJECT_ID('device_status'))
+    BEGIN
+        CREATE NONCLUSTERED INDEX {STATUS_INDEX_NAME}
+        ON device_status (device_id, timestamp DESC, id DESC)
+        INCLUDE (switch_1);
+    END
+    ''')
+
+def month_boundaries(months_back=24, months_ahead=12):
+    """Epoch seconds of the first day of each month around the current month"""
+    now = datetime.now(timezone.utc)
+    boundaries = []
+    for offset in range(-months_back, months_ahead + 1):
+        month_index = now.year * 12 + now.month - 1 + offset
+        start = datetime(month_index // 12, month_index % 12 + 1, 1, tzinfo=timezone.utc)
+        boundaries.append(int(start.timestamp()))
+    return boundaries
+
+def partition_by_month(cursor, months_back=24, months_ahead=12):
+    """Partition device_status by month of timestamp.
+
+    The primary key is rebuilt as a clustered (timestamp, id) key on the
+    partition scheme, so rows are stored in time order and whole months can
+    later be switched out or truncated. The status index is rebuilt aligned
+    to the same scheme.
+    """
+    boundaries = ', '.join(str(b) for b in month_boundaries(months_back, months_ahead))
+    cursor.execute(f'''
+    IF NOT EXISTS (SELECT * FROM sys.partition_functions WHERE name = '{PARTITION_FUNCTION}')
+        CREATE PARTITION FUNCTION {PARTITION_FUNCTION} (BIGINT)
+        AS RANGE RIGHT FOR VALUES ({boundaries});
+    ''')
+    cursor.execute(f'''
+    IF NOT EXISTS (SELECT * FROM sys.partition_schemes WHERE name = '{PARTITION_SCHEME}')
+        CREATE PARTITION SCHEME {PARTITION_SCHEME}
+        AS PARTITION {PARTITION_FUNCTION} ALL TO ([PRIMARY]);
+    ''')
+
+    cursor.execute(f'''
+    DECLARE @pk SYSNAME = (
+        SELECT name FROM sys.key_constraints
+        WHERE parent_object_id = OBJECT_ID('device_status') AND type = 'PK'
+    );
+    IF @pk IS NOT NULL
+        EXEC('ALTER TABLE device_status DROP CONSTRAINT ' + @pk);
+    IF EXISTS (SELECT * FROM sys.indexes
+               WHERE name = '{STATUS_INDEX_NAME}' AND object_id = OBJECT_ID('device_status'))
+        DROP INDEX {STATUS_INDEX_NAME} ON device_status;
+    IF EXISTS (SELECT * FROM sys.indexes
+               WHERE name = '{COLUMNSTORE_INDEX_NAME}' AND object_id = OBJECT_ID('device_status'))
+        DROP INDEX {COLUMNSTORE_INDEX_NAME} ON device_status;
+    ''')
+    # The partitioning column must be part of the clustered key, and key columns can't be NULL
+    cursor.execute('ALTER TABLE device_status ALTER COLUMN timestamp BIGINT NOT NULL')
+    cursor.execute(f'''
+    ALTER TABLE device_status
+    ADD CONSTRAINT PK_device_status PRIMARY KEY CLUSTERED (timestamp, id)
+    ON {PARTITION_SCHEME} (timestamp);
+    ''')
+    cursor.execute(f'''
+    CREATE NONCLUSTERED INDEX {STATUS_INDEX_NAME}
+    ON device_status (device_id, timestamp DESC, id DESC)
+    INCLUDE (switch_1)
+    ON {PARTITION_SCHEME} (timestamp);
+    ''')
+
+def add_future_partitions(cursor, months_ahead=12):
+    """Split new monthly boundaries so the last partition doesn't collect all new rows"""
+    cursor.execute(f'''
+    SELECT CAST(v.value AS BIGINT)
+    FROM sys.partition_range_values v
+    JOIN sys.partition_functions f ON f.function_id = v.function_id
+    WHERE f.name = '{PARTITION_FUNCTION}'
+    ''')
+    existing = {row[0] for row in cursor.fetchall()}
+    added = 0
+    for boundary in month_boundaries(0, months_ahead):
+        if boundary not in existing:
+            cursor.execute(f'ALTER PARTITION SCHEME {PARTITION_SCHEME} NEXT USED [PRIMARY]')
+            cursor.execute(f'ALTER PARTITION FUNCTION {PARTITION_FUNCTION}() SPLIT RANGE ({boundary})')
+            added += 1
+    return added
+
+def create_history_columnstore(cursor, older_than_days=90):
+    """Filtered columnstore index over rows older than older_than_days.
+
+    History scans and aggregates over old data read compressed column
+    segments, while recent rows stay in the rowstore indexes. The filter is a
+    fixed cutoff, so rerun this periodically to move the cutoff forward.
+    """
+    cutoff = int(time.time()) - older_than_days * 86400
+    cursor.execute(f'''
+    IF EXISTS (SELECT * FROM sys.indexes
+               WHERE name = '{COLUMNSTORE_INDEX_NAME}' AND object_id = OBJECT_ID('device_status'))
+        DROP INDEX {COLUMNSTORE_INDEX_NAME} ON device_status;
+    ''')
+    cursor.execute(f'''
+    CREATE NONCLUSTERED COLUMNSTORE INDEX {COLUMNSTORE_INDEX_NAME}
+    ON device_status (device_id, timestamp, switch_1)
+    WHERE timestamp < {cutoff};
+    ''')
+
+def migrate(partition=False, columnstore_days=None):
+    try:
+        with db_connection() as conn:
+            cursor = conn.cursor()
+
+            start = time.perf_counter()
+            if partition:
+                print("Partitioning device_status by month...")
+                partition_by_month(cursor)
+                print(f"Added {add_future_partitions(cursor)} future partitions")
+            else:
+                print("Creating device_status index...")
+                create_status_index(cursor)
+
+            if columnstore_days is not None:
+                print(f"Creating columnstore index for rows older than {columnstore_days} days...")
+                create_history_columnstore(cursor, columnstore_days)
+
+            conn.commit()
+            cursor.close()
+            print(f"Migration completed in {time.perf_counter() - start:.1f} seconds")
+
+    except Exception as e:
+        print(f"Error: {e}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Add indexes and optional partitioning to device_status")
+    parser.add_argument('--partition', action='store_true',
+                        help="partition device_status by month (rebuilds the primary key)")
+    parser.add_argument('--columnstore-days', type=int, default=None,
+                        help="add a columnstore index over rows older than this many days")
+    args = parser.parse_args()
+    migrate(partition=args.partition, columnstore_days=args.columnstore_days)
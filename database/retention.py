@@ -0,0 +1,203 @@
+import os
+import time
+import argparse
+
+import pyodbc
+
+from database.db_utils import db_connection
+
+# Rows removed by the retention job, when it archives instead of only deleting
+CREATE_ARCHIVE_TABLE_SQL = '''
+IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = 'device_status_archive')
+BEGIN
+    CREATE TABLE device_status_archive (
+        id INT NOT NULL PRIMARY KEY,
+        device_id VARCHAR(255),
+        timestamp BIGINT,
+        switch_1 BIT
+    )
+END
+'''
+
+LATEST_ROW_SQL = '''
+SELECT TOP 1 id FROM device_status
+WHERE device_id = ?
+ORDER BY timestamp DESC, id DESC
+'''
+
+# The latest row of a device is never deleted: the monitor's last known state
+# and guarded inserts are based on it.
+DELETE_EXPIRED_SQL = '''
+DELETE TOP (?) FROM device_status
+{output}
+WHERE device_id = ? AND timestamp < ? AND id <> ?
+'''
+
+ARCHIVE_OUTPUT = '''OUTPUT DELETED.id, DELETED.device_id, DELETED.timestamp, DELETED.switch_1
+INTO device_status_archive (id, device_id, timestamp, switch_1)'''
+
+DEVICE_HISTORY_SQL = '''
+SELECT id, switch_1 FROM device_status
+WHERE device_id = ?
+ORDER BY timestamp, id
+'''
+
+# The job yields to the monitor: it is the preferred deadlock victim and gives
+# up on a lock after LOCK_TIMEOUT_MS instead of queueing behind writes.
+LOCK_TIMEOUT_MS = 5000
+SESSION_SQL = f'SET DEADLOCK_PRIORITY LOW; SET LOCK_TIMEOUT {LOCK_TIMEOUT_MS}'
+RESET_SESSION_SQL = 'SET DEADLOCK_PRIORITY NORMAL; SET LOCK_TIMEOUT -1'
+
+# Deadlock victim, lock request timeout
+LOCK_CONFLICT_ERRORS = ('1205', '1222')
+
+def _is_lock_conflict(error):
+    return any(code in str(error) for code in LOCK_CONFLICT_ERRORS)
+
+def redundant_ids(rows, previous=None):
+    """IDs of rows that repeat the switch_1 of the row before them.
+
+    rows are (id, switch_1) of one device in time order, and previous is the
+    state before the first of them, if any. The first row of a run of
+    identical states is kept, so every change stays in the history.
+    """
+    ids = []
+    for row_id, switch_1 in rows:
+        if switch_1 is not None and switch_1 == previous:
+            ids.append(row_id)
+        previous = switch_1
+    return ids
+
+class RetentionJob:
+    """Deletes (or archives) device_status rows older than max_age_days.
+
+    Rows are removed device by device in transactions of at most batch_size
+    rows, which seek on the (device_id, timestamp) index and stay below SQL
+    Server's lock escalation threshold of 5000 locks, so the monitor keeps
+    writing while the job runs. It sleeps batch_delay seconds between
+    batches and retries a batch that lost a lock conflict.
+
+    With compact=True it also deletes rows that repeat the previous state of
+    their device, e.g. written by several monitors or before guarded inserts.
+    """
+
+    def __init__(self, max_age_days=None, batch_size=None, batch_delay=None, archive=None,
+                 compact=False, max_retries=3):
+        self.max_age_days = max_age_days or float(os.getenv('RETENTION_DAYS', '365'))
+        self.batch_size = batch_size or int(os.getenv('RETENTION_BATCH_SIZE', '1000'))
+        if batch_delay is None:
+            batch_delay = float(os.getenv('RETENTION_BATCH_DELAY', '0.05'))
+        self.batch_delay = batch_delay
+        if archive is None:
+            archive = os.getenv('RETENTION_ARCHIVE', '0').lower() in ('1', 'true', 'yes')
+        self.archive = archive
+        self.compact = compact
+        self.max_retries = max_retries
+        self._stats = {'devices': 0, 'expired': 0, 'compacted': 0, 'batches': 0, 'retries': 0}
+
+    def run(self):
+        """Run once over every device; returns the stats, including elapsed seconds"""
+        start = time.perf_counter()
+        cutoff = int(time.time() - self.max_age_days * 86400)
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            if self.archive:
+                cursor.execute(CREATE_ARCHIVE_TABLE_SQL)
+                conn.commit()
+            cursor.execute(SESSION_SQL)
+            try:
+                cursor.execute("SELECT device_id FROM devices")
+                device_ids = [row[0] for row in cursor.fetchall()]
+                for device_id in device_ids:
+                    self._stats['expired'] += self.delete_expired(conn, cursor, device_id, cutoff)
+                    if self.compact:
+                        self._stats['compacted'] += self.compact_device(conn, cursor, device_id)
+                    self._stats['devices'] += 1
+            finally:
+                # The connection goes back to the pool
+                cursor.execute(RESET_SESSION_SQL)
+        return dict(self._stats, elapsed=time.perf_counter() - start)
+
+    def delete_expired(self, conn, cursor, device_id, cutoff):
+        """Delete a device's rows older than cutoff, batch by batch; returns rows removed"""
+        cursor.execute(LATEST_ROW_SQL, device_id)
+        latest = cursor.fetchone()
+        if latest is None:
+            return 0
+        sql = DELETE_EXPIRED_SQL.format(output=ARCHIVE_OUTPUT if self.archive else '')
+        removed = 0
+        while True:
+            count = self._run_batch(conn, cursor, sql, (self.batch_size, device_id, cutoff, latest[0]))
+            removed += count
+            if count < self.batch_size:
+                return removed
+
+    def compact_device(self, conn, cursor, device_id):
+        """Delete rows that repeat the previous state of the device; returns rows removed"""
+        cursor.execute(DEVICE_HISTORY_SQL, device_id)
+        ids = []
+        previous = None
+        # The history is read to the end before deleting, since the connection can't do both at once
+        while True:
+            rows = cursor.fetchmany(10000)
+            if not rows:
+                break
+            ids.extend(redundant_ids(rows, previous))
+            previous = rows[-1][1]
+        # SQL Server accepts at most 2100 parameters per statement
+        batch_size = min(self.batch_size, 2000)
+        removed = 0
+        for i in range(0, len(ids), batch_size):
+            chunk = ids[i:i + batch_size]
+            removed += self._run_batch(
+                conn, cursor, f"DELETE FROM device_status WHERE id IN ({', '.join('?' * len(chunk))})", chunk
+            )
+        return removed
+
+    def stats(self):
+        return dict(self._stats)
+
+    def _run_batch(self, conn, cursor, sql, params):
+        """Execute one DELETE in its own transaction; returns the rows it removed"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                cursor.execute(sql, params)
+                count = cursor.rowcount
+                conn.commit()
+                break
+            except pyodbc.Error as e:
+                conn.rollback()
+                if attempt == self.max_retries or not _is_lock_conflict(e):
+                    raise
+                self._stats['retries'] += 1
+                time.sleep(self.batch_delay + 0.5 * (attempt + 1))
+        self._stats['batches'] += 1
+        if count and self.batch_delay:
+            time.sleep(self.batch_delay)
+        return count
+
+def main():
+    parser = argparse.ArgumentParser(description="Delete or archive old device_status rows")
+    parser.add_argument('--days', type=float, default=None,
+                        help="keep rows newer than this many days (default RETENTION_DAYS or 365)")
+    parser.add_argument('--archive', action='store_true', default=None,
+                        help="move deleted rows to device_status_archive")
+    parser.add_argument('--compact', action='store_true',
+                        help="also delete rows that repeat the previous state of their device")
+    parser.add_argument('--batch-size', type=int, default=None,
+                        help="rows per transaction (default RETENTION_BATCH_SIZE or 1000)")
+    args = parser.parse_args()
+    job = RetentionJob(max_age_days=args.days, batch_size=args.batch_size, archive=args.archive,
+                       compact=args.compact)
+    try:
+        stats = job.run()
+    except Exception as e:
+        print(f"Error: {e}")
+        stats = dict(job.stats(), elapsed=None)
+    print(f"{'Archived' if job.archive else 'Deleted'} {stats['expired']} rows older than "
+          f"{job.max_age_days:g} days, compacted {stats['compacted']} redundant rows "
+          f"of {stats['devices']} devices in {stats['batches']} batches"
+          + (f", {stats['elapsed']:.1f} s" if stats['elapsed'] is not None else ""))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+import argparse
+import time
+
+# Rollup resolution -> (table, bucket size in seconds). Buckets are aligned to UTC.
+ROLLUP_TABLES = {
+    'hour': ('device_status_hourly', 3600),
+    'day': ('device_status_daily', 86400),
+}
+
+# Per device and bucket: seconds switch_1 was on, number of toggles, the state
+# at the start of the bucket (or when the device was first seen) and the last
+# state in it. Buckets a device spent entirely off, without status rows, have
+# no row. device_rollup_cursor holds the state each device is in and the
+# time up to which it has been rolled up; the open interval after that is
+# added at query time. Reports for a time range seek on bucket_start, so they
+# read one row per device and bucket however long the raw history gets.
+CREATE_ROLLUP_TABLES_SQL = '''
+IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = 'device_status_hourly')
+BEGIN
+    CREATE TABLE device_status_hourly (
+        device_id VARCHAR(255) NOT NULL,
+        bucket_start BIGINT NOT NULL,
+        on_seconds INT NOT NULL,
+        toggles INT NOT NULL,
+        first_state BIT NOT NULL,
+        last_state BIT NOT NULL,
+        CONSTRAINT PK_device_status_hourly PRIMARY KEY (device_id, bucket_start)
+    )
+    CREATE NONCLUSTERED INDEX IX_device_status_hourly_bucket
+    ON device_status_hourly (bucket_start)
+    INCLUDE (on_seconds, toggles, first_state, last_state)
+END
+
+IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = 'device_status_daily')
+BEGIN
+    CREATE TABLE device_status_daily (
+        device_id VARCHAR(255) NOT NULL,
+        bucket_start BIGINT NOT NULL,
+        on_seconds INT NOT NULL,
+        toggles INT NOT NULL,
+        first_state BIT NOT NULL,
+        last_state BIT NOT NULL,
+        CONSTRAINT PK_device_status_daily PRIMARY KEY (device_id, bucket_start)
+    )
+    CREATE NONCLUSTERED INDEX IX_device_status_daily_bucket
+    ON device_status_daily (bucket_start)
+    INCLUDE (on_seconds, toggles, first_state, last_state)
+END
+
+IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = 'device_rollup_cursor')
+BEGIN
+    CREATE TABLE device_rollup_cursor (
+        device_id VARCHAR(255) NOT NULL PRIMARY KEY,
+        state BIT NOT NULL,
+        since BIGINT NOT NULL
+    )
+END
+'''
+
+MERGE_ROLLUP_SQL = '''
+MERGE {table} WITH (HOLDLOCK) AS target
+USING (VALUES (?, ?, ?, ?, ?, ?)) AS source (device_id, bucket_start, on_seconds, toggles, first_state, last_state)
+ON target.device_id = source.device_id AND target.bucket_start = source.bucket_start
+WHEN MATCHED THEN
+    UPDATE SET
+        on_seconds = target.on_seconds + source.on_seconds,
+        toggles = target.toggles + source.toggles,
+        last_state = source.last_state
+WHEN NOT MATCHED THEN
+    INSERT (device_id, bucket_start, on_seconds, toggles, first_state, last_state)
+    VALUES (source.device_id, source.bucket_start, source.on_seconds, source.toggles,
+            source.first_state, source.last_state);
+'''
+
+MERGE_CURSOR_SQL = '''
+MERGE device_rollup_cursor WITH (HOLDLOCK) AS target
+USING (VALUES (?, ?, ?)) AS source (device_id, state, since)
+ON target.device_id = source.device_id
+WHEN MATCHED THEN
+    UPDATE SET state = source.state, since = source.since
+WHEN NOT MATCHED THEN
+    INSERT (device_id, state, since) VALUES (source.device_id, source.state, source.since);
+'''
+
+# SQL Server accepts at most 2100 parameters per statement
+CURSOR_CHUNK_SIZE = 500
+
+def split_interval(start, end, size):
+    """Yield (bucket_start, seconds) for the part of [start, end) in each bucket of `size` seconds"""
+    while start < end:
+        bucket = start - start % size
+        stop = min(end, bucket + size)
+        yield bucket, stop - start
+        start = stop
+
+class RollupBatch:
+    """Rollup deltas for a batch of status rows, computed in memory.
+
+    cursors maps device_id -> (state, since) as stored in device_rollup_cursor;
+    add() advances them. Rows older than a device's cursor are ignored, since
+    that time has already been rolled up.
+    """
+
+    def __init__(self, cursors):
+        self.cursors = cursors
+        self.changed_cursors = set()
+        self.buckets = {resolution: {} for resolution in ROLLUP_TABLES}
+        self.skipped = 0
+
+    def add(self, device_id, timestamp, state):
+        state = int(bool(state))
+        cursor = self.cursors.get(device_id)
+        if cursor is not None:
+            previous, since = cursor
+            if timestamp < since:
+                self.skipped += 1
+                return
+            # Time spent off only adds rows for buckets that also hold a status row
+            for resolution, (_, size) in (ROLLUP_TABLES.items() if previous else ()):
+                buckets = self.buckets[resolution]
+                for bucket, seconds in split_interval(since, timestamp, size):
+                    entry = buckets.setdefault((device_id, bucket), [0, 0, previous, previous])
+                    entry[0] += seconds if previous else 0
+                    entry[3] = previous
+        for resolution, (_, size) in ROLLUP_TABLES.items():
+            # A bucket first seen here starts in the previous state, unless this row opens it
+            first_state = cursor[0] if cursor is not None and timestamp % size else state
+            entry = self.buckets[resolution].setdefault(
+                (device_id, timestamp - timestamp % size), [0, 0, first_state, first_state])
+            if cursor is not None and state != cursor[0]:
+                entry[1] += 1
+            entry[3] = state
+        self.cursors[device_id] = (state, timestamp)
+        self.changed_cursors.add(device_id)
+
+    def rows(self, resolution):
+        """Parameter rows for MERGE_ROLLUP_SQL"""
+        return [
+            (device_id, bucket, on_seconds, toggles, first_state, last_state)
+            for (device_id, bucket), (on_seconds, toggles, first_state, last_state)
+            in self.buckets[resolution].items()
+        ]
+
+    def cursor_rows(self):
+        return [(device_id, *self.cursors[device_id]) for device_id in self.changed_cursors]
+
+def load_cursors(cursor, device_ids, lock=True):
+    """Read device_rollup_cursor for device_ids; lock=True holds the rows until commit"""
+    hint = ' WITH (UPDLOCK, HOLDLOCK)' if lock else ''
+    device_ids = list(device_ids)
+    cursors = {}
+    for i in range(0, len(device_ids), CURSOR_CHUNK_SIZE):
+        chunk = device_ids[i:i + CURSOR_CHUNK_SIZE]
+        cursor.execute(
+            f"SELECT device_id, state, since FROM device_rollup_cursor{hint} "
+            f"WHERE device_id IN ({', '.join('?' * len(chunk))})",
+            chunk
+        )
+        cursors.update({row[0]: (int(row[1]), row[2]) for row in cursor.fetchall()})
+    return cursors
+
+def write_batch(cursor, batch):
+    for resolution, (table, _) in ROLLUP_TABLES.items():
+        rows = batch.rows(resolution)
+        if rows:
+            cursor.executemany(MERGE_ROLLUP_SQL.format(table=table), rows)
+    cursor_rows = batch.cursor_rows()
+    if cursor_rows:
+        cursor.executemany(MERGE_CURSOR_SQL, cursor_rows)
+
+def apply_status_rollups(cursor, statuses):
+    """Fold (device_id, timestamp, switch_1) rows into the rollups, in the caller's transaction"""
+    batch = RollupBatch(load_cursors(cursor, {device_id for device_id, _, _ in statuses}))
+    for device_id, timestamp, switch_1 in sorted(statuses, key=lambda row: row[1]):
+        batch.add(device_id, timestamp, switch_1)
+    write_batch(cursor, batch)
+    return batch
+
+def rebuild_rollups(fetch_size=10000, flush_rows=100000):
+    """Recompute every rollup from device_status, e.g. after adding rollups to an existing database"""
+    from database.db_utils import db_connection  # Only the rebuild talks to the database itself
+
+    start = time.perf_counter()
+    # Reading and writing need separate connections: one can't run statements while streaming results
+    with db_connection() as read_conn, db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.fast_executemany = True
+        for table, _ in ROLLUP_TABLES.values():
+            cursor.execute(f"DELETE FROM {table}")
+        cursor.execute("DELETE FROM device_rollup_cursor")
+
+        reader = read_conn.cursor()
+        reader.execute("SELECT device_id, timestamp, switch_1 FROM device_status "
+                       "WHERE switch_1 IS NOT NULL ORDER BY device_id, timestamp, id")
+        cursors = {}
+        batch = RollupBatch(cursors)
+        rows = pending = 0
+        while True:
+            chunk = reader.fetchmany(fetch_size)
+            if not chunk:
+                break
+            for device_id, timestamp, switch_1 in chunk:
+                batch.add(device_id, timestamp, switch_1)
+            rows += len(chunk)
+            pending += len(chunk)
+            if pending >= flush_rows:
+                # Bucket deltas add up, so a device may span several flushes
+                write_batch(cursor, batch)
+                batch = RollupBatch(cursors)
+                pending = 0
+        write_batch(cursor, batch)
+        conn.commit()
+    print(f"Rolled up {rows} status rows of {len(cursors)} devices in {time.perf_counter() - start:.1f} s")
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the device_status rollup tables")
+    parser.add_argument('--rebuild', action='store_true', help="Recompute all rollups from device_status")
+    args = parser.parse_args()
+    if args.rebuild:
+        rebuild_rollups()
+    else:
+        parser.print_help()
+
+if __name__ == "__main__":
+    main()
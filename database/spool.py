@@ -0,0 +1,269 @@
+import os
+import json
+import time
+import zlib
+import queue
+import struct
+import threading
+from collections import deque
+
+# Every record is its payload length and CRC-32, then the payload: one
+# write-behind item as compact JSON
+RECORD_HEADER = struct.Struct('<II')
+SEGMENT_SUFFIX = '.spool'
+CHECKPOINT_FILE = 'checkpoint.json'
+
+def encode_item(item):
+    payload = json.dumps(item, separators=(',', ':')).encode()
+    return RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+def decode_item(payload):
+    """Inverse of encode_item's payload: (device, status, datapoint_rows) with tuple rows"""
+    device, status, datapoint_rows = json.loads(payload)
+    return (
+        None if device is None else tuple(device),
+        None if status is None else tuple(status),
+        [tuple(row) for row in datapoint_rows]
+    )
+
+def read_record(f):
+    """Read one record from f; returns (payload, size), or None at the end or at a torn or corrupt record"""
+    header = f.read(RECORD_HEADER.size)
+    if len(header) < RECORD_HEADER.size:
+        return None
+    length, crc = RECORD_HEADER.unpack(header)
+    payload = f.read(length)
+    if len(payload) < length or zlib.crc32(payload) != crc:
+        return None
+    return payload, RECORD_HEADER.size + length
+
+class Spool:
+    """Durable write-ahead spool of write-behind items, in append-only segment files.
+
+    put() appends a CRC-checked record to the current segment, starting a
+    new one every segment_bytes. Records are handed out in order by
+    get_nowait() and, once the database has committed them, acknowledge()
+    moves the checkpoint past them and deletes segments that are done.
+    Its put/get_nowait/qsize match queue.Queue, so WriteBehindQueue can use
+    it in place of its in-memory queue.
+
+    Segments are fsynced at most every sync_interval seconds (0 syncs every
+    record), so a crash of the process loses nothing and a power loss at
+    most the last sync_interval seconds. On start the spool resumes from
+    the checkpoint and truncates a torn record at the end of a segment.
+    Records that were committed but not yet acknowledged when the process
+    died are handed out again.
+
+    put() blocks, and then raises queue.Full, once max_bytes are spooled.
+    """
+
+    def __init__(self, directory=None, segment_bytes=None, max_bytes=None, sync_interval=None):
+        self.directory = directory or os.getenv('SPOOL_DIR', 'spool')
+        self.segment_bytes = segment_bytes or int(os.getenv('SPOOL_SEGMENT_BYTES', str(16 * 2**20)))
+        self.max_bytes = max_bytes or int(os.getenv('SPOOL_MAX_BYTES', str(2**30)))
+        if sync_interval is None:
+            sync_interval = float(os.getenv('SPOOL_SYNC_INTERVAL', '1.0'))
+        self.sync_interval = sync_interval
+
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._unread = 0  # Records appended but not yet handed out
+        self._bytes = 0  # Bytes of records not yet acknowledged
+        self._handed_out = deque()  # (segment, end offset, size) per record handed out, in order
+        self._unsynced = False
+        self._last_sync = time.monotonic()
+        self._closed = False
+        self._stats = {'appended': 0, 'acknowledged': 0, 'recovered': 0, 'truncated_bytes': 0,
+                       'segments_deleted': 0}
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._recover()
+
+    def put(self, item, block=True, timeout=None):
+        record = encode_item(item)
+        with self._not_full:
+            if self._closed:
+                raise RuntimeError("Spool is closed")
+            if self._bytes and self._bytes + len(record) > self.max_bytes:
+                if not block or not self._not_full.wait_for(
+                        lambda: self._bytes + len(record) <= self.max_bytes, timeout):
+                    raise queue.Full
+            if self._write_size >= self.segment_bytes:
+                self._start_segment(self._write_segment + 1)
+            self._write_file.write(record)
+            self._write_file.flush()  # Into the OS, so a crash of the process can't lose it
+            self._write_size += len(record)
+            self._bytes += len(record)
+            self._unread += 1
+            self._stats['appended'] += 1
+            self._unsynced = True
+            if time.monotonic() - self._last_sync >= self.sync_interval:
+                self._sync()
+            self._not_empty.notify()
+
+    def put_nowait(self, item):
+        self.put(item, block=False)
+
+    def wait(self, timeout=None):
+        """Wait until a record can be handed out; returns False on timeout"""
+        with self._not_empty:
+            if self._unsynced and time.monotonic() - self._last_sync >= self.sync_interval:
+                self._sync()  # Changes stop coming: don't leave the last ones unsynced
+            return self._not_empty.wait_for(lambda: self._unread > 0, timeout)
+
+    def get_nowait(self):
+        """Hand out the next record; raises queue.Empty if there is none"""
+        with self._lock:
+            if not self._unread:
+                raise queue.Empty
+            record = read_record(self._read_file)
+            while record is None:
+                # The end of a finished segment; records exist, so a later one holds them
+                self._open_reader(self._read_segment + 1, 0)
+                record = read_record(self._read_file)
+            payload, size = record
+            self._read_offset += size
+            self._unread -= 1
+            self._handed_out.append((self._read_segment, self._read_offset, size))
+        return decode_item(payload)
+
+    def acknowledge(self, count):
+        """Mark the first count records handed out and not yet acknowledged as committed"""
+        if not count:
+            return
+        with self._lock:
+            for _ in range(count):
+                segment, offset, size = self._handed_out.popleft()
+                self._bytes -= size
+            self._stats['acknowledged'] += count
+            self._save_checkpoint(segment, offset)
+            while self._first_segment < segment:
+                self._remove_segment(self._first_segment)
+                self._first_segment += 1
+            self._not_full.notify_all()
+
+    def pending_items(self):
+        """Every record not yet acknowledged, read from disk without handing it out"""
+        with self._lock:
+            self._write_file.flush()
+            segment, offset = self._checkpoint
+            write_segment = self._write_segment
+        items = []
+        for index in range(segment, write_segment + 1):
+            try:
+                with open(self._segment_path(index), 'rb') as f:
+                    f.seek(offset if index == segment else 0)
+                    for payload, _ in iter(lambda: read_record(f), None):
+                        items.append(decode_item(payload))
+            except FileNotFoundError:
+                continue  # Acknowledged and deleted meanwhile
+        return items
+
+    def qsize(self):
+        with self._lock:
+            return self._unread
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, unread=self._unread, unacknowledged=self._unread + len(self._handed_out),
+                        bytes=self._bytes, segments=self._write_segment - self._first_segment + 1)
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._sync()
+            self._write_file.close()
+            self._read_file.close()
+
+    def _recover(self):
+        segments = sorted(
+            int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(self.directory)
+            if name.endswith(SEGMENT_SUFFIX) and name[:-len(SEGMENT_SUFFIX)].isdigit()
+        )
+        segment, offset = self._load_checkpoint()
+        for index in [index for index in segments if index < segment]:
+            self._remove_segment(index)
+        segments = [index for index in segments if index >= segment]
+        if not segments or segments[0] != segment:
+            offset = 0  # The checkpoint's segment was done and deleted
+            segment = segments[0] if segments else segment
+
+        # Count the records to replay, and cut each segment at its first bad record
+        for index in segments:
+            path = self._segment_path(index)
+            start = offset if index == segment else 0
+            with open(path, 'rb') as f:
+                f.seek(start)
+                end = start
+                for _, size in iter(lambda: read_record(f), None):
+                    end += size
+                    self._unread += 1
+                    self._bytes += size
+            truncated = os.path.getsize(path) - end
+            if truncated > 0:
+                self._stats['truncated_bytes'] += truncated
+                print(f"Spool segment {path} has {truncated} torn or corrupt bytes after offset {end}; "
+                      f"truncating")
+                os.truncate(path, end)
+        self._stats['recovered'] = self._unread
+
+        self._checkpoint = (segment, offset)
+        self._first_segment = segment
+        self._start_segment(segments[-1] if segments else segment)
+        self._open_reader(segment, offset)
+
+    def _segment_path(self, index):
+        return os.path.join(self.directory, f'{index:010d}{SEGMENT_SUFFIX}')
+
+    def _start_segment(self, index):
+        # Caller holds self._lock, or is __init__
+        if getattr(self, '_write_file', None) is not None:
+            self._sync()
+            self._write_file.close()
+        self._write_segment = index
+        self._write_file = open(self._segment_path(index), 'ab')
+        self._write_size = self._write_file.tell()
+
+    def _open_reader(self, index, offset):
+        if getattr(self, '_read_file', None) is not None:
+            self._read_file.close()
+        self._read_segment = index
+        self._read_file = open(self._segment_path(index), 'rb')
+        self._read_file.seek(offset)
+        self._read_offset = offset
+
+    def _remove_segment(self, index):
+        if index == getattr(self, '_write_segment', None) or index == getattr(self, '_read_segment', None):
+            return
+        try:
+            os.remove(self._segment_path(index))
+            self._stats['segments_deleted'] += 1
+        except FileNotFoundError:
+            pass
+
+    def _sync(self):
+        self._write_file.flush()
+        os.fsync(self._write_file.fileno())
+        self._unsynced = False
+        self._last_sync = time.monotonic()
+
+    def _load_checkpoint(self):
+        try:
+            with open(os.path.join(self.directory, CHECKPOINT_FILE), encoding='utf-8') as f:
+                checkpoint = json.load(f)
+            return checkpoint['segment'], checkpoint['offset']
+        except FileNotFoundError:
+            return 0, 0
+
+    def _save_checkpoint(self, segment, offset):
+        # Written aside and renamed, so a crash leaves either the old checkpoint or the new one
+        path = os.path.join(self.directory, CHECKPOINT_FILE)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump({'segment': segment, 'offset': offset}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + '.tmp', path)
+        self._checkpoint = (segment, offset)
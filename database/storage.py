@@ -0,0 +1,431 @@
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+
+from database.rollups import apply_status_rollups
+from utils import metrics
+
+# SQL Server statements
+
+UPSERT_DEVICE_SQL = '''
+MERGE devices AS target
+USING (VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)) AS source
+(device_id, name, category, online, active_time, create_time, update_time, ip, model, time_zone)
+ON target.device_id = source.device_id
+WHEN MATCHED THEN
+    UPDATE SET
+        name = source.name,
+        category = source.category,
+        online = source.online,
+        active_time = source.active_time,
+        create_time = source.create_time,
+        update_time = source.update_time,
+        ip = source.ip,
+        model = source.model,
+        time_zone = source.time_zone
+WHEN NOT MATCHED THEN
+    INSERT (device_id, name, category, online, active_time, create_time, update_time, ip, model, time_zone)
+    VALUES (source.device_id, source.name, source.category, source.online, source.active_time,
+            source.create_time, source.update_time, source.ip, source.model, source.time_zone);
+'''
+
+INSERT_STATUS_SQL = '''
+INSERT INTO device_status (device_id, timestamp, switch_1)
+VALUES (?, ?, ?)
+'''
+
+# For several monitors writing the same devices: insert only if the device's
+# latest row holds a different state. UPDLOCK/HOLDLOCK serialize concurrent
+# writers on the same device, so two monitors cannot both store one change.
+INSERT_STATUS_GUARDED_SQL = '''
+INSERT INTO device_status (device_id, timestamp, switch_1)
+SELECT ?, ?, ?
+WHERE NOT EXISTS (
+    SELECT 1
+    FROM (
+        SELECT TOP 1 switch_1
+        FROM device_status WITH (UPDLOCK, HOLDLOCK)
+        WHERE device_id = ?
+        ORDER BY timestamp DESC, id DESC
+    ) latest
+    WHERE latest.switch_1 = ?
+)
+'''
+
+INSERT_DATAPOINT_SQL = '''
+INSERT INTO device_datapoints (device_id, code_id, timestamp, value_bool, value_int, value_float, value_text)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+
+LATEST_STATES_SQL = '''
+SELECT device_id, switch_1, timestamp
+FROM (
+    SELECT
+        device_id,
+        switch_1,
+        timestamp,
+        ROW_NUMBER() OVER (PARTITION BY device_id ORDER BY timestamp DESC, id DESC) AS rn
+    FROM device_status
+) ranked
+WHERE rn = 1
+'''
+
+LATEST_DATAPOINTS_SQL = '''
+SELECT c.code, latest.device_id, latest.value_bool, latest.value_int, latest.value_float, latest.value_text
+FROM (
+    SELECT
+        device_id, code_id, value_bool, value_int, value_float, value_text,
+        ROW_NUMBER() OVER (PARTITION BY device_id, code_id ORDER BY timestamp DESC, id DESC) AS rn
+    FROM device_datapoints
+) latest
+JOIN datapoint_codes c ON c.code_id = latest.code_id
+WHERE latest.rn = 1
+'''
+
+REGISTER_CODE_SQL = '''
+SET NOCOUNT ON;
+IF NOT EXISTS (SELECT 1 FROM datapoint_codes WITH (UPDLOCK, HOLDLOCK) WHERE code = ?)
+    INSERT INTO datapoint_codes (code) VALUES (?);
+SELECT code_id FROM datapoint_codes WHERE code = ?;
+'''
+
+# Status rows in [start, end), optionally of some devices. Ordered like the
+# (device_id, timestamp) index, so rows stream out without a server-side sort.
+HISTORY_SQL = '''
+    SELECT ds.device_id, d.name, ds.timestamp, ds.switch_1
+    FROM device_status ds
+    LEFT JOIN devices d ON d.device_id = ds.device_id
+    WHERE ds.timestamp >= ? AND ds.timestamp < ?{device_filter}
+    ORDER BY ds.device_id, ds.timestamp, ds.id
+'''
+
+# Column order matches write_behind.device_row / UPSERT_DEVICE_SQL
+DEVICE_COLUMNS = (
+    'device_id', 'name', 'category', 'online', 'active_time',
+    'create_time', 'update_time', 'ip', 'model', 'time_zone'
+)
+
+# SQLite schema. device_last_state is kept up to date by a trigger, so the
+# latest state of every device is one row away however long the history gets.
+SQLITE_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS devices (
+    device_id TEXT PRIMARY KEY,
+    name TEXT,
+    category TEXT,
+    online INTEGER,
+    active_time INTEGER,
+    create_time INTEGER,
+    update_time INTEGER,
+    ip TEXT,
+    model TEXT,
+    time_zone TEXT
+);
+
+CREATE TABLE IF NOT EXISTS device_status (
+    id INTEGER PRIMARY KEY,
+    device_id TEXT NOT NULL,
+    timestamp INTEGER NOT NULL,
+    switch_1 INTEGER
+);
+CREATE INDEX IF NOT EXISTS ix_device_status_device_time ON device_status (device_id, timestamp, id);
+CREATE INDEX IF NOT EXISTS ix_device_status_time ON device_status (timestamp);
+
+CREATE TABLE IF NOT EXISTS device_last_state (
+    device_id TEXT PRIMARY KEY,
+    switch_1 INTEGER,
+    timestamp INTEGER NOT NULL
+);
+
+CREATE TRIGGER IF NOT EXISTS device_status_last_state AFTER INSERT ON device_status
+BEGIN
+    INSERT INTO device_last_state (device_id, switch_1, timestamp)
+    VALUES (NEW.device_id, NEW.switch_1, NEW.timestamp)
+    ON CONFLICT (device_id) DO UPDATE SET switch_1 = excluded.switch_1, timestamp = excluded.timestamp
+    WHERE excluded.timestamp >= device_last_state.timestamp;
+END;
+
+CREATE TABLE IF NOT EXISTS datapoint_codes (
+    code_id INTEGER PRIMARY KEY,
+    code TEXT NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS device_datapoints (
+    id INTEGER PRIMARY KEY,
+    device_id TEXT NOT NULL,
+    code_id INTEGER NOT NULL,
+    timestamp INTEGER NOT NULL,
+    value_bool INTEGER,
+    value_int INTEGER,
+    value_float REAL,
+    value_text TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_device_datapoints_device_code_time
+ON device_datapoints (device_id, code_id, timestamp, id);
+'''
+
+SQLITE_UPSERT_DEVICE_SQL = f'''
+INSERT INTO devices ({', '.join(DEVICE_COLUMNS)}) VALUES ({', '.join('?' * len(DEVICE_COLUMNS))})
+ON CONFLICT (device_id) DO UPDATE SET
+    {', '.join(f'{column} = excluded.{column}' for column in DEVICE_COLUMNS[1:])}
+'''
+
+SQLITE_INSERT_STATUS_GUARDED_SQL = '''
+INSERT INTO device_status (device_id, timestamp, switch_1)
+SELECT ?, ?, ?
+WHERE NOT EXISTS (SELECT 1 FROM device_last_state WHERE device_id = ? AND switch_1 = ?)
+'''
+
+class StatusStorage(ABC):
+    """Where the monitor keeps devices, status history and datapoints.
+
+    Device rows follow DEVICE_COLUMNS, status rows are (device_id,
+    timestamp, switch_1) and datapoint rows are (device_id, code_id,
+    timestamp, value_bool, value_int, value_float, value_text).
+    """
+
+    @abstractmethod
+    def write_batch(self, devices, statuses, datapoints, guarded=False, rollups=False):
+        """Upsert devices and append statuses and datapoints in one transaction.
+
+        guarded=True skips status rows that repeat the device's latest stored
+        state; rollups=True also updates the on-time rollups, where supported.
+        """
+
+    def upsert_devices(self, devices):
+        self.write_batch(devices, [], [])
+
+    def is_permanent_error(self, error):
+        """True if write_batch failed on the rows themselves (e.g. a value too long
+        for its column), so retrying them can never succeed"""
+        # By name, which covers pyodbc and sqlite3 alike (both follow DB-API 2.0)
+        return type(error).__name__ in ('DataError', 'IntegrityError') or isinstance(error, (TypeError, ValueError))
+
+    @abstractmethod
+    def device_rows(self):
+        """Every stored device row"""
+
+    @abstractmethod
+    def last_states(self):
+        """{device_id: (switch_1, timestamp)} of the latest status row of every device"""
+
+    @abstractmethod
+    def history(self, start, end, device_ids=None, batch_size=5000):
+        """Yield batches of (device_id, device_name, timestamp, switch_1) in [start, end),
+        ordered by device and time"""
+
+    @abstractmethod
+    def datapoint_codes(self):
+        """{code: code_id} of every registered datapoint code"""
+
+    @abstractmethod
+    def register_code(self, code):
+        """Return the id of a datapoint code, registering it if it is new"""
+
+    @abstractmethod
+    def latest_datapoints(self):
+        """(code, device_id, value_bool, value_int, value_float, value_text) of the
+        latest value of every datapoint"""
+
+    def close(self):
+        pass
+
+class SqlServerStorage(StatusStorage):
+    """The SQL Server database from .env, through the shared connection pool"""
+
+    def __init__(self, fast_executemany=None):
+        if fast_executemany is None:
+            fast_executemany = os.getenv('WRITE_BEHIND_FAST_EXECUTEMANY', 'yes').lower() in ('1', 'true', 'yes')
+        self.fast_executemany = fast_executemany
+
+    def _connection(self):
+        # Imported here, so the SQLite backend runs without pyodbc and the ODBC driver
+        from database.db_utils import db_connection
+        return db_connection()
+
+    def write_batch(self, devices, statuses, datapoints, guarded=False, rollups=False):
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.fast_executemany = self.fast_executemany
+            if devices:
+                with metrics.DB_LATENCY.labels('upsert_devices').time():
+                    cursor.executemany(UPSERT_DEVICE_SQL, list(devices))
+            if statuses and guarded:
+                with metrics.DB_LATENCY.labels('insert_status').time():
+                    cursor.executemany(INSERT_STATUS_GUARDED_SQL, [
+                        (device_id, timestamp, switch_1, device_id, switch_1)
+                        for device_id, timestamp, switch_1 in statuses
+                    ])
+            elif statuses:
+                with metrics.DB_LATENCY.labels('insert_status').time():
+                    cursor.executemany(INSERT_STATUS_SQL, list(statuses))
+            if datapoints:
+                with metrics.DB_LATENCY.labels('insert_datapoints').time():
+                    cursor.executemany(INSERT_DATAPOINT_SQL, list(datapoints))
+            if statuses and rollups:
+                with metrics.DB_LATENCY.labels('rollups').time():
+                    apply_status_rollups(cursor, statuses)
+            with metrics.DB_LATENCY.labels('commit').time():
+                conn.commit()
+
+    def device_rows(self):
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT {', '.join(DEVICE_COLUMNS)} FROM devices")
+            return [tuple(row) for row in cursor.fetchall()]
+
+    def last_states(self):
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(LATEST_STATES_SQL)
+            return {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+
+    def history(self, start, end, device_ids=None, batch_size=5000):
+        # The pooled connection is held until the generator is exhausted or closed
+        device_ids = list(device_ids or [])
+        device_filter = f" AND ds.device_id IN ({', '.join('?' * len(device_ids))})" if device_ids else ""
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.arraysize = batch_size
+            cursor.execute(HISTORY_SQL.format(device_filter=device_filter), (int(start), int(end), *device_ids))
+            try:
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        return
+                    yield [tuple(row) for row in rows]
+            finally:
+                cursor.close()
+
+    def datapoint_codes(self):
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT code, code_id FROM datapoint_codes")
+            return {code: code_id for code, code_id in cursor.fetchall()}
+
+    def register_code(self, code):
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(REGISTER_CODE_SQL, (code, code, code))
+            code_id = cursor.fetchone()[0]
+            conn.commit()
+        return code_id
+
+    def latest_datapoints(self):
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(LATEST_DATAPOINTS_SQL)
+            return [tuple(row) for row in cursor.fetchall()]
+
+class SQLiteStorage(StatusStorage):
+    """An embedded SQLite database in WAL mode, for a single node without SQL Server.
+
+    Writes go through one connection and are batched by the write-behind
+    queue, so each flush is one transaction with a single fsync at most
+    (synchronous=NORMAL). Readers use their own connections and, in WAL
+    mode, never block the writer. The schema is created on first use.
+    Rollups, retention and sharding leases remain SQL Server features.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.getenv('SQLITE_PATH', 'tuya_monitor.db')
+        self._lock = threading.Lock()
+        self._conn = self._connect()
+        self._conn.executescript(SQLITE_SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def write_batch(self, devices, statuses, datapoints, guarded=False, rollups=False):
+        with self._lock:
+            try:
+                if devices:
+                    with metrics.DB_LATENCY.labels('upsert_devices').time():
+                        self._conn.executemany(SQLITE_UPSERT_DEVICE_SQL, devices)
+                if statuses and guarded:
+                    with metrics.DB_LATENCY.labels('insert_status').time():
+                        self._conn.executemany(SQLITE_INSERT_STATUS_GUARDED_SQL, [
+                            (device_id, timestamp, switch_1, device_id, switch_1)
+                            for device_id, timestamp, switch_1 in statuses
+                        ])
+                elif statuses:
+                    with metrics.DB_LATENCY.labels('insert_status').time():
+                        self._conn.executemany(INSERT_STATUS_SQL, statuses)
+                if datapoints:
+                    with metrics.DB_LATENCY.labels('insert_datapoints').time():
+                        self._conn.executemany(INSERT_DATAPOINT_SQL, datapoints)
+                with metrics.DB_LATENCY.labels('commit').time():
+                    self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+
+    def device_rows(self):
+        return self._read(f"SELECT {', '.join(DEVICE_COLUMNS)} FROM devices")
+
+    def last_states(self):
+        rows = self._read("SELECT device_id, switch_1, timestamp FROM device_last_state")
+        return {device_id: (switch_1, timestamp) for device_id, switch_1, timestamp in rows}
+
+    def history(self, start, end, device_ids=None, batch_size=5000):
+        device_ids = list(device_ids or [])
+        device_filter = f" AND ds.device_id IN ({', '.join('?' * len(device_ids))})" if device_ids else ""
+        conn = self._connect()
+        try:
+            cursor = conn.execute(HISTORY_SQL.format(device_filter=device_filter), (int(start), int(end), *device_ids))
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    return
+                # SQLite stores switch_1 as 0/1; return bools like SQL Server's BIT
+                yield [(device_id, name, timestamp, None if switch_1 is None else bool(switch_1))
+                       for device_id, name, timestamp, switch_1 in rows]
+        finally:
+            conn.close()
+
+    def datapoint_codes(self):
+        return dict(self._read("SELECT code, code_id FROM datapoint_codes"))
+
+    def register_code(self, code):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR IGNORE INTO datapoint_codes (code) VALUES (?)", (code,))
+            return self._conn.execute("SELECT code_id FROM datapoint_codes WHERE code = ?", (code,)).fetchone()[0]
+
+    def latest_datapoints(self):
+        return self._read(LATEST_DATAPOINTS_SQL)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def is_permanent_error(self, error):
+        # sqlite3 reports unbindable parameters as InterfaceError or ProgrammingError
+        return super().is_permanent_error(error) or isinstance(
+            error, (sqlite3.InterfaceError, sqlite3.ProgrammingError))
+
+    def _read(self, sql, params=()):
+        conn = self._connect()
+        try:
+            return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+_storage = None
+_storage_lock = threading.Lock()
+
+def get_storage():
+    """The process-wide storage backend: STORAGE_BACKEND=sqlserver (default) or sqlite"""
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            backend = os.getenv('STORAGE_BACKEND', 'sqlserver').lower()
+            if backend == 'sqlserver':
+                _storage = SqlServerStorage()
+            elif backend == 'sqlite':
+                _storage = SQLiteStorage()
+            else:
+                raise ValueError(f"Unknown storage backend: {backend}")
+        return _storage
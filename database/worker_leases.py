@@ -0,0 +1,68 @@
+
+# One row per running monitor worker. A worker is alive while its heartbeat is
+# younger than the lease TTL. Times come from the database clock, so hosts with
+# skewed clocks still agree on who is alive.
+CREATE_WORKER_LEASES_SQL = '''
+IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = 'monitor_workers')
+BEGIN
+    CREATE TABLE monitor_workers (
+        worker_id VARCHAR(255) PRIMARY KEY,
+        host VARCHAR(255),
+        started_at DATETIME2 NOT NULL,
+        heartbeat_at DATETIME2 NOT NULL
+    )
+END
+'''
+
+HEARTBEAT_SQL = '''
+MERGE monitor_workers WITH (HOLDLOCK) AS target
+USING (VALUES (?, ?)) AS source (worker_id, host)
+ON target.worker_id = source.worker_id
+WHEN MATCHED THEN
+    UPDATE SET heartbeat_at = SYSUTCDATETIME()
+WHEN NOT MATCHED THEN
+    INSERT (worker_id, host, started_at, heartbeat_at)
+    VALUES (source.worker_id, source.host, SYSUTCDATETIME(), SYSUTCDATETIME());
+'''
+
+LIVE_WORKERS_SQL = '''
+SELECT worker_id
+FROM monitor_workers
+WHERE heartbeat_at > DATEADD(millisecond, -?, SYSUTCDATETIME())
+'''
+
+# Rows of workers that died long ago are only kept for a while, for inspection
+PURGE_WORKERS_SQL = '''
+DELETE FROM monitor_workers
+WHERE heartbeat_at < DATEADD(millisecond, -?, SYSUTCDATETIME())
+'''
+
+class WorkerLeases:
+    """Heartbeat rows in monitor_workers, shared by every monitor worker"""
+
+    def __init__(self, worker_id, host, lease_ttl):
+        self.worker_id = worker_id
+        self.host = host
+        self.lease_ttl = lease_ttl
+
+    def heartbeat(self):
+        """Renew this worker's lease and return the ids of every live worker"""
+        from database.db_utils import db_connection  # Sharding is SQL Server only; keep pyodbc off other paths
+
+        ttl_ms = int(self.lease_ttl * 1000)
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(HEARTBEAT_SQL, (self.worker_id, self.host))
+            cursor.execute(PURGE_WORKERS_SQL, (ttl_ms * 100,))
+            conn.commit()
+            cursor.execute(LIVE_WORKERS_SQL, (ttl_ms,))
+            return [row[0] for row in cursor.fetchall()]
+
+    def leave(self):
+        """Drop this worker's lease so the others take over its devices right away"""
+        from database.db_utils import db_connection
+
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM monitor_workers WHERE worker_id = ?", (self.worker_id,))
+            conn.commit()
@@ -0,0 +1,276 @@
+import os
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+
+from database.storage import get_storage
+from database.datapoints import DatapointCodes
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+def device_row(device_data):
+    """A devices row (storage.DEVICE_COLUMNS) from a Tuya device info payload"""
+    return (
+        device_data.get('id'),
+        device_data.get('name'),
+        device_data.get('category'),
+        device_data.get('online'),
+        device_data.get('active_time'),
+        device_data.get('create_time'),
+        device_data.get('update_time'),
+        device_data.get('ip'),
+        device_data.get('model'),
+        device_data.get('time_zone')
+    )
+
+class WriteBehindQueue:
+    """Collects status changes and writes them to the storage backend in bulk.
+
+    A background thread flushes when max_batch_size rows are waiting or
+    flush_interval seconds after the oldest unflushed row, whichever comes
+    first. Each flush is one StatusStorage.write_batch transaction: on SQL
+    Server one executemany MERGE for the devices involved (last payload per
+    device wins) and one executemany INSERT each for the status rows and the
+    datapoint rows.
+
+    Memory is bounded by max_queue_size plus one batch. When the queue is
+    full, enqueue() blocks (backpressure) for up to put_timeout seconds
+    (WRITE_BEHIND_PUT_TIMEOUT, default 30) and then raises queue.Full. A
+    flush that fails on a transient error, such as a lost connection, is
+    retried every flush_interval; meanwhile the queue fills and slows
+    producers down. A flush that fails on the rows themselves (see
+    StatusStorage.is_permanent_error) is split in halves until the bad
+    changes are isolated; those go to the dead_letter file as JSON lines
+    (WRITE_BEHIND_DEAD_LETTER) and the rest is written. close() drains and
+    flushes everything, and is registered with atexit.
+
+    Datapoint rows are queued with their code and get its code_id when they
+    are flushed, from codes (a DatapointCodes), so queueing and spooling a
+    change never need the database; registering a new code fails the flush
+    like any other statement would.
+
+    With a device_cache, the device MERGE is skipped for payloads whose
+    metadata matches what is already stored. With guarded_inserts, a status
+    row is only inserted if it differs from the device's latest stored row,
+    which makes it safe to run several monitors against one database.
+
+    With rollups (the default), each flush also folds its status rows into
+    the hourly and daily rollup tables, in the same transaction (SQL Server
+    only).
+
+    With a spool, changes go to disk first instead of to the in-memory
+    queue. Flushes read them back batch by batch and acknowledge them once
+    committed, so a database outage only grows the spool (up to its
+    max_bytes) and a restart resumes where the last commit left off.
+    Records replayed from a previous run are written with guarded inserts,
+    since some of them may already be stored.
+    """
+
+    def __init__(self, max_batch_size=None, flush_interval=None, max_queue_size=None,
+                 put_timeout=None, device_cache=None, guarded_inserts=None, rollups=None,
+                 storage=None, spool=None, dead_letter=None, codes=None):
+        self.max_batch_size = max_batch_size or int(os.getenv('WRITE_BEHIND_BATCH_SIZE', '500'))
+        self.flush_interval = flush_interval or float(os.getenv('WRITE_BEHIND_FLUSH_INTERVAL', '1.0'))
+        max_queue_size = max_queue_size or int(os.getenv('WRITE_BEHIND_MAX_QUEUE', '10000'))
+        self.put_timeout = put_timeout or float(os.getenv('WRITE_BEHIND_PUT_TIMEOUT', '30'))
+        self.dead_letter = dead_letter or os.getenv('WRITE_BEHIND_DEAD_LETTER', 'write_behind_dead_letter.jsonl')
+        self.storage = storage or get_storage()
+        self.codes = codes or DatapointCodes(self.storage)
+        self.device_cache = device_cache  # Optional DeviceMetadataCache
+        if guarded_inserts is None:
+            guarded_inserts = os.getenv('WRITE_BEHIND_GUARDED_INSERTS', '').lower() in ('1', 'true', 'yes')
+        self.guarded_inserts = guarded_inserts
+        if rollups is None:
+            rollups = os.getenv('WRITE_BEHIND_ROLLUPS', 'yes').lower() in ('1', 'true', 'yes')
+        self.rollups = rollups
+
+        self.spool = spool  # Optional Spool, used in place of the in-memory queue
+        self._queue = queue.Queue(max_queue_size) if spool is None else spool
+        self._replayed = 0 if spool is None else spool.qsize()  # Recovered records not yet committed
+        self._pending = []  # Rows taken off the queue but not yet committed
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'enqueued': 0, 'flushed_rows': 0, 'flushed_datapoints': 0, 'flushes': 0,
+            'failed_flushes': 0, 'dead_letters': 0, 'backpressure_waits': 0, 'last_flush_seconds': 0.0
+        }
+
+        self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def enqueue(self, device_data, device_id, timestamp, switch_1, datapoints=()):
+        """Queue one device's changes plus the device upsert that goes with them.
+
+        switch_1=None writes no device_status row; datapoints are rows from
+        DatapointTracker.rows, with the code in place of its code_id. device_data=None
+        skips the upsert, for pushed events that carry no device metadata.
+        """
+        if self._stop.is_set():
+            raise RuntimeError("Write-behind queue is closed")
+        device = None if device_data is None else device_row(device_data)
+        if device is not None and self.device_cache is not None and not self.device_cache.needs_upsert(device):
+            device = None
+        status = None if switch_1 is None else (device_id, timestamp, switch_1)
+        item = (device, status, list(datapoints))
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self._count('backpressure_waits')
+            self._queue.put(item, timeout=self.put_timeout)
+        self._count('enqueued')
+
+    def flush(self):
+        """Write everything queued so far; returns True if it was committed"""
+        with self._flush_lock:
+            if self.spool is None:
+                self._drain()
+                return self._write_pending()
+            # Batch by batch, so a spool that grew during an outage isn't read into memory at once
+            while True:
+                self._drain(self.max_batch_size - len(self._pending))
+                if not self._pending:
+                    return True
+                if not self._write_pending():
+                    return False
+
+    def close(self, timeout=30):
+        """Stop the background thread and flush whatever is still queued"""
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        if self.spool is not None:
+            if not self.flush():
+                print(f"Write-behind queue closed with {self.spool.stats()['unacknowledged']} changes "
+                      f"left in the spool for the next run")
+            self.spool.close()
+        elif not self.flush():
+            print(f"Write-behind queue closed with {len(self._pending)} unwritten status rows")
+
+    def stats(self):
+        with self._stats_lock:
+            return dict(self._stats, queued=self._queue.qsize(), pending=len(self._pending))
+
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            self._stats[name] += amount
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._collect()
+            with self._flush_lock:
+                if not self._write_pending():
+                    self._stop.wait(self.flush_interval)  # Back off before retrying
+
+    def _collect(self):
+        # Wait for the first row, then give the batch flush_interval to fill up.
+        # Rows left over from a failed flush count towards max_batch_size.
+        deadline = None
+        while len(self._pending) < self.max_batch_size and not self._stop.is_set():
+            timeout = self.flush_interval if deadline is None else deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            if self.spool is not None:
+                # Taken under the lock, so _pending stays in spool order for acknowledge()
+                if not self.spool.wait(timeout):
+                    break
+                with self._flush_lock:
+                    self._drain(self.max_batch_size - len(self._pending))
+            else:
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                with self._flush_lock:
+                    self._pending.append(item)
+            if deadline is None:
+                deadline = time.monotonic() + self.flush_interval
+
+    def _drain(self, limit=None):
+        # Caller holds self._flush_lock
+        while limit is None or limit > 0:
+            if limit is not None:
+                limit -= 1
+            try:
+                self._pending.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+
+    def _write_pending(self):
+        # Caller holds self._flush_lock
+        if not self._pending:
+            return True
+        resolved = self._write_items(self._pending)
+        if self.spool is not None and resolved:
+            self.spool.acknowledge(resolved)
+            self._replayed = max(0, self._replayed - resolved)
+        self._pending = self._pending[resolved:]
+        return not self._pending
+
+    def _write_items(self, items):
+        """Write items, isolating rows that can never be written; returns how many
+        leading items were written or dead-lettered"""
+        try:
+            self._write_batch(items)
+            return len(items)
+        except Exception as e:
+            if not self.storage.is_permanent_error(e):
+                self._count('failed_flushes')
+                metrics.ERRORS.labels('flush').inc()
+                print(f"Error flushing {len(items)} changes, will retry: {e}")
+                return 0
+            if len(items) == 1:
+                self._write_dead_letter(items[0], e)
+                return 1
+        # Left half first, so what is resolved is always a prefix (the spool acknowledges in order)
+        half = len(items) // 2
+        resolved = self._write_items(items[:half])
+        if resolved < half:
+            return resolved
+        return half + self._write_items(items[half:])
+
+    def _write_batch(self, items):
+        devices = {}
+        statuses = []
+        datapoints = []
+        for device, status, datapoint_rows in items:
+            if device is not None:
+                devices[device[0]] = device
+            if status is not None:
+                statuses.append(status)
+            # Spools written before rows carried codes hold code ids already
+            datapoints.extend((device_id, code if isinstance(code, int) else self.codes.code_id(code), *rest)
+                              for device_id, code, *rest in datapoint_rows)
+
+        start = time.perf_counter()
+        self.storage.write_batch(list(devices.values()), statuses, datapoints,
+                                 guarded=self.guarded_inserts or self._replayed > 0, rollups=self.rollups)
+        with self._stats_lock:
+            self._stats['flushes'] += 1
+            self._stats['flushed_rows'] += len(statuses)
+            self._stats['flushed_datapoints'] += len(datapoints)
+            self._stats['last_flush_seconds'] = time.perf_counter() - start
+        metrics.DB_LATENCY.labels('flush').observe(self._stats['last_flush_seconds'])
+        logger.debug("Flushed %d status rows and %d datapoints for %d devices",
+                     len(statuses), len(datapoints), len(devices))
+
+    def _write_dead_letter(self, item, error):
+        device, status, datapoint_rows = item
+        if device is not None and self.device_cache is not None:
+            # needs_upsert() took the row as stored when it was queued; upsert it again next time
+            self.device_cache.forget(device[0])
+        self._count('dead_letters')
+        metrics.ERRORS.labels('dead_letter').inc()
+        print(f"Dropping a change the database rejects ({error}); saved to {self.dead_letter}")
+        try:
+            with open(self.dead_letter, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({'time': int(time.time()), 'error': str(error), 'device': device,
+                                    'status': status, 'datapoints': datapoint_rows}, default=str) + '\n')
+        except OSError as e:
+            print(f"Error writing to {self.dead_letter}: {e}")
@@ -0,0 +1,303 @@
+import os
+import time
+import json
+import asyncio
+import logging
+from typing import Optional, Dict, Any, List
+
+from tuya.tuya_client import TuyaClient
+from tuya.token_manager import TOKEN_INVALID_CODES
+from tuya.rate_limit import endpoint_class, RateLimitExceeded
+from utils import metrics
+
+try:
+    import aiohttp
+    from multidict import CIMultiDict, CIMultiDictProxy  # aiohttp dependencies
+    from yarl import URL
+except ImportError:  # Optional dependency, only needed for the async client
+    aiohttp = None
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncTuyaClient(TuyaClient):
+    """asyncio variant of TuyaClient.
+
+    Request signing (get_headers / _generate_signature) is inherited unchanged;
+    only the transport is asynchronous. At most `max_concurrency` requests are
+    in flight at once, so a fleet sweep runs in parallel instead of serially.
+
+    Use it as an async context manager, or call close() when done:
+
+        async with AsyncTuyaClient() as client:
+            devices = await client.get_devices_info(device_ids)
+    """
+    _client = None  # Not TuyaClient's: get_client() must return the async client
+
+    def __init__(self, endpoint: Optional[str] = None, access_id: Optional[str] = None,
+                 access_secret: Optional[str] = None, max_concurrency: Optional[int] = None,
+                 timeout: Optional[float] = None, rate_limiter=None, response_cache=None):
+        super().__init__(endpoint, access_id, access_secret, timeout=timeout,
+                         rate_limiter=rate_limiter, response_cache=response_cache)
+        self.max_concurrency = max_concurrency or int(os.getenv('TUYA_MAX_CONCURRENCY', '20'))
+        self._session = None
+        self._semaphore = None
+
+    @classmethod
+    def get_client(cls) -> 'AsyncTuyaClient':
+        # The token is fetched lazily by the first request, inside the event loop
+        if cls._client is None:
+            cls._client = cls()
+        return cls._client
+
+    async def __aenter__(self) -> 'AsyncTuyaClient':
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        super().close()
+
+    def _get_session(self) -> 'aiohttp.ClientSession':
+        if aiohttp is None:
+            raise ImportError("AsyncTuyaClient requires aiohttp: pip install aiohttp")
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_concurrency),
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._session
+
+    async def _request(self, method: str, url: str, headers: Dict, json_body: Any = None):
+        session = self._get_session()
+        endpoint = endpoint_class(method, url)
+        async with self._semaphore:
+            started = time.perf_counter()
+            try:
+                async with session.request(method, f"{self.endpoint}{url}",
+                                           headers=headers, json=json_body) as response:
+                    status, text = response.status, await response.text()
+                    retry_after = response.headers.get('Retry-After')
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                metrics.API_ERRORS.labels(endpoint, type(e).__name__).inc()
+                raise
+            # Parsed whatever the content type, which Tuya doesn't always set; error pages
+            # from a proxy (HTML 429, 502, 503) have no payload, like TuyaClient._request
+            try:
+                payload = json.loads(text)
+            except ValueError:
+                payload = None
+            metrics.API_LATENCY.labels(endpoint).observe(time.perf_counter() - started)
+            if status >= 400:
+                metrics.API_ERRORS.labels(endpoint, str(status)).inc()
+            elif isinstance(payload, dict) and not payload.get('success', True):
+                metrics.API_ERRORS.labels(endpoint, str(payload.get('code'))).inc()
+            return status, payload, retry_after
+
+    async def _limited_request(self, method: str, url: str, body: str, json_body: Any = None):
+        # Same rate limiting as TuyaClient._request, waiting with asyncio.sleep
+        endpoint = endpoint_class(method, url)
+        for _ in range(self.rate_limiter.max_retries + 1):
+            await asyncio.sleep(self.rate_limiter.reserve(endpoint))
+            headers = await self._get_headers(method, url, body)
+            status, payload, retry_after = await self._request(method, url, headers, json_body)
+            if not self.rate_limiter.is_rate_limited(status, payload):
+                self.rate_limiter.succeeded(endpoint)
+                return headers.get('access_token'), status, payload
+            try:
+                retry_after = float(retry_after)
+            except (TypeError, ValueError):
+                retry_after = None
+            self.rate_limiter.throttled(endpoint, retry_after)
+
+        self.rate_limiter.gave_up(endpoint)
+        return headers.get('access_token'), status, payload
+
+    async def _get_headers(self, method: str, url: str, body: str = '') -> Dict:
+        # get_headers() blocks in tokens.get() while a token is fetched; fetch it in an executor first
+        if not url.startswith('/v1.0/token') and not self.tokens.current():
+            await self.initialize_token()
+        return self.get_headers(method, url, body)
+
+    async def initialize_token(self) -> str:
+        # Token requests go through the blocking TokenManager; keep them off the event loop
+        return await asyncio.get_running_loop().run_in_executor(None, self.tokens.get)
+
+    async def _invalidate_token(self, stale_token: str) -> None:
+        await asyncio.get_running_loop().run_in_executor(None, self.tokens.invalidate, stale_token)
+
+    async def get_token(self, refresh_token: str = '') -> Dict:
+        url = f"/v1.0/token/{refresh_token}" if refresh_token else '/v1.0/token?grant_type=1'
+        _, payload, _ = await self._request('GET', url, await self._get_headers('GET', url))
+        return payload
+
+    async def send(self, method: str, url: str, options: Dict = None) -> Dict:
+        if options is None:
+            options = {}
+
+        method = method.upper()
+        url = self._replace_params_in_url(url, options.get('params', {}))
+        url = self._append_query_to_url(url, options.get('query', {}))
+
+        body = json.dumps(options.get('body', '')) if 'body' in options else ''
+        json_body = options.get('body') if 'body' in options else None
+
+        logger.debug("Making request to: %s", url)
+
+        access_token, status, payload = await self._limited_request(method, url, body, json_body)
+        if status == 401 or (isinstance(payload, dict) and payload.get('code') in TOKEN_INVALID_CODES):
+            logger.debug("Token expired, refreshing...")
+            await self._invalidate_token(access_token)
+            _, status, payload = await self._limited_request(method, url, body, json_body)
+            if status == 401:
+                raise self._response_error(method, url, 401, "401 Unauthorized after token refresh")
+        if status >= 400 or payload is None:
+            raise self._response_error(method, url, status, str(payload))
+        return payload
+
+    def _response_error(self, method: str, url: str, status: int, message: str) -> 'aiohttp.ClientResponseError':
+        # With a request_info, which ClientResponseError's str() reads the URL from
+        full_url = URL(f"{self.endpoint}{url}")
+        request_info = aiohttp.RequestInfo(full_url, method, CIMultiDictProxy(CIMultiDict()), full_url)
+        return aiohttp.ClientResponseError(request_info, (), status=status, message=message)
+
+    async def get_device_info(self, device_id: str, use_cache: bool = True) -> Dict:
+        """
+        Get device information by device ID
+
+        Args:
+            device_id (str): The Tuya device ID
+            use_cache (bool): Serve a fresh cached response if there is one
+
+        Returns:
+            Dict: Device information response from Tuya API
+        """
+        url = f'/v1.0/devices/{device_id}'
+        if not use_cache:
+            return await self.send('GET', url)
+        return await self.response_cache.get_or_load_async(('device_info', device_id),
+                                                           lambda: self.send('GET', url))
+
+    async def get_devices_info(self, device_ids: List[str]) -> Dict[str, Dict]:
+        """
+        Get device information for many devices, with all batches in flight at once
+
+        Args:
+            device_ids (List[str]): The Tuya device IDs, sent DEVICE_BATCH_SIZE per request
+
+        Returns:
+            Dict[str, Dict]: Device information keyed by device ID. Devices missing from
+                             the response or belonging to a failed chunk are left out.
+        """
+        chunks = self._chunk_device_ids(device_ids)
+        generations = {device_id: self.response_cache.generation(device_id) for device_id in device_ids}
+        responses = await asyncio.gather(
+            *(self.send('GET', '/v1.0/devices', {'query': {'device_ids': ','.join(chunk)}})
+              for chunk in chunks),
+            return_exceptions=True
+        )
+
+        devices = {}
+        for chunk, response in zip(chunks, responses):
+            if isinstance(response, Exception):
+                logger.warning(f"Batch request for {len(chunk)} devices failed: {response}")
+                continue
+            if not response.get('success'):
+                logger.warning(f"Batch request for {len(chunk)} devices failed: {response.get('msg')}")
+                continue
+            for device in self._extract_devices(response.get('result')):
+                devices[device.get('id')] = device
+            self._cache_devices(response, devices, {device_id: generations[device_id] for device_id in chunk})
+        return devices
+
+    async def get_device_status(self, device_id: str, use_cache: bool = True) -> Dict:
+        """
+        Get device status by device ID
+
+        Args:
+            device_id (str): The Tuya device ID
+            use_cache (bool): Serve a fresh cached response if there is one
+
+        Returns:
+            Dict: Device status response from Tuya API
+        """
+        url = f'/v1.0/devices/{device_id}/status'
+        if not use_cache:
+            return await self.send('GET', url)
+        return await self.response_cache.get_or_load_async(('device_status', device_id),
+                                                           lambda: self.send('GET', url))
+
+    async def control_device(self, device_id: str, commands: list) -> Dict:
+        """
+        Control device by sending commands
+
+        Args:
+            device_id (str): The Tuya device ID
+            commands (list): List of commands to send to the device
+                           Each command should be a dict with 'code' and 'value'
+
+        Returns:
+            Dict: Response from Tuya API
+        """
+        try:
+            return await self.send('POST', f'/v1.0/devices/{device_id}/commands', {
+                'body': {
+                    'commands': commands
+                }
+            })
+        finally:
+            # Even a failed command may have reached the device
+            self.response_cache.invalidate(device_id)
+
+    async def control_devices(self, commands: Dict[str, list], max_concurrency: Optional[int] = None,
+                              max_retries: Optional[int] = None) -> Dict:
+        """
+        Send commands to many devices in parallel
+
+        Same behaviour and result as TuyaClient.control_devices; max_concurrency
+        defaults to TUYA_CONTROL_CONCURRENCY, or the client's max_concurrency.
+
+        Args:
+            commands (Dict[str, list]): Commands keyed by device ID, as for control_device
+            max_concurrency (int): Devices controlled at once
+            max_retries (int): Retries per device after a transient failure
+
+        Returns:
+            Dict: 'results' keyed by device ID, each with 'success', 'attempts', 'response'
+                  and 'error'; 'succeeded' and 'failed' device counts; 'elapsed' seconds
+        """
+        self._get_session()  # Fail here, not once per device, without aiohttp
+        max_concurrency, max_retries = self._bulk_control_limits(
+            max_concurrency or int(os.getenv('TUYA_CONTROL_CONCURRENCY', str(self.max_concurrency))),
+            max_retries
+        )
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def control(device_id, device_commands):
+            async with semaphore:
+                for attempt in range(1, max_retries + 2):
+                    response = error = None
+                    try:
+                        response = await self.control_device(device_id, device_commands)
+                    except Exception as e:
+                        error = e
+                    if attempt > max_retries or not self._is_transient(response, error):
+                        return self._control_result(response, error, attempt)
+                    await asyncio.sleep(self._retry_delay(attempt))
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(control(device_id, device_commands)
+                                         for device_id, device_commands in commands.items()))
+        return self._bulk_control_summary(dict(zip(commands, results)), start)
+
+    def _is_transient(self, response: Optional[Dict], error: Optional[Exception]) -> bool:
+        if isinstance(error, aiohttp.ClientResponseError):
+            return error.status >= 500 or error.status == 429
+        if isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError, RateLimitExceeded)):
+            return True
+        return error is None and self.rate_limiter.is_rate_limited(200, response)
@@ -0,0 +1,176 @@
+import os
+import time
+import random
+import logging
+import threading
+from typing import Optional, Dict
+
+logger = logging.getLogger(__name__)
+
+# Requests per second for each endpoint class; override with TUYA_RATE_LIMITS
+DEFAULT_RATE_LIMITS = {'devices': 10.0, 'commands': 5.0, 'token': 1.0, 'default': 10.0}
+
+# In-body error codes Tuya uses for quota and frequency limits (TUYA_RATE_LIMIT_CODES)
+DEFAULT_RATE_LIMIT_CODES = (1110, 40000309)
+
+
+class RateLimitExceeded(Exception):
+    """A request would have to wait longer than the limiter's max_wait"""
+
+
+def endpoint_class(method: str, url: str) -> str:
+    """Rate limit class of a request: 'token', 'commands', 'devices' or 'default'"""
+    path = url.split('?', 1)[0]
+    if path.startswith('/v1.0/token'):
+        return 'token'
+    if method == 'POST' and path.endswith('/commands'):
+        return 'commands'
+    if path.startswith('/v1.0/devices') or path.startswith('/v1.0/iot-03/devices'):
+        return 'devices'
+    return 'default'
+
+
+def parse_rate_limits(spec: str) -> Dict[str, float]:
+    """Parse 'devices=10,commands=5' into {'devices': 10.0, 'commands': 5.0}"""
+    limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, _, rate = item.partition('=')
+        limits[name.strip()] = float(rate)
+    return limits
+
+
+class _Bucket:
+    def __init__(self, rate: float):
+        self.configured_rate = rate
+        self.rate = rate
+        self.capacity = max(1.0, rate)  # One second of burst
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.backoff_until = 0.0
+        self.consecutive_throttles = 0
+        self.stats = {'allowed': 0, 'queued': 0, 'throttled': 0, 'rejected': 0, 'wait_seconds': 0.0}
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+class RateLimiter:
+    """Client-side token buckets for the Tuya API quota, one per endpoint class.
+
+    reserve() takes a token and returns how long the caller must wait before
+    sending, so the same limiter serves blocking and asyncio callers. When the
+    API still reports a rate limit (HTTP 429 or an in-body code), the class's
+    rate is halved and further requests back off exponentially with full
+    jitter; successful requests raise the rate back to its configured value.
+    Requests that would wait longer than max_wait raise RateLimitExceeded.
+    """
+
+    def __init__(self, limits: Optional[Dict[str, float]] = None, max_wait: Optional[float] = None,
+                 max_retries: Optional[int] = None, base_backoff: Optional[float] = None,
+                 max_backoff: Optional[float] = None, rate_limit_codes=None):
+        if limits is None:
+            limits = dict(DEFAULT_RATE_LIMITS, **parse_rate_limits(os.getenv('TUYA_RATE_LIMITS', '')))
+        self.max_wait = max_wait if max_wait is not None else float(os.getenv('TUYA_RATE_LIMIT_MAX_WAIT', '30'))
+        self.max_retries = (max_retries if max_retries is not None
+                            else int(os.getenv('TUYA_RATE_LIMIT_RETRIES', '3')))
+        self.base_backoff = base_backoff or float(os.getenv('TUYA_RATE_LIMIT_BACKOFF', '0.5'))
+        self.max_backoff = max_backoff or 30.0
+        if rate_limit_codes is None:
+            codes = os.getenv('TUYA_RATE_LIMIT_CODES')
+            rate_limit_codes = ([int(c) for c in codes.split(',') if c.strip()] if codes
+                                else DEFAULT_RATE_LIMIT_CODES)
+        self.rate_limit_codes = frozenset(rate_limit_codes)
+
+        self._lock = threading.Lock()
+        self._default_rate = limits.get('default', DEFAULT_RATE_LIMITS['default'])
+        self._buckets = {name: _Bucket(rate) for name, rate in limits.items()}
+
+    def reserve(self, endpoint: str) -> float:
+        """
+        Take one request from an endpoint class's budget
+
+        Args:
+            endpoint (str): Endpoint class, see endpoint_class()
+
+        Returns:
+            float: Seconds to wait before sending the request
+        """
+        with self._lock:
+            bucket = self._bucket(endpoint)
+            now = time.monotonic()
+            bucket.refill(now)
+            bucket.tokens -= 1
+            wait = max(bucket.backoff_until - now, -bucket.tokens / bucket.rate, 0.0)
+            if wait > self.max_wait:
+                bucket.tokens += 1
+                bucket.stats['rejected'] += 1
+                raise RateLimitExceeded(f"'{endpoint}' requests would wait {wait:.1f} s")
+            bucket.stats['allowed'] += 1
+            if wait > 0:
+                bucket.stats['queued'] += 1
+                bucket.stats['wait_seconds'] += wait
+            return wait
+
+    def is_rate_limited(self, status_code: int, payload: Optional[Dict]) -> bool:
+        """True if a response means the quota was exceeded"""
+        if status_code == 429:
+            return True
+        return isinstance(payload, dict) and payload.get('code') in self.rate_limit_codes
+
+    def throttled(self, endpoint: str, retry_after: Optional[float] = None) -> None:
+        """Record a rate-limited response: halve the class's rate and back off"""
+        with self._lock:
+            bucket = self._bucket(endpoint)
+            bucket.stats['throttled'] += 1
+            now = time.monotonic()
+            if now < bucket.backoff_until:
+                return  # Sent before the current backoff began; don't compound it
+            bucket.consecutive_throttles += 1
+            bucket.rate = max(bucket.configured_rate / 16, bucket.rate / 2)
+            backoff = random.uniform(0, min(self.max_backoff,
+                                            self.base_backoff * 2 ** bucket.consecutive_throttles))
+            bucket.backoff_until = now + max(backoff, retry_after or 0)
+            rate = bucket.rate
+        logger.warning(f"Tuya API rate limit hit for '{endpoint}' requests; slowing to {rate:.2f}/s")
+
+    def succeeded(self, endpoint: str) -> None:
+        """Record a successful response: recover the class's rate additively"""
+        with self._lock:
+            bucket = self._bucket(endpoint)
+            bucket.consecutive_throttles = 0
+            if bucket.rate < bucket.configured_rate:
+                bucket.rate = min(bucket.configured_rate, bucket.rate + bucket.configured_rate / 20)
+
+    def gave_up(self, endpoint: str) -> None:
+        """Record a request abandoned after max_retries rate-limited attempts"""
+        with self._lock:
+            self._bucket(endpoint).stats['rejected'] += 1
+
+    def stats(self) -> Dict[str, Dict]:
+        """Per endpoint class: allowed, queued (had to wait), throttled (by the API),
+        rejected (given up), wait_seconds and the current rate"""
+        with self._lock:
+            return {
+                name: dict(bucket.stats, rate=bucket.rate)
+                for name, bucket in self._buckets.items()
+            }
+
+    def _bucket(self, endpoint: str) -> _Bucket:
+        bucket = self._buckets.get(endpoint)
+        if bucket is None:
+            bucket = self._buckets[endpoint] = _Bucket(self._default_rate)
+        return bucket
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """The process-wide limiter shared by every TuyaClient"""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter()
+        return _limiter
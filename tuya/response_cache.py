@@ -0,0 +1,179 @@
+import os
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Optional, Callable, Dict, Any, Hashable
+
+# Seconds a successful response stays fresh, per endpoint; override with TUYA_CACHE_TTLS
+DEFAULT_TTLS = {'device_info': 60.0, 'device_status': 5.0}
+
+
+def parse_ttls(spec: str) -> Dict[str, float]:
+    """Parse 'device_info=300,device_status=2' into {'device_info': 300.0, 'device_status': 2.0}"""
+    ttls = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, _, ttl = item.partition('=')
+        ttls[name.strip()] = float(ttl)
+    return ttls
+
+
+class _InFlight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class ResponseCache:
+    """Bounded LRU cache of API responses with a TTL per endpoint.
+
+    Keys are (endpoint, device_id) tuples. Only successful responses are
+    cached, and cached responses are shared between callers, so treat them as
+    read-only. Concurrent misses for the same key are coalesced: the first
+    caller loads and the others wait for its result instead of sending the
+    same request.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, ttls: Optional[Dict[str, float]] = None):
+        self.max_entries = max_entries or int(os.getenv('TUYA_CACHE_MAX_ENTRIES', '1000'))
+        if ttls is None:
+            ttls = dict(DEFAULT_TTLS, **parse_ttls(os.getenv('TUYA_CACHE_TTLS', '')))
+        self.ttls = ttls
+
+        self._entries = OrderedDict()  # key -> (expires_at, response), least recently used first
+        self._in_flight = {}  # key -> _InFlight
+        self._async_in_flight = {}  # key -> asyncio.Future
+        self._generations = {}  # device_id -> invalidation count, so loads racing a command aren't cached
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'coalesced': 0, 'evictions': 0, 'invalidations': 0}
+
+    def get(self, key: Hashable) -> Optional[Dict]:
+        """Return the fresh cached response for key, or None"""
+        with self._lock:
+            return self._lookup(key)
+
+    def put(self, key: Hashable, response: Dict, generation: Optional[int] = None) -> None:
+        """Cache response under key if it succeeded and its endpoint has a TTL.
+
+        With generation set (see generation()), the response is dropped if the
+        device was invalidated since then.
+        """
+        ttl = self.ttls.get(key[0], 0)
+        if ttl <= 0 or not (isinstance(response, dict) and response.get('success')):
+            return
+        with self._lock:
+            if generation is not None and self._generations.get(key[1], 0) != generation:
+                return
+            self._entries[key] = (time.monotonic() + ttl, response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def get_or_load(self, key: Hashable, load: Callable[[], Dict]) -> Dict:
+        """
+        Return the cached response for key, or load it once for all concurrent callers
+
+        Args:
+            key (Hashable): (endpoint, device_id)
+            load (Callable[[], Dict]): Sends the request
+
+        Returns:
+            Dict: The response
+        """
+        with self._lock:
+            response = self._lookup(key)
+            if response is not None:
+                return response
+            in_flight = self._in_flight.get(key)
+            leader = in_flight is None
+            if leader:
+                in_flight = self._in_flight[key] = _InFlight()
+                generation = self._generations.get(key[1], 0)
+            else:
+                self._stats['coalesced'] += 1
+
+        if not leader:
+            in_flight.done.wait()
+            if in_flight.error is not None:
+                raise in_flight.error
+            return in_flight.result
+
+        try:
+            in_flight.result = load()
+            self.put(key, in_flight.result, generation)
+            return in_flight.result
+        except Exception as e:
+            in_flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            in_flight.done.set()
+
+    async def get_or_load_async(self, key: Hashable, load: Callable[[], Any]) -> Dict:
+        """asyncio variant of get_or_load; load is a coroutine function"""
+        leader = False
+        with self._lock:
+            response = self._lookup(key)
+            if response is not None:
+                return response
+            future = self._async_in_flight.get(key)
+            if future is not None:
+                self._stats['coalesced'] += 1
+            else:
+                future = self._async_in_flight[key] = asyncio.get_running_loop().create_future()
+                generation = self._generations.get(key[1], 0)
+                leader = True
+        if not leader:
+            return await asyncio.shield(future)
+
+        try:
+            response = await load()
+            self.put(key, response, generation)
+            future.set_result(response)
+            return response
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Mark retrieved when no one else was waiting
+            raise
+        finally:
+            with self._lock:
+                self._async_in_flight.pop(key, None)
+
+    def invalidate(self, device_id: str) -> None:
+        """Drop every cached response for a device"""
+        with self._lock:
+            for key in [key for key in self._entries if key[1] == device_id]:
+                del self._entries[key]
+            self._generations[device_id] = self._generations.get(device_id, 0) + 1
+            self._stats['invalidations'] += 1
+
+    def generation(self, device_id: str) -> int:
+        """Invalidation count of a device, to pass to put() for a request sent now"""
+        with self._lock:
+            return self._generations.get(device_id, 0)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries))
+
+    def _lookup(self, key: Hashable) -> Optional[Dict]:
+        # Caller holds self._lock
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+                return entry[1]
+            del self._entries[key]
+        self._stats['misses'] += 1
+        return None
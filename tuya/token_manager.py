@@ -0,0 +1,195 @@
+import os
+import json
+import time
+import logging
+import threading
+from typing import Optional, Callable, Dict
+
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+# In-body error codes meaning the access token is no longer valid
+TOKEN_INVALID_CODES = (1010,)
+
+
+class TokenManager:
+    """Access token of a Tuya cloud project, refreshed before it expires.
+
+    The token response's expire_time is tracked, and a background thread
+    refreshes the token refresh_margin seconds ahead of expiry, so requests
+    never wait on an expired token. Refreshes are single-flight: however many
+    threads find the token missing or rejected at once, one of them fetches a
+    new token and the others reuse it.
+
+    With cache_path set (TUYA_TOKEN_CACHE), the token is kept in that file,
+    readable only by its owner, so a restart reuses it instead of requesting a
+    new grant.
+    """
+
+    def __init__(self, fetch: Callable[[str], Dict], access_id: Optional[str] = None,
+                 refresh_margin: Optional[float] = None, cache_path: Optional[str] = None,
+                 background: bool = True):
+        """
+        Args:
+            fetch (Callable[[str], Dict]): Sends the token request; called with a refresh
+                                           token, or '' for a new grant
+            access_id (str): Cloud project the token belongs to, checked when loading cache_path
+            refresh_margin (float): Seconds before expiry to refresh (TUYA_TOKEN_REFRESH_MARGIN)
+            cache_path (str): File to persist the token in (TUYA_TOKEN_CACHE)
+            background (bool): Refresh from a background thread instead of on first use
+        """
+        self.fetch = fetch
+        self.access_id = access_id
+        self.refresh_margin = (refresh_margin if refresh_margin is not None
+                               else float(os.getenv('TUYA_TOKEN_REFRESH_MARGIN', '300')))
+        self.cache_path = cache_path or os.getenv('TUYA_TOKEN_CACHE') or None
+        self.background = background
+
+        self._token = None  # Token response 'result' plus 'expires_at' and 'refresh_at'
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._stats = {'grants': 0, 'refreshes': 0, 'failures': 0, 'invalidations': 0}
+
+        if self.cache_path:
+            self._load()
+
+    def get(self) -> str:
+        """
+        Get a valid access token, fetching one if there is none or it has expired
+
+        Returns:
+            str: The access token
+        """
+        token = self._token
+        if token is None or time.time() >= token['expires_at']:
+            token = self._refresh(token['access_token'] if token else None)
+        elif time.time() >= token['refresh_at'] and not self.background:
+            # No background thread: the first caller past refresh_at refreshes inline
+            token = self._refresh(token['access_token'])
+        return token['access_token']
+
+    def current(self) -> Optional[str]:
+        """The access token if get() would return it without a fetch, else None"""
+        token = self._token
+        if token is None or time.time() >= token['expires_at']:
+            return None
+        if time.time() >= token['refresh_at'] and not self.background:
+            return None
+        return token['access_token']
+
+    def invalidate(self, stale_token: str) -> str:
+        """
+        Replace a token the API rejected (HTTP 401 or an in-body token error)
+
+        Args:
+            stale_token (str): The access token the failed request used
+
+        Returns:
+            str: The new access token; a refresh by another caller is reused
+        """
+        with self._refresh_lock:
+            self._stats['invalidations'] += 1
+        return self._refresh(stale_token, force=True)['access_token']
+
+    def expires_in(self) -> Optional[float]:
+        token = self._token
+        return None if token is None else token['expires_at'] - time.time()
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self._stats)
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(5)
+
+    def _refresh(self, stale_token: Optional[str], force: bool = False) -> Dict:
+        with self._refresh_lock:
+            token = self._token
+            if token is not None and token['access_token'] != stale_token:
+                return token  # Another caller refreshed while we waited
+            if token is not None and not force and time.time() < token['refresh_at']:
+                return token
+
+            started = time.time()
+            token_res = {}
+            refresh_token = token.get('refresh_token') if token else None
+            if refresh_token:
+                token_res = self.fetch(refresh_token)
+            if token_res.get('success'):
+                self._stats['refreshes'] += 1
+                metrics.TOKEN_REQUESTS.labels('refresh').inc()
+            else:
+                token_res = self.fetch('')
+                if token_res.get('success'):
+                    self._stats['grants'] += 1
+                    metrics.TOKEN_REQUESTS.labels('grant').inc()
+            if not token_res.get('success'):
+                self._stats['failures'] += 1
+                metrics.TOKEN_REQUESTS.labels('failure').inc()
+                raise Exception(f"Access token is not available: {token_res.get('msg')}")
+
+            self._store(token_res['result'], started)
+            return self._token
+
+    def _store(self, result: Dict, issued_at: float) -> None:
+        # Expiry counts from when the request was sent, so clock skew errs on the early side
+        expire_time = float(result.get('expire_time', 7200))
+        margin = min(self.refresh_margin, expire_time / 2)
+        self._token = dict(result, expires_at=issued_at + expire_time,
+                           refresh_at=issued_at + expire_time - margin)
+        if self.cache_path:
+            self._save()
+        if self.background:
+            self._ensure_thread()
+            self._wakeup.set()
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='tuya-token-refresh', daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            token = self._token
+            delay = max(0.0, token['refresh_at'] - time.time()) if token else None
+            self._wakeup.wait(delay)
+            self._wakeup.clear()
+            if self._stop.is_set():
+                break
+            token = self._token
+            if token is None or time.time() < token['refresh_at']:
+                continue  # Woken by a new token; recompute the delay
+            try:
+                self._refresh(token['access_token'])
+            except Exception as e:
+                logger.warning(f"Background token refresh failed: {e}")
+                self._stop.wait(min(30.0, max(1.0, self.expires_in() or 0) / 2))
+
+    def _load(self) -> None:
+        try:
+            with open(self.cache_path) as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return
+        if cached.get('access_id') != self.access_id or time.time() >= cached.get('expires_at', 0):
+            return
+        cached.pop('access_id', None)
+        self._token = cached
+        if self.background:
+            self._ensure_thread()
+
+    def _save(self) -> None:
+        tmp_path = f"{self.cache_path}.tmp"
+        try:
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w') as f:
+                json.dump(dict(self._token, access_id=self.access_id), f)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            logger.warning(f"Could not save access token to {self.cache_path}: {e}")
@@ -4,29 +4,50 @@ load_dotenv()
 import os
 import time
 import json
-import hmac
-import hashlib
 import requests
-from typing import Optional, Dict, Any
-from random import randint
-import string
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Optional, Dict, Any, List
+from tuya.token_manager import TokenManager, TOKEN_INVALID_CODES
+from tuya.rate_limit import RateLimiter, RateLimitExceeded, endpoint_class, get_rate_limiter
+from tuya.response_cache import ResponseCache
+from tuya.signing import RequestSigner, make_nonce
+from utils import metrics
 import random
 import logging
 
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 class TuyaClient:
     _client = None
     
-    KEY_TU_YA_ACCESS_TOKEN = 'tuya:access_token'
-    KEY_TU_YA_TOKEN_RES = 'tuya:token_res'
+    # Maximum number of device IDs accepted by the multi-device endpoint
+    DEVICE_BATCH_SIZE = 20
     
-    def __init__(self):
-        self.endpoint = os.getenv('API_ENDPOINT')
-        self.access_id = os.getenv('ACCESS_ID')
-        self.access_secret = os.getenv('ACCESS_KEY')
-        self.cache = {}  # Simple in-memory cache implementation
+    def __init__(self, endpoint: Optional[str] = None, access_id: Optional[str] = None,
+                 access_secret: Optional[str] = None, pool_size: Optional[int] = None,
+                 timeout: Optional[float] = None, max_retries: Optional[int] = None,
+                 rate_limiter: Optional[RateLimiter] = None,
+                 response_cache: Optional[ResponseCache] = None):
+        self.endpoint = endpoint or os.getenv('API_ENDPOINT')
+        self.access_id = access_id or os.getenv('ACCESS_ID')
+        self.access_secret = access_secret or os.getenv('ACCESS_KEY')
+        # Keyed once; every request signs from a copy
+        self.signer = RequestSigner(self.access_id, self.access_secret)
+        # Expiry-aware access token, refreshed in the background before it expires
+        self.tokens = TokenManager(self._request_token, access_id=self.access_id)
+        # Shared by every client in the process, so the quota is enforced as a whole
+        self.rate_limiter = rate_limiter or get_rate_limiter()
+        # Device info and status responses, shared by every caller of this client
+        self.response_cache = response_cache or ResponseCache()
+        
+        # Keep-alive connection pool shared by every request this client makes
+        self.pool_size = pool_size or int(os.getenv('TUYA_POOL_SIZE', '10'))
+        self.timeout = timeout or float(os.getenv('TUYA_TIMEOUT', '10'))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv('TUYA_MAX_RETRIES', '3'))
+        self.retry_backoff = float(os.getenv('TUYA_RETRY_BACKOFF', '0.5'))
+        self.session = self._create_session()
         
     @classmethod
     def get_client(cls) -> 'TuyaClient':
@@ -35,20 +56,49 @@ class TuyaClient:
             cls._client.initialize_token()
         return cls._client
     
+    def _create_session(self) -> requests.Session:
+        # Retries cover connection errors and transient 5xx responses. POST is not
+        # in Retry's default allowed_methods, so device commands are never replayed.
+        retry = Retry(
+            total=self.max_retries,
+            backoff_factor=self.retry_backoff,
+            status_forcelist=(500, 502, 503, 504),
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=retry)
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+    
+    def close(self) -> None:
+        self.tokens.stop()
+        self.session.close()
+    
+    def connection_stats(self) -> Dict[str, int]:
+        """
+        Get connection reuse counters for the pooled session
+        
+        Returns:
+            Dict[str, int]: 'requests' sent, 'connections' opened and 'reused'
+                            (requests served over an already open connection)
+        """
+        requests_sent = connections = 0
+        # The same adapter is mounted for http:// and https://
+        for adapter in {id(a): a for a in self.session.adapters.values()}.values():
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools[key]
+                requests_sent += pool.num_requests
+                connections += pool.num_connections
+        return {
+            'requests': requests_sent,
+            'connections': connections,
+            'reused': max(requests_sent - connections, 0)
+        }
+    
     def initialize_token(self) -> None:
-        if not self.cache.get(self.KEY_TU_YA_ACCESS_TOKEN):
-            if self.KEY_TU_YA_TOKEN_RES in self.cache:
-                refresh_token = self.cache[self.KEY_TU_YA_TOKEN_RES]['refresh_token']
-                token_res = self.get_token(refresh_token)
-                if not token_res.get('success'):
-                    token_res = self.get_token()
-            else:
-                token_res = self.get_token()
-                
-            if token_res.get('success'):
-                # In a real implementation, you might want to use proper cache expiration
-                self.cache[self.KEY_TU_YA_ACCESS_TOKEN] = token_res['result']['access_token']
-                self.cache[self.KEY_TU_YA_TOKEN_RES] = token_res['result']
+        self.tokens.get()
     
     def send(self, method: str, url: str, options: Dict = None) -> Dict:
         if options is None:
@@ -60,35 +110,72 @@ class TuyaClient:
         
         body = json.dumps(options.get('body', '')) if 'body' in options else ''
         
-        logger.debug(f"Making request to: {url}")
-        
-        request_options = {
-            'headers': self.get_headers(method, url, body)
-        }
+        # Lazy formatting: the message is only built when DEBUG is enabled
+        logger.debug("Making request to: %s", url)
         
+        request_options = {}
         if 'body' in options:
             request_options['json'] = options['body']
-            
-        try:
-            response = requests.request(
-                method,
-                f"{self.endpoint}{url}",
-                **request_options
-            )
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.HTTPError as e:
-            if e.response.status_code == 401:  # Token expired
-                logger.debug("Token expired, refreshing...")
-                self.initialize_token()
-                request_options['headers'] = self.get_headers(method, url, body)
-                response = requests.request(
+        
+        access_token, payload = self._request(method, url, body, request_options)
+        # Tuya mostly reports bad tokens as HTTP 200 with an error code in the body
+        if payload is None or payload.get('code') in TOKEN_INVALID_CODES:
+            logger.debug("Token expired, refreshing...")
+            self.tokens.invalidate(access_token)
+            _, payload = self._request(method, url, body, request_options)
+            if payload is None:
+                raise requests.exceptions.HTTPError("401 Unauthorized after token refresh")
+        return payload
+    
+    def _request(self, method: str, url: str, body: str, request_options: Dict):
+        """Send a request within the rate limit, retrying rate-limited attempts.
+        
+        Returns (access_token used, payload); payload is None on HTTP 401.
+        """
+        endpoint = endpoint_class(method, url)
+        for _ in range(self.rate_limiter.max_retries + 1):
+            time.sleep(self.rate_limiter.reserve(endpoint))
+            # Signed headers carry a timestamp, so they're built after any wait
+            headers = self.get_headers(method, url, body)
+            started = time.perf_counter()
+            try:
+                response = self.session.request(
                     method,
                     f"{self.endpoint}{url}",
+                    headers=headers,
+                    timeout=self.timeout,
                     **request_options
                 )
-                return response.json()
-            raise
+            except requests.exceptions.RequestException as e:
+                metrics.API_ERRORS.labels(endpoint, type(e).__name__).inc()
+                raise
+            metrics.API_LATENCY.labels(endpoint).observe(time.perf_counter() - started)
+            if response.status_code >= 400:
+                metrics.API_ERRORS.labels(endpoint, str(response.status_code)).inc()
+            if response.status_code == 401:
+                return headers.get('access_token'), None
+            payload = None if response.status_code == 429 else self._json(response)
+            if isinstance(payload, dict) and not payload.get('success', True):
+                metrics.API_ERRORS.labels(endpoint, str(payload.get('code'))).inc()
+            if not self.rate_limiter.is_rate_limited(response.status_code, payload):
+                self.rate_limiter.succeeded(endpoint)
+                return headers.get('access_token'), payload
+            self.rate_limiter.throttled(endpoint, self._retry_after(response))
+        
+        self.rate_limiter.gave_up(endpoint)
+        if payload is None:
+            response.raise_for_status()
+        return headers.get('access_token'), payload
+    
+    def _retry_after(self, response: requests.Response) -> Optional[float]:
+        try:
+            return float(response.headers.get('Retry-After'))
+        except (TypeError, ValueError):
+            return None
+    
+    def _json(self, response: requests.Response) -> Dict:
+        response.raise_for_status()
+        return response.json()
     
     def _replace_params_in_url(self, url: str, params: Dict) -> str:
         for key, value in params.items():
@@ -103,39 +190,38 @@ class TuyaClient:
         return url
     
     def get_token(self, refresh_token: str = '') -> Dict:
+        return self._request_token(refresh_token)
+    
+    def _request_token(self, refresh_token: str = '') -> Dict:
         url = f"/v1.0/token/{refresh_token}" if refresh_token else '/v1.0/token?grant_type=1'
         
-        response = requests.get(
-            f"{self.endpoint}{url}",
-            headers=self.get_headers('GET', url)
-        )
+        time.sleep(self.rate_limiter.reserve('token'))
+        with metrics.API_LATENCY.labels('token').time():
+            response = self.session.get(
+                f"{self.endpoint}{url}",
+                headers=self.get_headers('GET', url),
+                timeout=self.timeout
+            )
         return response.json()
     
     def get_headers(self, method: str, url: str, body: str = '', append_headers: Dict = None) -> Dict:
-        if append_headers is None:
-            append_headers = {}
-            
-        access_token = '' if url.startswith('/v1.0/token') else self.cache.get(self.KEY_TU_YA_ACCESS_TOKEN, '')
-        
-        if not access_token and not url.startswith('/v1.0/token'):
-            self.initialize_token()
-            access_token = self.cache.get(self.KEY_TU_YA_ACCESS_TOKEN)
-            
-            if not access_token:
-                raise Exception("Access token is not available.")
+        access_token = '' if url.startswith('/v1.0/token') else self.tokens.get()
         
-        nonce = ''.join(random.choices(string.ascii_letters + string.digits, k=8))
+        nonce = make_nonce()
         timestamp = int(time.time() * 1000)
         
         headers = {
             'client_id': self.access_id,
             'sign_method': 'HMAC-SHA256',
             't': str(timestamp),
-            'nonce': nonce,
-            'sign': self._generate_signature(method, url, body, append_headers, access_token, nonce, timestamp)
+            'nonce': nonce
         }
+        with metrics.SIGNING_TIME.time():
+            headers['sign'] = self._generate_signature(method, url, body, append_headers,
+                                                       access_token, nonce, timestamp)
         
-        headers.update(append_headers)
+        if append_headers:
+            headers.update(append_headers)
         
         if access_token:
             headers['access_token'] = access_token
@@ -144,44 +230,94 @@ class TuyaClient:
     
     def _generate_signature(self, method: str, url: str, body: str, append_headers: Dict, 
                           access_token: str, nonce: str, timestamp: int) -> str:
-        headers_str = '\n'.join(f"{k}:{v}" for k, v in sorted(append_headers.items()))
-        
-        string_to_sign = f"{method}\n{hashlib.sha256(body.encode()).hexdigest()}\n{headers_str}\n{url}"
-        
-        sign_str = f"{self.access_id}{access_token}{timestamp}{nonce}{string_to_sign}"
-        signature = hmac.new(
-            self.access_secret.encode(),
-            sign_str.encode(),
-            hashlib.sha256
-        ).hexdigest().upper()
-        
-        return signature 
+        return self.signer.sign(method, url, body, append_headers, access_token, nonce, timestamp)
     
-    def get_device_info(self, device_id: str) -> Dict:
+    def get_device_info(self, device_id: str, use_cache: bool = True) -> Dict:
         """
         Get device information by device ID
         
         Args:
             device_id (str): The Tuya device ID
+            use_cache (bool): Serve a fresh cached response if there is one
             
         Returns:
             Dict: Device information response from Tuya API
         """
         url = f'/v1.0/devices/{device_id}'
-        return self.send('GET', url)
+        if not use_cache:
+            return self.send('GET', url)
+        return self.response_cache.get_or_load(('device_info', device_id), lambda: self.send('GET', url))
+    
+    def get_devices_info(self, device_ids: List[str]) -> Dict[str, Dict]:
+        """
+        Get device information for many devices using the multi-device endpoint
+        
+        Args:
+            device_ids (List[str]): The Tuya device IDs, sent DEVICE_BATCH_SIZE per request
+            
+        Returns:
+            Dict[str, Dict]: Device information keyed by device ID. Devices missing from
+                             the response or belonging to a failed chunk are left out.
+        """
+        devices = {}
+        for chunk in self._chunk_device_ids(device_ids):
+            generations = {device_id: self.response_cache.generation(device_id) for device_id in chunk}
+            try:
+                response = self.send('GET', '/v1.0/devices', {
+                    'query': {'device_ids': ','.join(chunk)}
+                })
+            except (requests.exceptions.RequestException, RateLimitExceeded) as e:
+                logger.warning(f"Batch request for {len(chunk)} devices failed: {e}")
+                continue
+            
+            if not response.get('success'):
+                logger.warning(f"Batch request for {len(chunk)} devices failed: {response.get('msg')}")
+                continue
+            
+            for device in self._extract_devices(response.get('result')):
+                devices[device.get('id')] = device
+            self._cache_devices(response, devices, generations)
+        return devices
+    
+    def _cache_devices(self, response: Dict, devices: Dict[str, Dict], generations: Dict[str, int]) -> None:
+        # A batch result is as fresh as a single-device one; let get_device_info reuse it
+        for device_id, generation in generations.items():
+            if device_id in devices:
+                self.response_cache.put(
+                    ('device_info', device_id),
+                    {'success': True, 't': response.get('t'), 'result': devices[device_id]},
+                    generation
+                )
+    
+    def _chunk_device_ids(self, device_ids: List[str]) -> List[List[str]]:
+        return [
+            device_ids[i:i + self.DEVICE_BATCH_SIZE]
+            for i in range(0, len(device_ids), self.DEVICE_BATCH_SIZE)
+        ]
+    
+    def _extract_devices(self, result: Any) -> List[Dict]:
+        # The multi-device endpoint returns either a bare list or a page object
+        if isinstance(result, list):
+            return result
+        if isinstance(result, dict):
+            return result.get('devices') or result.get('list') or []
+        return []
     
-    def get_device_status(self, device_id: str) -> Dict:
+    def get_device_status(self, device_id: str, use_cache: bool = True) -> Dict:
         """
         Get device status by device ID
         
         Args:
             device_id (str): The Tuya device ID
+            use_cache (bool): Serve a fresh cached response if there is one
             
         Returns:
             Dict: Device status response from Tuya API
         """
         url = f'/v1.0/devices/{device_id}/status'
-        return self.send('GET', url)
+        if not use_cache:
+            return self.send('GET', url)
+        return self.response_cache.get_or_load(('device_status', device_id), lambda: self.send('GET', url))
     
     def control_device(self, device_id: str, commands: list) -> Dict:
         """
@@ -196,8 +332,98 @@ class TuyaClient:
             Dict: Response from Tuya API
         """
         url = f'/v1.0/devices/{device_id}/commands'
-        return self.send('POST', url, {
-            'body': {
-                'commands': commands
-            }
-        })
\ No newline at end of file
+        try:
+            return self.send('POST', url, {
+                'body': {
+                    'commands': commands
+                }
+            })
+        finally:
+            # Even a failed command may have reached the device
+            self.response_cache.invalidate(device_id)
+    
+    def control_devices(self, commands: Dict[str, list], max_concurrency: Optional[int] = None,
+                        max_retries: Optional[int] = None) -> Dict:
+        """
+        Send commands to many devices in parallel
+        
+        Tuya has no multi-device command endpoint, so every device still gets its own
+        request; at most max_concurrency are in flight, within the 'commands' rate limit.
+        Transient failures (connection errors, timeouts, 5xx responses, rate limiting)
+        are retried with jittered backoff. Commands set absolute values, so resending
+        one that may already have arrived is harmless.
+        
+        Args:
+            commands (Dict[str, list]): Commands keyed by device ID, as for control_device
+            max_concurrency (int): Devices controlled at once (default TUYA_CONTROL_CONCURRENCY,
+                                   or the connection pool size)
+            max_retries (int): Retries per device after a transient failure
+                               (default TUYA_CONTROL_RETRIES, 2)
+            
+        Returns:
+            Dict: 'results' keyed by device ID, each with 'success', 'attempts', 'response'
+                  and 'error'; 'succeeded' and 'failed' device counts; 'elapsed' seconds
+        """
+        max_concurrency, max_retries = self._bulk_control_limits(max_concurrency, max_retries)
+        start = time.perf_counter()
+        results = {}
+        if commands:
+            with ThreadPoolExecutor(max_workers=min(max_concurrency, len(commands))) as pool:
+                futures = {
+                    device_id: pool.submit(self._control_with_retries, device_id, device_commands, max_retries)
+                    for device_id, device_commands in commands.items()
+                }
+                results = {device_id: future.result() for device_id, future in futures.items()}
+        return self._bulk_control_summary(results, start)
+    
+    def _control_with_retries(self, device_id: str, commands: list, max_retries: int) -> Dict:
+        for attempt in range(1, max_retries + 2):
+            response = error = None
+            try:
+                response = self.control_device(device_id, commands)
+            except Exception as e:
+                error = e
+            if attempt > max_retries or not self._is_transient(response, error):
+                return self._control_result(response, error, attempt)
+            time.sleep(self._retry_delay(attempt))
+    
+    def _bulk_control_limits(self, max_concurrency: Optional[int], max_retries: Optional[int]):
+        max_concurrency = max_concurrency or int(os.getenv('TUYA_CONTROL_CONCURRENCY', str(self.pool_size)))
+        if max_retries is None:
+            max_retries = int(os.getenv('TUYA_CONTROL_RETRIES', '2'))
+        return max_concurrency, max_retries
+    
+    def _is_transient(self, response: Optional[Dict], error: Optional[Exception]) -> bool:
+        if error is None:
+            # Still rate limited after the limiter's own retries
+            return self.rate_limiter.is_rate_limited(200, response)
+        if isinstance(error, requests.exceptions.HTTPError):
+            # HTTP 429 is the same condition as an in-body rate-limit code
+            status = None if error.response is None else error.response.status_code
+            return status is None or status >= 500 or status == 429
+        return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                                  RateLimitExceeded))
+    
+    def _retry_delay(self, attempt: int) -> float:
+        return random.uniform(0, self.retry_backoff * 2 ** attempt)
+    
+    def _control_result(self, response: Optional[Dict], error: Optional[Exception], attempts: int) -> Dict:
+        success = error is None and isinstance(response, dict) and bool(response.get('success'))
+        if error is not None:
+            message = f"{type(error).__name__}: {error}"
+        elif not success:
+            message = (response or {}).get('msg') or 'command failed'
+        else:
+            message = None
+        return {'success': success, 'attempts': attempts, 'response': response, 'error': message}
+    
+    def _bulk_control_summary(self, results: Dict[str, Dict], start: float) -> Dict:
+        succeeded = sum(1 for result in results.values() if result['success'])
+        elapsed = time.perf_counter() - start
+        logger.info(f"Controlled {succeeded}/{len(results)} devices in {elapsed:.2f} s")
+        return {
+            'results': results,
+            'succeeded': succeeded,
+            'failed': len(results) - succeeded,
+            'elapsed': elapsed
+        }
@@ -0,0 +1,227 @@
+import os
+import json
+import time
+import base64
+import hashlib
+import logging
+import threading
+from collections import namedtuple
+from typing import Optional, Callable, Dict, Any, Tuple
+
+try:
+    import websocket  # websocket-client
+except ImportError:  # Optional dependency, only needed for push ingestion
+    websocket = None
+
+try:
+    from Crypto.Cipher import AES  # pycryptodome
+    from Crypto.Util.Padding import unpad
+except ImportError:  # Optional dependency, only needed for push ingestion
+    AES = None
+
+logger = logging.getLogger(__name__)
+
+# Pulsar websocket endpoint of each Tuya data center
+MQ_ENDPOINTS = {
+    'https://openapi.tuyacn.com': 'wss://mqe.tuyacn.com:8285/',
+    'https://openapi.tuyaus.com': 'wss://mqe.tuyaus.com:8285/',
+    'https://openapi.tuyaeu.com': 'wss://mqe.tuyaeu.com:8285/',
+    'https://openapi.tuyain.com': 'wss://mqe.tuyain.com:8285/',
+}
+
+# Message protocols in the decoded payload
+PROTOCOL_STATUS = 4  # Datapoint status report
+PROTOCOL_BIZ = 20  # Device events: online, offline, nameUpdate, ...
+
+# kind is 'status', 'online' or 'offline'; status is {code: value} for 'status' events
+DeviceEvent = namedtuple('DeviceEvent', ['kind', 'device_id', 'status', 'timestamp'])
+
+
+def decrypt_data(data: str, access_secret: str) -> str:
+    """
+    Decrypt the 'data' field of a message payload
+
+    Args:
+        data (str): Base64 AES-128-ECB ciphertext
+        access_secret (str): Cloud project access secret; characters 8-24 are the key
+
+    Returns:
+        str: The decrypted JSON text
+    """
+    if AES is None:
+        raise ImportError("Push ingestion requires pycryptodome: pip install pycryptodome")
+    cipher = AES.new(access_secret[8:24].encode(), AES.MODE_ECB)
+    return unpad(cipher.decrypt(base64.b64decode(data)), AES.block_size).decode('utf-8')
+
+
+def parse_event(payload: Dict[str, Any], decrypted: Dict[str, Any]) -> Optional[DeviceEvent]:
+    """
+    Turn a decoded message into a DeviceEvent
+
+    Args:
+        payload (Dict): The message payload (protocol, t, ...)
+        decrypted (Dict): Its decrypted 'data' field
+
+    Returns:
+        Optional[DeviceEvent]: The event, or None for message types the monitor ignores
+    """
+    protocol = payload.get('protocol')
+    if protocol == PROTOCOL_STATUS:
+        items = decrypted.get('status') or []
+        status = {item['code']: item.get('value') for item in items if 'code' in item}
+        # Report time of the newest datapoint, in milliseconds
+        reported = max((item.get('t', 0) for item in items), default=0) or payload.get('t') or 0
+        return DeviceEvent('status', decrypted.get('devId'), status, _seconds(reported))
+
+    if protocol == PROTOCOL_BIZ and decrypted.get('bizCode') in ('online', 'offline'):
+        return DeviceEvent(decrypted['bizCode'], decrypted.get('devId'), None,
+                           _seconds(decrypted.get('ts') or payload.get('t') or 0))
+    return None
+
+
+def _seconds(timestamp: int) -> int:
+    # Tuya reports milliseconds; fall back to now for missing timestamps
+    if not timestamp:
+        return int(time.time())
+    return int(timestamp // 1000) if timestamp > 10 ** 11 else int(timestamp)
+
+
+class TuyaMessageQueue:
+    """Consumer for the Tuya device message stream.
+
+    Tuya pushes device messages through Apache Pulsar, exposed as a websocket
+    consumer per cloud project. Each message is acknowledged once its event
+    has been handed to `handler`; unacknowledged messages are redelivered
+    after a reconnect. Runs in a daemon thread and reconnects with backoff
+    until stop() is called.
+
+        mq = TuyaMessageQueue(handler=events.put)
+        mq.start()
+    """
+
+    def __init__(self, access_id: Optional[str] = None, access_secret: Optional[str] = None,
+                 url: Optional[str] = None, env: Optional[str] = None,
+                 handler: Optional[Callable[[DeviceEvent], None]] = None,
+                 max_reconnect_delay: Optional[float] = None):
+        self.access_id = access_id or os.getenv('ACCESS_ID')
+        self.access_secret = access_secret or os.getenv('ACCESS_KEY')
+        self.url = url or os.getenv('TUYA_MQ_URL') or MQ_ENDPOINTS.get(
+            (os.getenv('API_ENDPOINT') or '').rstrip('/'), MQ_ENDPOINTS['https://openapi.tuyaeu.com']
+        )
+        # 'event' for production, 'event-test' for the Tuya message test channel
+        self.env = env or os.getenv('TUYA_MQ_ENV', 'event')
+        self.handler = handler
+        self.max_reconnect_delay = max_reconnect_delay or float(os.getenv('TUYA_MQ_MAX_RECONNECT_DELAY', '60'))
+
+        self._ws = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._stats_lock = threading.Lock()
+        self._stats = {'received': 0, 'events': 0, 'ignored': 0, 'undecodable': 0, 'connects': 0}
+
+    def topic_url(self) -> str:
+        return (f"{self.url.rstrip('/')}/ws/v2/consumer/persistent/{self.access_id}/out/{self.env}/"
+                f"{self.access_id}-sub?ackTimeoutMillis=3000&subscriptionType=Failover")
+
+    def password(self) -> str:
+        """Websocket password: middle 16 hex digits of md5(access_id + md5(access_secret))"""
+        secret_md5 = hashlib.md5(self.access_secret.encode()).hexdigest()
+        return hashlib.md5(f"{self.access_id}{secret_md5}".encode()).hexdigest()[8:24]
+
+    def decode(self, raw: str) -> Tuple[str, Optional[DeviceEvent]]:
+        """
+        Decode one websocket frame
+
+        Args:
+            raw (str): Frame text: {"messageId": ..., "payload": base64 JSON}
+
+        Returns:
+            Tuple[str, Optional[DeviceEvent]]: The message ID to acknowledge and its event
+        """
+        message = json.loads(raw)
+        payload = json.loads(base64.b64decode(message['payload']).decode('utf-8'))
+        decrypted = json.loads(decrypt_data(payload['data'], self.access_secret))
+        return message['messageId'], parse_event(payload, decrypted)
+
+    def start(self) -> None:
+        if websocket is None:
+            raise ImportError("Push ingestion requires websocket-client: pip install websocket-client")
+        if AES is None:
+            raise ImportError("Push ingestion requires pycryptodome: pip install pycryptodome")
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='tuya-mq', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5) -> None:
+        self._stop.set()
+        ws = self._ws
+        if ws is not None:
+            ws.close()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self) -> Dict[str, int]:
+        with self._stats_lock:
+            return dict(self._stats)
+
+    def _count(self, name: str) -> None:
+        with self._stats_lock:
+            self._stats[name] += 1
+
+    def _run(self) -> None:
+        delay = 1
+        while not self._stop.is_set():
+            try:
+                self._ws = websocket.create_connection(
+                    self.topic_url(),
+                    header={'username': self.access_id, 'password': self.password()},
+                    timeout=30
+                )
+                self._count('connects')
+                delay = 1
+                self._consume(self._ws)
+            except Exception as e:
+                if self._stop.is_set():
+                    break
+                logger.warning(f"Message queue connection lost: {e}; reconnecting in {delay:g} s")
+            finally:
+                if self._ws is not None:
+                    self._ws.close()
+                    self._ws = None
+            self._stop.wait(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+    def _consume(self, ws) -> None:
+        while not self._stop.is_set():
+            try:
+                raw = ws.recv()
+            except websocket.WebSocketTimeoutException:
+                continue  # Quiet stream; the server pings to keep the connection alive
+            if not raw:
+                raise ConnectionError("connection closed by server")
+            self._count('received')
+
+            try:
+                message_id, event = self.decode(raw)
+            except Exception as e:
+                # Acknowledge it anyway so a malformed message isn't redelivered forever
+                logger.warning(f"Dropping undecodable message: {e}")
+                self._count('undecodable')
+                message_id = self._message_id(raw)
+                event = None
+            else:
+                if event is None or not event.device_id:
+                    self._count('ignored')
+                    event = None
+
+            if event is not None:
+                self.handler(event)
+                self._count('events')
+            if message_id is not None:
+                ws.send(json.dumps({'messageId': message_id}))
+
+    def _message_id(self, raw: str) -> Optional[str]:
+        try:
+            return json.loads(raw).get('messageId')
+        except (ValueError, AttributeError):
+            return None
@@ -1,6 +1,10 @@
 import sys
 import os
-from datetime import datetime
+import csv
+import json
+import argparse
+from collections import namedtuple
+from datetime import datetime, timezone
 import time
 
 # Add the root directory to Python path
@@ -8,62 +12,298 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 root_dir = os.path.dirname(current_dir)
 sys.path.append(root_dir)
 
-from database.db_utils import get_db_connection
+from database.rollups import ROLLUP_TABLES, split_interval
+from database.storage import get_storage
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # Optional dependency, only needed for Parquet and Arrow exports
+    pyarrow = None
+
+StatusRow = namedtuple('StatusRow', ['device_id', 'device_name', 'timestamp', 'switch_1'])
+
+# Export format by file extension
+EXPORT_FORMATS = {'.csv': 'csv', '.jsonl': 'jsonl', '.parquet': 'parquet', '.arrow': 'arrow'}
+
+# Last n records of one device
+LAST_N_FOR_DEVICE_SQL = '''
+    SELECT TOP (?)
+        d.name as device_name,
+        d.device_id,
+        ds.timestamp,
+        ds.switch_1,
+        CASE 
+            WHEN ds.switch_1 = 1 THEN 'ON'
+            WHEN ds.switch_1 = 0 THEN 'OFF'
+            ELSE 'UNKNOWN'
+        END as status
+    FROM device_status ds
+    JOIN devices d ON d.device_id = ds.device_id
+    WHERE ds.device_id = ?
+    ORDER BY ds.timestamp DESC
+'''
+
+# Last n records of every device
+LAST_N_ALL_DEVICES_SQL = '''
+    WITH RankedStatus AS (
+        SELECT 
+            d.name as device_name,
+            d.device_id,
+            ds.timestamp,
+            ds.switch_1,
+            CASE 
+                WHEN ds.switch_1 = 1 THEN 'ON'
+                WHEN ds.switch_1 = 0 THEN 'OFF'
+                ELSE 'UNKNOWN'
+            END as status,
+            ROW_NUMBER() OVER (PARTITION BY ds.device_id ORDER BY ds.timestamp DESC) as rn
+        FROM device_status ds
+        JOIN devices d ON d.device_id = ds.device_id
+    )
+    SELECT 
+        device_name,
+        device_id,
+        timestamp,
+        switch_1,
+        status
+    FROM RankedStatus
+    WHERE rn <= ?
+    ORDER BY device_id, timestamp DESC
+'''
+
+# Rollup rows of every device, or of one, in [start, end)
+ROLLUPS_SQL = '''
+    SELECT r.device_id, d.name, r.bucket_start, r.on_seconds, r.toggles, r.first_state, r.last_state
+    FROM {table} r
+    LEFT JOIN devices d ON d.device_id = r.device_id
+    WHERE r.bucket_start >= ? AND r.bucket_start < ?{device_filter}
+'''
+
+# Where each device's rollups end: its current state and since when
+ROLLUP_CURSORS_SQL = '''
+    SELECT c.device_id, d.name, c.state, c.since
+    FROM device_rollup_cursor c
+    LEFT JOIN devices d ON d.device_id = c.device_id
+    WHERE c.since < ?{device_filter}
+'''
+
+def get_on_time(start, end=None, resolution='day', device_id=None, utc_offset_hours=0):
+    """
+    Get switch_1 on-time per device per hour or day, read from the rollup tables
+    
+    Args:
+        start (int): Epoch seconds; rounded down to the start of its bucket
+        end (int): Epoch seconds, exclusive (default now); rounded up to the end of its bucket
+        resolution (str): 'hour' or 'day'
+        device_id (str): Only this device (default: every device)
+        utc_offset_hours (int): Days start at local midnight for this whole-hour UTC offset
+                                (computed from hourly rollups)
+        
+    Returns:
+        List[Dict]: One dict per device and bucket, ordered by device and time, with
+                    device_id, device_name, bucket_start, on_seconds, toggles,
+                    first_state and last_state. Buckets a device spent off without
+                    toggling are left out. The time since a device's last status
+                    row counts in its current state, up to now.
+    """
+    if resolution not in ROLLUP_TABLES:
+        raise ValueError(f"Unknown resolution: {resolution}")
+    if utc_offset_hours != int(utc_offset_hours):
+        raise ValueError("utc_offset_hours must be a whole number of hours")
+    now = int(time.time())
+    end = now if end is None else int(end)
+    size = ROLLUP_TABLES[resolution][1]
+    offset = int(utc_offset_hours) * 3600 if resolution == 'day' else 0
+    # Local days are built from hourly rollups; everything else reads its own table
+    source = 'hour' if offset else resolution
+    table, source_size = ROLLUP_TABLES[source]
+    
+    start = int(start) + offset
+    start = start - start % size - offset
+    end = end + offset
+    end = end - end % size + (size if end % size else 0) - offset
+    
+    device_filter = " AND r.device_id = ?" if device_id else ""
+    params = (start, end, device_id) if device_id else (start, end)
+    from database.db_utils import db_connection  # Rollups are SQL Server only; keep pyodbc off the SQLite paths
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(ROLLUPS_SQL.format(table=table, device_filter=device_filter), params)
+        rows = cursor.fetchall()
+        cursor.execute(ROLLUP_CURSORS_SQL.format(device_filter=" AND c.device_id = ?" if device_id else ""),
+                       (min(end, now), device_id) if device_id else (min(end, now),))
+        cursors = cursor.fetchall()
+    
+    buckets = {}
+    
+    def bucket_for(device, name, bucket_start, first_state):
+        key = (device, (bucket_start + offset) - (bucket_start + offset) % size - offset)
+        if key not in buckets:
+            buckets[key] = {
+                'device_id': device, 'device_name': name, 'bucket_start': key[1],
+                'on_seconds': 0, 'toggles': 0, 'first_state': first_state, 'last_state': first_state
+            }
+        return buckets[key]
+    
+    for device, name, bucket_start, on_seconds, toggles, first_state, last_state in sorted(
+            rows, key=lambda row: (row[0], row[2])):
+        entry = bucket_for(device, name, bucket_start, int(first_state))
+        entry['on_seconds'] += on_seconds
+        entry['toggles'] += toggles
+        entry['last_state'] = int(last_state)
+    
+    # The open interval since each device's last rolled-up status row, if it is on
+    for device, name, state, since in cursors:
+        if not state:
+            continue
+        for bucket_start, seconds in split_interval(max(since, start), min(end, now), source_size):
+            entry = bucket_for(device, name, bucket_start, 1)
+            entry['on_seconds'] += seconds
+            entry['last_state'] = 1
+    
+    return [buckets[key] for key in sorted(buckets)]
+
+def print_on_time(days=7, device_id=None, utc_offset_hours=0):
+    """Print daily on-time per device for the last `days` days"""
+    try:
+        rows = get_on_time(time.time() - (days - 1) * 86400, device_id=device_id,
+                           utc_offset_hours=utc_offset_hours)
+    except Exception as e:
+        print(f"Error: {e}")
+        return
+    
+    if not rows:
+        print("No rollup data found")
+        return
+    
+    print("\nDaily On-Time:")
+    print("-" * 80)
+    print(f"{'Device Name':<20} {'Device ID':<25} {'Day':<12} {'On time':<10} {'Toggles':<8}")
+    print("-" * 80)
+    
+    current_device = None
+    for row in rows:
+        if current_device and current_device != row['device_id']:
+            print()
+        current_device = row['device_id']
+        day = datetime.fromtimestamp(row['bucket_start'] + utc_offset_hours * 3600, timezone.utc).strftime('%Y-%m-%d')
+        hours, minutes = divmod(row['on_seconds'] // 60, 60)
+        print(f"{(row['device_name'] or ''):<20} {row['device_id']:<25} {day:<12} "
+              f"{f'{hours}:{minutes:02d}':<10} {row['toggles']:<8}")
+
+def iter_status_batches(start, end=None, device_ids=None, batch_size=None):
+    """
+    Stream status history from the storage backend in batches
+    
+    On SQL Server the pooled connection is held until the generator is
+    exhausted or closed, and only one batch is in memory at a time.
+    
+    Args:
+        start (int): Epoch seconds, inclusive
+        end (int): Epoch seconds, exclusive (default now)
+        device_ids (List[str]): Only these devices (default: every device)
+        batch_size (int): Rows per fetchmany (default HISTORY_FETCH_SIZE, 5000)
+        
+    Yields:
+        List[StatusRow]: The next batch, ordered by device and time
+    """
+    batch_size = batch_size or int(os.getenv('HISTORY_FETCH_SIZE', '5000'))
+    end = int(time.time()) if end is None else int(end)
+    for rows in get_storage().history(start, end, device_ids, batch_size):
+        yield [StatusRow(*row) for row in rows]
+
+def iter_status_history(start, end=None, device_ids=None, batch_size=None):
+    """Stream status history one StatusRow at a time; see iter_status_batches"""
+    for batch in iter_status_batches(start, end, device_ids, batch_size):
+        yield from batch
+
+def export_status_history(path, start, end=None, device_ids=None, format=None, batch_size=None):
+    """
+    Write status history to a file, streaming it batch by batch
+    
+    Args:
+        path (str): Output file
+        start (int): Epoch seconds, inclusive
+        end (int): Epoch seconds, exclusive (default now)
+        device_ids (List[str]): Only these devices (default: every device)
+        format (str): 'csv', 'jsonl', 'parquet' or 'arrow' (default: from the file extension)
+        batch_size (int): Rows per fetchmany, and per Parquet row group or Arrow record batch
+        
+    Returns:
+        int: Rows written
+    """
+    format = format or EXPORT_FORMATS.get(os.path.splitext(path)[1].lower())
+    if format not in EXPORT_FORMATS.values():
+        raise ValueError(f"Unknown export format for {path}; use one of {sorted(EXPORT_FORMATS.values())}")
+    if format in ('parquet', 'arrow') and pyarrow is None:
+        raise ImportError(f"{format} exports require pyarrow: pip install pyarrow")
+    
+    batches = iter_status_batches(start, end, device_ids, batch_size)
+    if format == 'csv':
+        return _export_csv(path, batches)
+    if format == 'jsonl':
+        return _export_jsonl(path, batches)
+    return _export_arrow(path, batches, format)
+
+def _export_csv(path, batches):
+    rows = 0
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(StatusRow._fields)
+        for batch in batches:
+            writer.writerows(batch)
+            rows += len(batch)
+    return rows
+
+def _export_jsonl(path, batches):
+    rows = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        for batch in batches:
+            f.writelines(json.dumps(row._asdict()) + '\n' for row in batch)
+            rows += len(batch)
+    return rows
+
+def _export_arrow(path, batches, format):
+    schema = pyarrow.schema([
+        ('device_id', pyarrow.string()),
+        ('device_name', pyarrow.string()),
+        ('timestamp', pyarrow.int64()),
+        ('switch_1', pyarrow.bool_()),
+    ])
+    if format == 'parquet':
+        writer = pyarrow.parquet.ParquetWriter(path, schema)
+    else:
+        writer = pyarrow.ipc.new_file(path, schema)
+    rows = 0
+    try:
+        for batch in batches:
+            columns = list(zip(*batch))
+            writer.write_batch(pyarrow.record_batch(
+                [pyarrow.array(column, type=field.type) for column, field in zip(columns, schema)],
+                schema=schema
+            ))
+            rows += len(batch)
+    finally:
+        writer.close()
+    return rows
 
 def get_last_n_status(n=2, device_id=None):
     """Get last n status records for each device"""
+    from database.db_utils import db_connection
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        with db_connection() as conn:
+            cursor = conn.cursor()
         
-        if device_id:
-            # For specific device
-            cursor.execute('''
-                SELECT TOP (?)
-                    d.name as device_name,
-                    d.device_id,
-                    ds.timestamp,
-                    ds.switch_1,
-                    CASE 
-                        WHEN ds.switch_1 = 1 THEN 'ON'
-                        WHEN ds.switch_1 = 0 THEN 'OFF'
-                        ELSE 'UNKNOWN'
-                    END as status
-                FROM device_status ds
-                JOIN devices d ON d.device_id = ds.device_id
-                WHERE ds.device_id = ?
-                ORDER BY ds.timestamp DESC
-            ''', (n, device_id))
-        else:
-            # For all devices, get last n records for each device
-            cursor.execute('''
-                WITH RankedStatus AS (
-                    SELECT 
-                        d.name as device_name,
-                        d.device_id,
-                        ds.timestamp,
-                        ds.switch_1,
-                        CASE 
-                            WHEN ds.switch_1 = 1 THEN 'ON'
-                            WHEN ds.switch_1 = 0 THEN 'OFF'
-                            ELSE 'UNKNOWN'
-                        END as status,
-                        ROW_NUMBER() OVER (PARTITION BY d.device_id ORDER BY ds.timestamp DESC) as rn
-                    FROM device_status ds
-                    JOIN devices d ON d.device_id = ds.device_id
-                )
-                SELECT 
-                    device_name,
-                    device_id,
-                    timestamp,
-                    switch_1,
-                    status
-                FROM RankedStatus
-                WHERE rn <= ?
-                ORDER BY device_id, timestamp DESC
-            ''', (n,))
+            if device_id:
+                # For specific device
+                cursor.execute(LAST_N_FOR_DEVICE_SQL, (n, device_id))
+            else:
+                # For all devices, get last n records for each device
+                cursor.execute(LAST_N_ALL_DEVICES_SQL, (n,))
         
-        results = cursor.fetchall()
+            results = cursor.fetchall()
         
         if not results:
             print("No switch status data found")
@@ -89,19 +329,34 @@ def get_last_n_status(n=2, device_id=None):
             
     except Exception as e:
         print(f"Error: {e}")
-    finally:
-        if 'conn' in locals():
-            conn.close()
 
 def get_latest_switch_status(device_id=None):
     """Get latest status (shortcut to get_last_n_status with n=1)"""
     get_last_n_status(1, device_id)
 
-if __name__ == "__main__":
+def main():
+    parser = argparse.ArgumentParser(description="Show or export device status history")
+    parser.add_argument('--export', metavar='PATH', help="Export history to a .csv, .jsonl, .parquet or .arrow file")
+    parser.add_argument('--hours', type=float, default=24, help="Export the last N hours (default 24)")
+    parser.add_argument('--device', action='append', dest='device_ids', help="Only this device; repeatable")
+    args = parser.parse_args()
+    
+    if args.export:
+        start = time.perf_counter()
+        rows = export_status_history(args.export, time.time() - args.hours * 3600, device_ids=args.device_ids)
+        print(f"Exported {rows} status rows to {args.export} in {time.perf_counter() - start:.1f} s")
+        return
+    
     print("Getting last 2 status records for all devices...")
     get_last_n_status(2)
     
     # Example for specific device
     # device_id = "bfd049f7e821abbfd15sv9"
     # print(f"\nGetting last 2 status records for device {device_id}...")
-    # get_last_n_status(2, device_id)
\ No newline at end of file
+    # get_last_n_status(2, device_id)
+    
+    print("\nDaily on-time for the last 7 days...")
+    print_on_time(7)
+
+if __name__ == "__main__":
+    main()
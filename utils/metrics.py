@@ -0,0 +1,250 @@
+import os
+import time
+import bisect
+import threading
+from abc import ABC, abstractmethod
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds in seconds for API requests, database statements and sweeps
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# Signing a request takes microseconds
+SIGNING_BUCKETS = (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 5e-3)
+
+_registry = []
+_registry_lock = threading.Lock()
+
+class _Timer:
+    __slots__ = ('_child', '_start')
+
+    def __init__(self, child):
+        self._child = child
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._child.observe(time.perf_counter() - self._start)
+
+class _CounterChild:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+class _GaugeChild:
+    __slots__ = ('value', 'function')
+
+    def __init__(self):
+        self.value = 0
+        self.function = None
+
+    def set(self, value):
+        self.value = value
+
+    def set_function(self, function):
+        """Read the value from function() whenever metrics are collected"""
+        self.function = function
+
+    def get(self):
+        return self.value if self.function is None else self.function()
+
+class _HistogramChild:
+    __slots__ = ('buckets', 'counts', 'sum', '_lock')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Per bucket, not cumulative; the last is +Inf
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self):
+        """Context manager that observes the seconds its block took"""
+        return _Timer(self)
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.sum
+
+class _Metric(ABC):
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+        if not self.labelnames:
+            self.labels()  # Exported as 0 before the first update
+
+    def labels(self, *values):
+        """The series for these label values, created on first use"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    @abstractmethod
+    def _new_child(self):
+        """A new series for one set of label values"""
+
+    @abstractmethod
+    def _render_child(self, values, child):
+        """Exposition lines of one series"""
+
+    def _series(self):
+        with self._lock:
+            return list(self._children.items())
+
+    def _label_text(self, values, extra=()):
+        pairs = list(zip(self.labelnames, values)) + list(extra)
+        if not pairs:
+            return ''
+        escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+                   for _, value in pairs)
+        return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        for values, child in self._series():
+            lines.extend(self._render_child(values, child))
+        return lines
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def _render_child(self, values, child):
+        return [f'{self.name}{self._label_text(values)} {child.value}']
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def set_function(self, function):
+        self.labels().set_function(function)
+
+    def _render_child(self, values, child):
+        try:
+            value = child.get()
+        except Exception:
+            return []  # The function's owner has gone away
+        return [f'{self.name}{self._label_text(values)} {value}']
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def _render_child(self, values, child):
+        counts, total = child.snapshot()
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else f'{bound:g}'
+            lines.append(f'{self.name}_bucket{self._label_text(values, (("le", le),))} {cumulative}')
+        lines.append(f'{self.name}_sum{self._label_text(values)} {total}')
+        lines.append(f'{self.name}_count{self._label_text(values)} {cumulative}')
+        return lines
+
+def render():
+    """Every metric in the Prometheus text exposition format"""
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?', 1)[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Scrapes every few seconds would flood the monitor's output
+
+def start_metrics_server(port=None, host=None):
+    """Serve /metrics on a daemon thread; returns the server, or None if METRICS_PORT is unset.
+
+    Args:
+        port (int): Port to listen on (default METRICS_PORT); 0 picks a free one
+        host (str): Address to bind (default METRICS_HOST, or all interfaces)
+
+    Returns:
+        ThreadingHTTPServer: Call shutdown() to stop it
+    """
+    if port is None:
+        if not os.getenv('METRICS_PORT'):
+            return None
+        port = int(os.getenv('METRICS_PORT'))
+    host = host or os.getenv('METRICS_HOST', '0.0.0.0')
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    return server
+
+# Tuya API
+API_LATENCY = Histogram('tuya_api_request_seconds', 'Tuya API request latency', ('endpoint',))
+API_ERRORS = Counter('tuya_api_errors_total', 'Failed Tuya API requests, by HTTP status, error code or exception',
+                     ('endpoint', 'reason'))
+SIGNING_TIME = Histogram('tuya_signing_seconds', 'Time to sign a Tuya API request', buckets=SIGNING_BUCKETS)
+TOKEN_REQUESTS = Counter('tuya_token_requests_total', 'Access token refreshes, new grants and failures',
+                         ('result',))
+
+# Database
+DB_LATENCY = Histogram('db_statement_seconds', 'Write-behind statement and commit latency', ('operation',))
+WRITE_QUEUE = Gauge('write_behind_queued_rows', 'Changes waiting to be written')
+
+# Monitor
+SWEEP_TIME = Histogram('monitor_sweep_seconds', 'Time to fetch and diff one round of due devices')
+PIPELINE_BATCH_TIME = Histogram('pipeline_batch_seconds', 'Time from submitting a pipeline batch to its last diff')
+POLLS = Counter('monitor_polls_total', 'Device polls, by outcome', ('result',))
+CHANGES = Counter('monitor_changes_total', 'State changes detected and queued for writing')
+ERRORS = Counter('monitor_errors_total', 'Monitor errors, by stage', ('stage',))
@@ -0,0 +1,176 @@
+import os
+import time
+import queue
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from tuya.tuya_client import TuyaClient
+from tuya.rate_limit import RateLimiter, DEFAULT_RATE_LIMITS, parse_rate_limits
+from utils import metrics
+
+# The client of a fetch worker process, created by _init_fetch_worker
+_worker_client = None
+
+def _init_fetch_worker(endpoint, access_id, access_secret, workers):
+    """Give a fetch worker process its own client and its share of the API quota"""
+    global _worker_client
+    limits = dict(DEFAULT_RATE_LIMITS, **parse_rate_limits(os.getenv('TUYA_RATE_LIMITS', '')))
+    limiter = RateLimiter(limits={name: rate / workers for name, rate in limits.items()})
+    _worker_client = TuyaClient(endpoint, access_id, access_secret, rate_limiter=limiter)
+
+def _fetch_in_worker(device_ids):
+    return _worker_client.get_devices_info(device_ids)
+
+class _Batch:
+    """Holds a fetch slot until every device of the batch has been diffed"""
+
+    def __init__(self, size, release, submitted_at):
+        self.remaining = size
+        self.release = release
+        self.submitted_at = submitted_at
+        self.lock = threading.Lock()
+
+    def done(self):
+        with self.lock:
+            self.remaining -= 1
+            finished = self.remaining == 0
+        if finished:
+            metrics.PIPELINE_BATCH_TIME.observe(time.perf_counter() - self.submitted_at)
+            self.release()
+
+class PollingPipeline:
+    """The monitor's polling split into stages connected by bounded queues.
+
+    fetch: batches of due devices are sent to the API by fetch_workers
+    threads sharing the monitor's client, or with mode='process' by worker
+    processes with a client each, so request signing and JSON decoding run
+    in parallel instead of under one GIL. Each process gets an equal share
+    of the rate limits.
+
+    diff: diff_workers threads call process(device_id, device_data), which
+    detects changes and queues them for writing, and returns True if the
+    device changed. A device always goes to the same thread, so its polls
+    are diffed in order.
+
+    persist: process() enqueues into a WriteBehindQueue, which commits in
+    bulk on its own thread and blocks producers when the database falls
+    behind.
+
+    At most queue_size batches are between submit() and the end of the diff
+    stage; submit() blocks beyond that. completed() returns the outcome of
+    each poll for the scheduler.
+    """
+
+    def __init__(self, client, process, mode=None, fetch_workers=None, diff_workers=None,
+                 queue_size=None, batch_size=TuyaClient.DEVICE_BATCH_SIZE):
+        self.client = client
+        self.process = process
+        self.mode = mode or os.getenv('PIPELINE_FETCH_MODE', 'thread')
+        if self.mode not in ('thread', 'process'):
+            raise ValueError(f"Unknown pipeline fetch mode: {self.mode}")
+        self.fetch_workers = fetch_workers or int(os.getenv('PIPELINE_FETCH_WORKERS', '4'))
+        self.diff_workers = diff_workers or int(os.getenv('PIPELINE_DIFF_WORKERS', '2'))
+        self.queue_size = queue_size or int(os.getenv('PIPELINE_QUEUE_SIZE', str(self.fetch_workers * 2)))
+        self.batch_size = batch_size
+
+        if self.mode == 'process':
+            # spawn: the monitor already runs threads, which fork does not copy safely
+            self._executor = ProcessPoolExecutor(
+                self.fetch_workers, mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_fetch_worker,
+                initargs=(client.endpoint, client.access_id, client.access_secret, self.fetch_workers)
+            )
+        else:
+            self._executor = ThreadPoolExecutor(self.fetch_workers, thread_name_prefix='pipeline-fetch')
+        self._slots = threading.BoundedSemaphore(self.queue_size)
+        self._diff_queues = [queue.Queue() for _ in range(self.diff_workers)]
+        self._results = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._stats = {'batches': 0, 'failed_batches': 0, 'devices': 0, 'changed': 0, 'errors': 0}
+        self._diff_threads = [
+            threading.Thread(target=self._diff, args=(q,), name=f'pipeline-diff-{i}', daemon=True)
+            for i, q in enumerate(self._diff_queues)
+        ]
+        for thread in self._diff_threads:
+            thread.start()
+
+    def submit(self, device_ids):
+        """Queue devices for polling, blocking while queue_size batches are in flight"""
+        for i in range(0, len(device_ids), self.batch_size):
+            chunk = list(device_ids[i:i + self.batch_size])
+            self._slots.acquire()
+            submitted_at = time.perf_counter()
+            if self.mode == 'process':
+                future = self._executor.submit(_fetch_in_worker, chunk)
+            else:
+                future = self._executor.submit(self.client.get_devices_info, chunk)
+            future.add_done_callback(lambda f, chunk=chunk, at=submitted_at: self._route(chunk, f, at))
+
+    def completed(self, timeout=0):
+        """Return [(device_id, changed, ok)] for finished polls, waiting up to timeout for the first"""
+        try:
+            results = [self._results.get(timeout=timeout) if timeout > 0 else self._results.get_nowait()]
+        except queue.Empty:
+            return []
+        while True:
+            try:
+                results.append(self._results.get_nowait())
+            except queue.Empty:
+                return results
+
+    def close(self):
+        """Finish every submitted poll and stop the workers"""
+        self._executor.shutdown(wait=True)
+        for q in self._diff_queues:
+            q.put(None)
+        for thread in self._diff_threads:
+            thread.join()
+
+    def stats(self):
+        with self._stats_lock:
+            return dict(self._stats)
+
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            self._stats[name] += amount
+
+    def _route(self, chunk, future, submitted_at):
+        # Runs on a fetch thread, or on the executor's management thread in process mode
+        try:
+            devices = future.result()
+            self._count('batches')
+        except Exception as e:
+            print(f"Error fetching {len(chunk)} devices: {e}")
+            self._count('failed_batches')
+            metrics.ERRORS.labels('fetch').inc()
+            devices = {}
+        batch = _Batch(len(chunk), self._slots.release, submitted_at)
+        for device_id in chunk:
+            self._diff_queues[hash(device_id) % self.diff_workers].put((device_id, devices.get(device_id), batch))
+
+    def _diff(self, items):
+        while True:
+            item = items.get()
+            if item is None:
+                return
+            device_id, device_data, batch = item
+            changed = False
+            ok = device_data is not None and device_data.get('online', True)
+            result = 'failed'
+            try:
+                if device_data is not None:
+                    changed = self.process(device_id, device_data)
+                    result = 'changed' if changed else 'unchanged'
+            except Exception as e:
+                print(f"Error processing device {device_id}: {e}")
+                self._count('errors')
+                metrics.ERRORS.labels('record').inc()
+                result = 'failed'
+                ok = False
+            self._count('devices')
+            metrics.POLLS.labels(result).inc()
+            if changed:
+                self._count('changed')
+            self._results.put((device_id, changed, ok))
+            batch.done()
@@ -0,0 +1,132 @@
+import os
+import time
+import heapq
+
+class AdaptivePollScheduler:
+    """Per-device polling schedule keyed by next-due time.
+
+    Every device starts at min_interval. A poll that finds a change resets
+    the device to min_interval; a poll without one stretches its interval by
+    backoff, up to max_interval. Failed polls and offline devices back off
+    the same way up to offline_interval.
+
+    Due times are planned start-to-start: the next poll is due one interval
+    after the previous poll was *due*, not after it finished, so slow sweeps
+    don't make the schedule drift. A device that falls more than one interval
+    behind is rescheduled from now instead of being polled in a burst.
+
+    Devices due within batch_window seconds of now (default: min_interval)
+    are polled early, so their polls share API batches instead of each
+    costing a call.
+
+    max_calls_per_second, if set, is the global API budget. Each call covers
+    up to batch_size devices, and devices over budget stay due for the next
+    round.
+    """
+
+    def __init__(self, device_ids, min_interval=5, max_interval=None, backoff=None,
+                 offline_interval=None, max_calls_per_second=None, batch_size=20,
+                 batch_window=None, now=None):
+        self.min_interval = min_interval
+        self.max_interval = max_interval or float(os.getenv('POLL_MAX_INTERVAL', '60'))
+        self.backoff = backoff or float(os.getenv('POLL_BACKOFF', '1.5'))
+        self.offline_interval = offline_interval or float(os.getenv('POLL_OFFLINE_INTERVAL', '300'))
+        if max_calls_per_second is None and os.getenv('POLL_MAX_CALLS_PER_SECOND'):
+            max_calls_per_second = float(os.getenv('POLL_MAX_CALLS_PER_SECOND'))
+        self.max_calls_per_second = max_calls_per_second
+        self.batch_size = batch_size
+        if batch_window is None:
+            batch_window = float(os.getenv('POLL_BATCH_WINDOW', str(min_interval)))
+        self.batch_window = batch_window
+
+        now = time.monotonic() if now is None else now
+        self._heap = []
+        self._intervals = {}
+        self._due_at = {}
+        self._seq = 0  # Tie-breaker so the heap never compares device IDs
+        # Bucket holds one second of calls, and always at least one call
+        self._capacity = max(1.0, float(max_calls_per_second or 0))
+        self._tokens = self._capacity
+        self._last_refill = now
+        for device_id in device_ids:
+            self.add(device_id, now)
+
+    def add(self, device_id, now=None):
+        """Schedule a device for an immediate first poll"""
+        now = time.monotonic() if now is None else now
+        self._intervals[device_id] = self.min_interval
+        self._push(device_id, now)
+
+    def remove(self, device_id):
+        # Heap entries of removed devices are skipped lazily in due()
+        self._intervals.pop(device_id, None)
+        self._due_at.pop(device_id, None)
+
+    def due(self, now=None):
+        """Pop and return the devices due at `now`, within the API budget"""
+        now = time.monotonic() if now is None else now
+        limit = self._budget(now)
+        horizon = now + self.batch_window
+
+        devices = []
+        while self._heap and self._heap[0][0] <= horizon and (limit is None or len(devices) < limit):
+            due_at, _, device_id = heapq.heappop(self._heap)
+            if self._due_at.get(device_id) != due_at:
+                continue  # Removed, or superseded by a later push
+            devices.append(device_id)
+
+        if self.max_calls_per_second:
+            self._tokens -= -(-len(devices) // self.batch_size)  # Calls used, rounded up
+        return devices
+
+    def record(self, device_id, changed, ok=True, now=None):
+        """Reschedule a polled device based on what the poll found"""
+        if device_id not in self._intervals:
+            return
+        now = time.monotonic() if now is None else now
+
+        interval = self._intervals[device_id]
+        if not ok:
+            interval = min(interval * self.backoff, self.offline_interval)
+        elif changed:
+            interval = self.min_interval
+        else:
+            interval = min(interval * self.backoff, self.max_interval)
+        self._intervals[device_id] = interval
+
+        next_due = self._due_at.get(device_id, now) + interval
+        if next_due < now - interval:
+            next_due = now  # Fell far behind: restart from now rather than catching up in a burst
+        self._push(device_id, next_due)
+
+    def next_due_time(self, now=None):
+        """When due() will next return devices, or None if nothing is scheduled"""
+        while self._heap and self._due_at.get(self._heap[0][2]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        if not self._heap:
+            return None
+        next_due = self._heap[0][0]
+        if self.max_calls_per_second and self._tokens < 1:
+            # Out of budget: wait until the bucket holds one call again
+            now = time.monotonic() if now is None else now
+            next_due = max(next_due, now + (1 - self._tokens) / self.max_calls_per_second)
+        return next_due
+
+    def interval(self, device_id):
+        return self._intervals.get(device_id)
+
+    def _push(self, device_id, due_at):
+        self._seq += 1
+        self._due_at[device_id] = due_at
+        heapq.heappush(self._heap, (due_at, self._seq, device_id))
+
+    def _budget(self, now):
+        # Devices allowed this round, or None for no limit
+        if not self.max_calls_per_second:
+            return None
+        self._tokens = min(
+            self._capacity,
+            self._tokens + (now - self._last_refill) * self.max_calls_per_second
+        )
+        self._last_refill = now
+        return int(self._tokens) * self.batch_size
@@ -0,0 +1,141 @@
+import os
+import time
+import socket
+import hashlib
+import threading
+
+from database.worker_leases import WorkerLeases
+
+def rendezvous_owner(device_id, worker_ids):
+    """Return the worker that owns device_id: the one with the highest hash score.
+
+    Every worker computes the same answer from the same set of live workers,
+    and when a worker joins or leaves only the devices it owns (or takes) move.
+    """
+    return max(worker_ids, key=lambda worker_id: _score(worker_id, device_id))
+
+def _score(worker_id, device_id):
+    digest = hashlib.blake2b(f'{worker_id}\0{device_id}'.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+class ShardCoordinator:
+    """Splits the fleet between monitor workers that share one database.
+
+    Every worker renews a lease in monitor_workers every heartbeat_interval
+    seconds, and owns the devices that rendezvous hashing assigns to it among
+    the workers whose lease is live. When a worker stops, or dies and its
+    lease expires after lease_ttl seconds, the survivors take over its devices.
+
+    Devices that move to this worker are only reported after handoff_delay
+    seconds, which gives their previous owner a heartbeat to let go of them
+    and flush its writes. Devices that move away are reported right away. If
+    this worker can't renew its own lease for lease_ttl seconds, it gives up
+    all its devices, since the others will have taken them over.
+    """
+
+    def __init__(self, device_ids, worker_id=None, lease_ttl=None, heartbeat_interval=None,
+                 handoff_delay=None, leases=None):
+        self.device_ids = list(device_ids)
+        self.worker_id = worker_id or os.getenv('SHARD_WORKER_ID') or f'{socket.gethostname()}-{os.getpid()}'
+        self.lease_ttl = lease_ttl or float(os.getenv('SHARD_LEASE_TTL', '30'))
+        self.heartbeat_interval = heartbeat_interval or float(
+            os.getenv('SHARD_HEARTBEAT_INTERVAL', str(self.lease_ttl / 3)))
+        if handoff_delay is None:
+            handoff_delay = float(os.getenv('SHARD_HANDOFF_DELAY', str(self.heartbeat_interval)))
+        self.handoff_delay = handoff_delay
+        self.leases = leases or WorkerLeases(self.worker_id, socket.gethostname(), self.lease_ttl)
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._workers = []  # Live workers as of the last heartbeat
+        self._owned = set()  # Devices handed to the monitor
+        self._claims = {}  # device_id -> time it was first assigned here, until handed over
+        self._renewed_at = None
+        self._stats = {'heartbeats': 0, 'failed_heartbeats': 0, 'rebalances': 0, 'gained': 0, 'lost': 0}
+
+    def start(self):
+        """Join the pool and take an initial share of the fleet; returns the owned devices.
+
+        A worker that is alone in the pool takes its devices right away; one
+        that joins running workers waits handoff_delay like any other handoff,
+        and gets its devices from changes().
+        """
+        self._heartbeat(initial=True)
+        self._thread = threading.Thread(target=self._run, name='shard-heartbeat', daemon=True)
+        self._thread.start()
+        with self._lock:
+            return set(self._owned)
+
+    def stop(self):
+        """Stop heartbeating and leave the pool"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(self.heartbeat_interval + 5)
+        try:
+            self.leases.leave()
+        except Exception as e:
+            print(f"Error leaving the worker pool: {e}")
+
+    def changes(self, now=None):
+        """Return (gained, lost) device ID sets since the previous call"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            assigned = self._assigned(now)
+            ready = {
+                device_id for device_id in assigned - self._owned
+                if now - self._claims.setdefault(device_id, now) >= self.handoff_delay
+            }
+            lost = self._owned - assigned
+            for device_id in set(self._claims) - (assigned - self._owned):
+                del self._claims[device_id]
+            for device_id in ready:
+                self._claims.pop(device_id, None)
+            self._owned = (self._owned - lost) | ready
+            if ready or lost:
+                self._stats['rebalances'] += 1
+                self._stats['gained'] += len(ready)
+                self._stats['lost'] += len(lost)
+            return ready, lost
+
+    def owned(self):
+        with self._lock:
+            return set(self._owned)
+
+    def workers(self):
+        """Live workers as of the last heartbeat"""
+        with self._lock:
+            return list(self._workers)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, workers=len(self._workers), owned=len(self._owned),
+                        claims=len(self._claims))
+
+    def _assigned(self, now):
+        # Caller holds self._lock. Without a live lease of our own, we own nothing.
+        if self._renewed_at is None or now - self._renewed_at > self.lease_ttl:
+            return set()
+        workers = set(self._workers) | {self.worker_id}
+        return {device_id for device_id in self.device_ids
+                if rendezvous_owner(device_id, workers) == self.worker_id}
+
+    def _run(self):
+        while not self._stop.wait(self.heartbeat_interval):
+            self._heartbeat()
+
+    def _heartbeat(self, initial=False):
+        sent_at = time.monotonic()
+        try:
+            workers = self.leases.heartbeat()
+        except Exception as e:
+            with self._lock:
+                self._stats['failed_heartbeats'] += 1
+            print(f"Error renewing worker lease for {self.worker_id}: {e}")
+            return
+        with self._lock:
+            self._workers = sorted(workers)
+            self._renewed_at = sent_at
+            self._stats['heartbeats'] += 1
+            if initial and self._workers == [self.worker_id]:
+                self._owned = self._assigned(sent_at)
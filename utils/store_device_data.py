@@ -12,9 +12,23 @@ load_dotenv()  # Load main .env
 load_dotenv('devices.env')  # Load devices.env
 
 from tuya.tuya_client import TuyaClient  # Updated to use tuya directory
-from database.db_utils import get_db_connection
+from tuya.async_tuya_client import AsyncTuyaClient
+from tuya.tuya_mq import TuyaMessageQueue
+from database.storage import get_storage, SqlServerStorage
+from database.write_behind import WriteBehindQueue
+from database.spool import Spool
+from database.device_cache import DeviceMetadataCache
+from database.last_state import LastStateIndex
+from database.datapoints import DatapointCodes, DatapointTracker
+from utils.scheduler import AdaptivePollScheduler
+from utils.sharding import ShardCoordinator
+from utils.pipeline import PollingPipeline
+from utils import metrics
+import asyncio
 import json
+import queue
 import time
+import logging
 
 # Get all environment variables that start with DEVICE_ID_
 DEVICE_IDS = [
@@ -25,155 +39,383 @@ DEVICE_IDS = [
 print(f"Loaded {len(DEVICE_IDS)} devices from devices.env")
 print("Device IDs:", DEVICE_IDS)  # Debug print to see loaded devices
 
+def extract_status(device_data):
+    """Return every datapoint of a device info payload as {code: value}"""
+    status_list = device_data.get('status', [])
+    return {item.get('code'): item.get('value') for item in status_list}
+
+def extract_switch_state(device_data):
+    """Return the switch_1 state (1/0) from a device info payload"""
+    # Extract only switch_1 state
+    return 1 if extract_status(device_data).get('switch_1') == True else 0
+
 def get_current_status(client, device_id):
     """Get current device status and return switch states"""
     try:
-        device_info = client.get_device_info(device_id)
+        device_info = client.get_device_info(device_id, use_cache=False)
         if device_info.get('success'):
             device_data = device_info['result']
-            status_list = device_data.get('status', [])
-            status_dict = {item.get('code'): item.get('value') for item in status_list}
-            
-            # Extract only switch_1 state
-            switch_state = 1 if status_dict.get('switch_1') == True else 0
-            return device_data, switch_state
+            return device_data, extract_switch_state(device_data)
     except Exception as e:
         print(f"Error getting device status for device {device_id}: {e}")
     return None, None
 
-def get_last_stored_status(device_id):
-    """Get the last stored switch state from database"""
+def get_current_statuses(client, device_ids):
+    """Get current status for many devices using batched API calls.
+    
+    Returns a dict of device_id -> (device_data, switch_state); devices that
+    could not be fetched map to (None, None).
+    """
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT TOP 1 switch_1, timestamp
-            FROM device_status 
-            WHERE device_id = ?
-            ORDER BY timestamp DESC
-        ''', (device_id,))
-        
-        result = cursor.fetchone()
-        if result:
-            return {
-                'switch_1': result[0],
-                'timestamp': result[1]
-            }
+        devices = client.get_devices_info(device_ids)
     except Exception as e:
-        print(f"Error getting last stored status for device {device_id}: {e}")
-    finally:
-        if 'conn' in locals():
-            conn.close()
-    return None
+        print(f"Error getting batched device status: {e}")
+        metrics.ERRORS.labels('fetch').inc()
+        devices = {}
+    
+    return _build_statuses(device_ids, devices)
 
-def store_device_data(interval=5):
+async def get_current_statuses_async(client, device_ids):
+    """Async variant of get_current_statuses; all batches are fetched concurrently"""
     try:
-        client = TuyaClient.get_client()
+        devices = await client.get_devices_info(device_ids)
+    except Exception as e:
+        print(f"Error getting batched device status: {e}")
+        metrics.ERRORS.labels('fetch').inc()
+        devices = {}
+    return _build_statuses(device_ids, devices)
+
+def _build_statuses(device_ids, devices):
+    statuses = {}
+    for device_id in device_ids:
+        device_data = devices.get(device_id)
+        if device_data is None:
+            statuses[device_id] = (None, None)
+        else:
+            statuses[device_id] = (device_data, extract_switch_state(device_data))
+    return statuses
+
+def record_changes(writer, last_states, datapoints, device_id, device_data, status, timestamp):
+    """Queue the switch_1 and datapoint changes in status; returns True if anything changed.
+    
+    status may be partial, as in pushed events that only carry the reported
+    datapoints; switch_1 is then only compared when it is present.
+    """
+    changed_datapoints = datapoints.diff(device_id, status)
+    
+    # Only proceed if status has changed from last stored status
+    current_state = None
+    switch_changed = False
+    if 'switch_1' in status or device_data is not None:
+        current_state = 1 if status.get('switch_1') == True else 0
+        last_state = last_states.get(device_id)
+        switch_changed = current_state != last_state
+        if switch_changed:
+            print(f"\nSwitch 1 state change detected for device {device_id}!")
+            print(f"Previous state in DB: {'ON' if last_state == 1 else 'OFF'}")
+            print(f"Current state: {'ON' if current_state == 1 else 'OFF'}")
+    
+    if not (switch_changed or changed_datapoints):
+        return False
+    metrics.CHANGES.inc()
+    
+    # Persisted in bulk by the write-behind queue
+    try:
+        writer.enqueue(
+            device_data, device_id, timestamp,
+            current_state if switch_changed else None,
+            datapoints.rows(device_id, timestamp, changed_datapoints)
+        )
+        if switch_changed:
+            last_states.update(device_id, current_state, timestamp)
+        datapoints.record(device_id, changed_datapoints)
+    except Exception as e:
+        # Not recorded, so the change is detected again on the next poll
+        print(f"Error queueing data for device {device_id}: {e}")
+        metrics.ERRORS.labels('record').inc()
+        return False
+    return True
+
+def pushed_events(events, timeout):
+    """Yield events from the push queue until timeout seconds have passed"""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            yield events.get(timeout=max(0, deadline - time.monotonic()))
+        except queue.Empty:
+            return
+
+def apply_shard_changes(coordinator, scheduler, monitored, writer, last_states, datapoints, rebalance):
+    """Start and stop monitoring the devices that moved to or away from this worker.
+
+    rebalance holds the 'gained' and 'lost' devices not applied yet: a
+    rebalance is only applied once our writes are committed and the stored
+    states reloaded, and is retried every heartbeat until the database allows.
+    """
+    gained, lost = coordinator.changes()
+    # A device gained and lost again before we started it needs nothing
+    rebalance['lost'] |= lost - rebalance['gained']
+    rebalance['gained'] = (rebalance['gained'] - lost) | gained
+    gained, lost = rebalance['gained'], rebalance['lost']
+    if not (gained or lost) or time.monotonic() < rebalance['retry_at']:
+        return
+    rebalance['retry_at'] = time.monotonic() + coordinator.heartbeat_interval
+    # Commit our writes, so the new owner of a lost device starts from them and
+    # the stored state of a gained device includes its previous owner's writes
+    if not writer.flush():
+        print(f"\nRebalance of +{len(gained)} -{len(lost)} devices postponed: our writes aren't committed")
+        return
+    if gained:
+        try:
+            last_states.load()
+            datapoints.load()
+        except Exception as e:
+            print(f"\nRebalance of +{len(gained)} -{len(lost)} devices postponed: "
+                  f"error loading stored states: {e}")
+            metrics.ERRORS.labels('rebalance').inc()
+            return
+    for device_id in lost:
+        scheduler.remove(device_id)
+    monitored -= lost
+    for device_id in gained:
+        scheduler.add(device_id)
+    monitored |= gained
+    rebalance.update(gained=set(), lost=set(), retry_at=0.0)
+    print(f"\nRebalanced: +{len(gained)} -{len(lost)} devices, now monitoring {len(monitored)} "
+          f"of {len(DEVICE_IDS)} with {len(coordinator.workers())} workers")
+
+def store_device_data(interval=5, use_async=False, use_push=False, sharded=False, use_pipeline=False):
+    """Monitor all devices and store switch_1 and other datapoint changes.
+    
+    Devices are polled by an AdaptivePollScheduler: every `interval` seconds
+    while they change, backing off towards POLL_MAX_INTERVAL while they
+    don't. With use_async=True the sweep uses AsyncTuyaClient, so all API
+    batches are in flight at once and sweep time is bounded by the slowest
+    request.
+    
+    With use_push=True changes arrive from the Tuya message queue as they
+    happen, and every device is only polled every TUYA_RECONCILE_INTERVAL
+    seconds to catch anything the stream missed.
+    
+    With sharded=True several monitors share the fleet: each worker owns the
+    devices a ShardCoordinator assigns to it, and they rebalance when a worker
+    starts, stops or dies.
+    
+    With use_pipeline=True fetching, change detection and writing run as
+    separate stages of a PollingPipeline, with fetching on a thread or
+    process pool (PIPELINE_FETCH_MODE).
+    """
+    loop = None
+    client = None
+    writer = None
+    mq = None
+    coordinator = None
+    pipeline = None
+    metrics_server = None
+    try:
+        # Prometheus-style /metrics on METRICS_PORT, if set
+        metrics_server = metrics.start_metrics_server()
+        if metrics_server is not None:
+            print(f"Serving metrics on port {metrics_server.server_port}")
+        
+        if sharded and not isinstance(get_storage(), SqlServerStorage):
+            # Shard leases live in SQL Server
+            print("Sharding needs the SQL Server storage backend; monitoring every device")
+            sharded = False
+        if sharded and use_push:
+            # The message queue has a single active consumer, which can't split events by owner
+            print("Push ingestion can't be sharded; polling instead")
+            use_push = False
+        device_ids = DEVICE_IDS
+        if sharded:
+            coordinator = ShardCoordinator(DEVICE_IDS)
+            device_ids = sorted(coordinator.start())
+            print(f"Worker {coordinator.worker_id} owns {len(device_ids)} of {len(DEVICE_IDS)} devices "
+                  f"({len(coordinator.workers())} live workers)")
+        
+        if use_async and use_pipeline:
+            print("The pipeline fetches with thread or process pools; ignoring TUYA_ASYNC")
+            use_async = False
+        if use_async:
+            loop = asyncio.new_event_loop()
+            client = AsyncTuyaClient()
+        else:
+            client = TuyaClient.get_client()
+        
+        # Skip the devices MERGE when metadata is unchanged
+        device_cache = DeviceMetadataCache()
+        # The monitor also starts while the database is down: stored state then comes from
+        # the spool, and the writer retries until the database is back
+        database_down = False
+        try:
+            print(f"Loaded metadata fingerprints for {device_cache.load()} devices")
+        except Exception as e:
+            print(f"Error loading device metadata, upserting every device: {e}")
+            database_down = True
+        # With SPOOL_DIR set, changes are kept on disk until the database has committed them
+        spool = Spool() if os.getenv('SPOOL_DIR') else None
+        if spool is not None:
+            print(f"Spooling changes to {spool.directory} ({spool.qsize()} left from the last run)")
+        # Shared with the writer, which turns datapoint codes into ids as it flushes
+        codes = DatapointCodes()
+        # Workers may briefly overlap while devices change hands, so sharded writers guard their inserts
+        writer = WriteBehindQueue(device_cache=device_cache, guarded_inserts=True if sharded else None,
+                                  spool=spool, codes=codes)
+        metrics.WRITE_QUEUE.set_function(lambda: sum(writer.stats()[key] for key in ('queued', 'pending')))
         
-        # Dictionary to store last known states for each device
-        last_stored_states = {}
+        # Last stored state of every device, kept in sync with our own writes
+        last_states = LastStateIndex()
+        datapoints = DatapointTracker(codes=codes)
         
-        print(f"Starting device monitoring (checking every {interval} seconds)...")
-        print(f"Monitoring {len(DEVICE_IDS)} devices...")
+        events = None
+        if use_push:
+            reconcile_interval = float(os.getenv('TUYA_RECONCILE_INTERVAL', '300'))
+            scheduler = AdaptivePollScheduler(device_ids, min_interval=reconcile_interval,
+                                              max_interval=reconcile_interval, backoff=1.0,
+                                              batch_size=TuyaClient.DEVICE_BATCH_SIZE)
+            events = queue.Queue()
+            mq = TuyaMessageQueue(handler=events.put)
+            mq.start()
+            print(f"Starting device monitoring (push, reconciling every {reconcile_interval:g} seconds)...")
+        else:
+            scheduler = AdaptivePollScheduler(device_ids, min_interval=interval,
+                                              batch_size=TuyaClient.DEVICE_BATCH_SIZE)
+            print(f"Starting device monitoring (checking every {interval} to "
+                  f"{scheduler.max_interval:g} seconds)...")
+        monitored = set(device_ids)
+        rebalance = {'gained': set(), 'lost': set(), 'retry_at': 0.0}
+        print(f"Monitoring {len(device_ids)} devices...")
         print("Press Ctrl+C to stop")
         
-        # Initialize last stored states for all devices
-        for device_id in DEVICE_IDS:
-            last_stored = get_last_stored_status(device_id)
-            last_stored_states[device_id] = last_stored['switch_1'] if last_stored else None
+        # Initialize last stored states for all devices in one query
+        # Spooled changes aren't in the database yet; read them first, so none is missed if
+        # the writer commits some in between
+        pending = [] if spool is None else spool.pending_items()
+        spooled = [status for _, status, _ in pending if status]
+        spooled_datapoints = [row for _, _, rows in pending for row in rows]
+        try:
+            print(f"Loaded last stored state for {last_states.load(pending=spooled)} devices")
+            print(f"Loaded {datapoints.load(pending=spooled_datapoints)} stored datapoint values")
+        except Exception as e:
+            print(f"Error loading stored states, starting from {len(pending)} spooled changes: {e}")
+            last_states.seed(spooled)
+            datapoints.seed(spooled_datapoints)
+            database_down = True
+        if database_down:
+            # The stored states are unknown, so a change may already be stored
+            writer.guarded_inserts = True
+        
+        if use_pipeline:
+            pipeline = PollingPipeline(client, lambda device_id, device_data: record_changes(
+                writer, last_states, datapoints, device_id, device_data,
+                extract_status(device_data), int(time.time())
+            ))
+            print(f"Polling pipeline: {pipeline.fetch_workers} fetch {pipeline.mode}s, "
+                  f"{pipeline.diff_workers} diff threads")
         
         while True:
-            for device_id in DEVICE_IDS:
-                device_data, current_state = get_current_status(client, device_id)
+            next_due = scheduler.next_due_time()
+            wait = interval if next_due is None else max(0, next_due - time.monotonic())
+            if coordinator is not None:
+                wait = min(wait, coordinator.heartbeat_interval)
+            if pipeline is not None and events is None:
+                # Sleep until the next device is due, rescheduling polls as they finish
+                for device_id, changed, ok in pipeline.completed(wait):
+                    scheduler.record(device_id, changed=changed, ok=ok)
+            elif events is None:
+                time.sleep(wait)
+            else:
+                for event in pushed_events(events, wait):
+                    if event.device_id not in monitored:
+                        continue
+                    if event.kind != 'status' or event.device_id not in device_cache:
+                        # Online/offline changes and devices without a stored row need the full payload
+                        scheduler.add(event.device_id)
+                        break
+                    if record_changes(writer, last_states, datapoints, event.device_id,
+                                      None, event.status, event.timestamp):
+                        print(f"\nPushed change stored for device {event.device_id}")
+            if coordinator is not None:
+                apply_shard_changes(coordinator, scheduler, monitored, writer, last_states, datapoints,
+                                    rebalance)
+            if pipeline is not None:
+                for device_id, changed, ok in pipeline.completed():
+                    scheduler.record(device_id, changed=changed, ok=ok)
+            due_ids = scheduler.due()
+            if not due_ids:
+                continue
+            
+            if pipeline is not None:
+                pipeline.submit(due_ids)
+                continue
+            
+            # One request per DEVICE_BATCH_SIZE devices instead of one per device
+            sweep_started = time.perf_counter()
+            if use_async:
+                current_statuses = loop.run_until_complete(
+                    get_current_statuses_async(client, due_ids)
+                )
+            else:
+                current_statuses = get_current_statuses(client, due_ids)
+            
+            for device_id in due_ids:
+                device_data, _ = current_statuses[device_id]
                 
                 if device_data is None:
                     print(f"\nFailed to get status for device {device_id}, skipping...")
+                    metrics.POLLS.labels('failed').inc()
+                    scheduler.record(device_id, changed=False, ok=False)
                     continue
                 
-                # Only proceed if status has changed from last stored status
-                if current_state != last_stored_states[device_id]:
-                    print(f"\nSwitch 1 state change detected for device {device_id}!")
-                    print(f"Previous state in DB: {'ON' if last_stored_states[device_id] == 1 else 'OFF'}")
-                    print(f"Current state from API: {'ON' if current_state == 1 else 'OFF'}")
-                    
-                    # Connect to database
-                    conn = get_db_connection()
-                    cursor = conn.cursor()
-                    
-                    try:
-                        # First, verify again that the status hasn't changed in the DB
-                        latest_status = get_last_stored_status(device_id)
-                        if latest_status and latest_status['switch_1'] == current_state:
-                            print(f"Status already updated in database for device {device_id}, skipping...")
-                            last_stored_states[device_id] = current_state
-                            continue
-                        
-                        # Update or insert device information
-                        cursor.execute('''
-                        MERGE devices AS target
-                        USING (VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)) AS source 
-                        (device_id, name, category, online, active_time, create_time, update_time, ip, model, time_zone)
-                        ON target.device_id = source.device_id
-                        WHEN MATCHED THEN
-                            UPDATE SET 
-                                name = source.name,
-                                category = source.category,
-                                online = source.online,
-                                active_time = source.active_time,
-                                create_time = source.create_time,
-                                update_time = source.update_time,
-                                ip = source.ip,
-                                model = source.model,
-                                time_zone = source.time_zone
-                        WHEN NOT MATCHED THEN
-                            INSERT (device_id, name, category, online, active_time, create_time, update_time, ip, model, time_zone)
-                            VALUES (source.device_id, source.name, source.category, source.online, source.active_time, 
-                                    source.create_time, source.update_time, source.ip, source.model, source.time_zone);
-                        ''', (
-                            device_data.get('id'),
-                            device_data.get('name'),
-                            device_data.get('category'),
-                            device_data.get('online'),
-                            device_data.get('active_time'),
-                            device_data.get('create_time'),
-                            device_data.get('update_time'),
-                            device_data.get('ip'),
-                            device_data.get('model'),
-                            device_data.get('time_zone')
-                        ))
-                        
-                        # Store new device status
-                        cursor.execute('''
-                        INSERT INTO device_status (device_id, timestamp, switch_1)
-                        VALUES (?, ?, ?)
-                        ''', (
-                            device_id,
-                            int(time.time()),
-                            current_state
-                        ))
-                        
-                        conn.commit()
-                        print(f"New status stored successfully for device {device_id}!")
-                        last_stored_states[device_id] = current_state
-                        
-                    except Exception as e:
-                        print(f"Error storing data for device {device_id}: {e}")
-                        conn.rollback()
-                    finally:
-                        conn.close()
-                else:
+                changed = record_changes(writer, last_states, datapoints, device_id,
+                                         device_data, extract_status(device_data), int(time.time()))
+                if not changed:
                     print(".", end="", flush=True)  # Progress indicator
-            
-            time.sleep(interval)
+                
+                metrics.POLLS.labels('changed' if changed else 'unchanged').inc()
+                scheduler.record(device_id, changed=changed, ok=device_data.get('online', True))
+            metrics.SWEEP_TIME.observe(time.perf_counter() - sweep_started)
             
     except KeyboardInterrupt:
         print("\nMonitoring stopped by user")
     except Exception as e:
         print(f"\nError: {e}")
     finally:
-        if 'conn' in locals():
-            conn.close()
+        if pipeline is not None:
+            pipeline.close()
+            print(f"Pipeline stats: {pipeline.stats()}")
+        if writer is not None:
+            writer.flush()  # Before leaving the pool, so the next owner sees our writes
+        if coordinator is not None:
+            coordinator.stop()
+            print(f"Shard stats: {coordinator.stats()}")
+        if mq is not None:
+            mq.stop()
+            print(f"Message queue stats: {mq.stats()}")
+        if writer is not None:
+            writer.close()
+            print(f"Write-behind stats: {writer.stats()}")
+            print(f"Device metadata cache stats: {writer.device_cache.stats()}")
+            if writer.spool is not None:
+                print(f"Spool stats: {writer.spool.stats()}")
+        if client is not None:
+            print(f"API rate limit stats: {client.rate_limiter.stats()}")
+        if loop is not None:
+            loop.run_until_complete(client.close())
+            loop.close()
+        if metrics_server is not None:
+            metrics_server.shutdown()
+        get_storage().close()
+        if isinstance(get_storage(), SqlServerStorage):
+            from database.db_utils import get_pool  # Not at the top: the SQLite backend runs without pyodbc
+            get_pool().close()
 
 if __name__ == "__main__":
-    store_device_data(interval=5)  # Check every 5 seconds
\ No newline at end of file
+    logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO').upper())
+    store_device_data(
+        interval=5,  # Check every 5 seconds
+        use_async=os.getenv('TUYA_ASYNC', '').lower() in ('1', 'true', 'yes'),
+        use_push=os.getenv('TUYA_PUSH', '').lower() in ('1', 'true', 'yes'),
+        sharded=os.getenv('MONITOR_SHARDED', '').lower() in ('1', 'true', 'yes'),
+        use_pipeline=os.getenv('MONITOR_PIPELINE', '').lower() in ('1', 'true', 'yes')
+    )